@@ -1,11 +1,54 @@
-from PIL import Image, ImageDraw, ImageFont
+import functools
+import os
 from datetime import datetime
 
+from PIL import Image, ImageDraw, ImageFont
+
+from image_output import postprocess
+from tracing import traced
+
+# フォント：UCAR_FONT_PATH → Arial → DejaVu Sans の順に探し、(family, size) ごとに1回だけ読む
+FONT_PATH = os.getenv("UCAR_FONT_PATH")
+FONT_FALLBACKS = (
+    "arial.ttf",
+    "DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+# 配色
+PANEL_FILL = (17, 24, 39, 200)  # dark panel
+TEXT_COLOR = (255, 255, 255, 255)
+
+
+def _side_colors(side: str):
+    """(リボン色, アクセント色)"""
+    if side == "buy":
+        return (14, 160, 90, 220), (14, 160, 90, 255)
+    return (220, 38, 38, 220), (220, 38, 38, 255)
 
-def _font(size=18):
+
+@functools.lru_cache(maxsize=8)
+def _font_path(family: str | None) -> str | None:
+    # truetype() は見つからないとフォントディレクトリを総なめするので結果を覚えておく
+    for name in (family, FONT_PATH, *FONT_FALLBACKS):
+        if not name:
+            continue
+        try:
+            ImageFont.truetype(name, 12)
+            return name
+        except OSError:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=64)
+def _font(size=18, family: str | None = None):
+    path = _font_path(family)
+    if path is not None:
+        return ImageFont.truetype(path, size)
     try:
-        return ImageFont.truetype("arial.ttf", size)
-    except:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # 古い Pillow はビットマップ既定フォントのみ
         return ImageFont.load_default()
 
 
@@ -15,62 +58,120 @@ def _rounded_box(draw, xy, radius, fill):
     draw.rounded_rectangle(xy, radius=r, fill=fill)
 
 
-def annotate_quiet_trap(
-    png_path: str,
+def _panel_box(W: int, H: int):
+    pad = 16
+    w_panel, h_panel = int(W * 0.28), int(H * 0.20)
+    return W - w_panel - pad, pad, W - pad, pad + h_panel
+
+
+@functools.lru_cache(maxsize=16)
+def _static_layer(W: int, H: int, side: str) -> Image.Image:
+    """(W, H, side) ごとに変わらない部分（パネル・見出し・リボン）を描いた透明レイヤ。
+    返り値は共有されるので呼び出し側で書き換えないこと。"""
+    layer = Image.new("RGBA", (W, H), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer, "RGBA")
+    color, accent = _side_colors(side)
+
+    # タイトルパネル（右上）
+    x0, y0, x1, y1 = _panel_box(W, H)
+    _rounded_box(draw, (x0, y0, x1, y1), 16, PANEL_FILL)
+    draw.text((x0 + 14, y0 + 12), "QuietTrap", fill=accent, font=_font(20))
+
+    # 方向リボン（左上）
+    ribbon_h = 36
+    draw.rectangle([(0, 0), (int(W * 0.22), ribbon_h)], fill=color)
+    draw.text((10, 8), f"{side.upper()} TRAP", fill=TEXT_COLOR, font=_font(18))
+    return layer
+
+
+def render_quiet_trap(
+    png: bytes | memoryview,
     side: str,
     score: float,
     notes: list[str] | None = None,
     footer: str | None = None,
-) -> str:
+) -> bytes:
     """
-    PNGにQuietTrap注釈を焼き込み。side: 'buy'|'sell'。score: 0.0-1.0。
-    returns: 出力パス（上書き）
+    PNG(bytes)にQuietTrap注釈を焼き込んだPNG(bytes)を返す。ディスクには触らない。
+    side: 'buy'|'sell'。score: 0.0-1.0。
     """
+    data, _ = postprocess(png, None, quiet_trap_overlay(side, score, notes, footer))
+    return data
+
+
+def annotate_image(
+    im: Image.Image,
+    side: str,
+    score: float,
+    notes: list[str] | None = None,
+    footer: str | None = None,
+) -> Image.Image:
+    """デコード済みの画像に注釈を焼き込んで返す（RGBA）。
+    静的な部分はキャッシュ済みレイヤを合成し、スコア/ノート/フッタだけを毎回描く。"""
     notes = notes or []
-    im = Image.open(png_path).convert("RGBA")
+    im = im.convert("RGBA")
     W, H = im.size
+    im.alpha_composite(_static_layer(W, H, side))
     draw = ImageDraw.Draw(im, "RGBA")
 
-    # 配色
-    color = (14, 160, 90, 220) if side == "buy" else (220, 38, 38, 220)
-    accent = (14, 160, 90, 255) if side == "buy" else (220, 38, 38, 255)
-    panel_fill = (17, 24, 39, 200)  # dark panel
-    text_color = (255, 255, 255, 255)
-
-    # タイトルパネル（右上）
-    pad = 16
-    w_panel, h_panel = int(W * 0.28), int(H * 0.20)
-    x0, y0 = W - w_panel - pad, pad
-    x1, y1 = W - pad, pad + h_panel
-    _rounded_box(draw, (x0, y0, x1, y1), 16, panel_fill)
-
-    # 見出し
-    f1 = _font(20)
-    f2 = _font(18)
-    title = "QuietTrap"
+    # 見出し（スコア）
+    x0, y0, _, _ = _panel_box(W, H)
     sub = f"Side: {side.upper()}   Score: {score:.2f}"
-    draw.text((x0 + 14, y0 + 12), title, fill=accent, font=f1)
-    draw.text((x0 + 14, y0 + 40), sub, fill=text_color, font=f2)
+    draw.text((x0 + 14, y0 + 40), sub, fill=TEXT_COLOR, font=_font(18))
 
     # ノート列
     y = y0 + 70
+    note_font = _font(16)
     for n in notes:
-        draw.text((x0 + 14, y), f"• {n}", fill=text_color, font=_font(16))
+        draw.text((x0 + 14, y), f"• {n}", fill=TEXT_COLOR, font=note_font)
         y += 20
 
-    # 方向リボン（左上）
-    ribbon_h = 36
-    draw.rectangle([(0, 0), (int(W * 0.22), ribbon_h)], fill=color)
-    draw.text(
-        (10, 8), f"{side.upper()} TRAP", fill=(255, 255, 255, 255), font=_font(18)
-    )
-
     # フッタ（右下、タイムスタンプ）
     footer = footer or datetime.utcnow().strftime("UTC %Y-%m-%d %H:%M:%S")
-    tw, th = draw.textlength(footer, font=_font(14)), 18
+    f_footer = _font(14)
+    tw, th = draw.textlength(footer, font=f_footer), 18
     fx1, fy1 = W - int(tw) - 24, H - th - 16
     _rounded_box(draw, (fx1 - 10, fy1 - 6, W - 10, H - 10), 10, (0, 0, 0, 120))
-    draw.text((fx1, fy1), footer, fill=(255, 255, 255, 200), font=_font(14))
+    draw.text((fx1, fy1), footer, fill=(255, 255, 255, 200), font=f_footer)
+    return im
+
 
-    im.save(png_path)
-    return png_path
+def quiet_trap_overlay(side="sell", score=0.0, notes=None, footer=None):
+    """image_output.postprocess() に渡す overlay（プロセスプールへ渡せるよう partial で作る）。"""
+    return functools.partial(
+        annotate_image, side=side, score=float(score), notes=notes, footer=footer
+    )
+
+
+def overlay_from_annotate(annotate: dict | None):
+    """capture_chart の annotate 引数（{"quiet_trap": {...}}）→ overlay。無ければ None。"""
+    if not annotate or not annotate.get("quiet_trap"):
+        return None
+    qt = annotate["quiet_trap"]
+    return quiet_trap_overlay(
+        qt.get("side", "sell"),
+        qt.get("score", 0.0),
+        qt.get("notes", []),
+        qt.get("footer"),
+    )
+
+
+@traced()
+def annotate_quiet_trap(
+    png: str | bytes | memoryview,
+    side: str,
+    score: float,
+    notes: list[str] | None = None,
+    footer: str | None = None,
+) -> str | bytes:
+    """
+    PNGにQuietTrap注釈を焼き込み。side: 'buy'|'sell'。score: 0.0-1.0。
+    png がパスなら上書きしてパスを返し、bytes/memoryview なら注釈済みPNGの bytes を返す。
+    """
+    if isinstance(png, (bytes, bytearray, memoryview)):
+        return render_quiet_trap(png, side, score, notes, footer)
+    with open(png, "rb") as f:
+        data = render_quiet_trap(f.read(), side, score, notes, footer)
+    with open(png, "wb") as f:
+        f.write(data)
+    return png
@@ -0,0 +1,129 @@
+"""価格 ⇔ ピクセル(y) の変換モデル。
+
+価格軸ラベルから y = a * f(price) + b（f は恒等 or log）を最小二乗で当てはめ、
+ページごとにキャッシュする。表示レンジが変わると軸ラベルのハッシュが変わるので、
+その時だけ作り直す。price_to_y / y_to_price は NumPy でベクトル化しており、
+float を渡せば float、配列（リスト可）を渡せば ndarray を返す。
+"""
+
+import weakref
+
+import numpy as np
+
+from chart_snapshot import axis_hash, take_snapshot
+
+# page -> AxisModel（ページが閉じられたら自動で消える）
+_CACHE: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+class AxisModel:
+    """y = a * f(price) + b。log=True なら f = ln。"""
+
+    def __init__(
+        self,
+        a: float,
+        b: float,
+        log: bool = False,
+        axis_hash=None,
+        approximate: bool = False,
+        residual: float = 0.0,
+    ):
+        self.a = float(a)
+        self.b = float(b)
+        self.log = log
+        self.axis_hash = axis_hash
+        # 軸ラベルが取れず、要求レンジから仮に作ったモデルなら True
+        self.approximate = approximate
+        self.residual = residual
+
+    # ---- 構築 ----
+    @classmethod
+    def fit(cls, pts, log: bool | None = None, axis_hash=None) -> "AxisModel":
+        """pts=[(price, y), ...] から当てはめ。log=None なら残差の小さい方を自動選択。"""
+        if len(pts) < 2:
+            raise ValueError("need at least 2 axis labels")
+        if log is None:
+            lin = cls._fit(pts, False)
+            # 2点だと両方完全一致するので線形を既定とする
+            if len(pts) >= 3 and all(p > 0 for p, _ in pts):
+                lg = cls._fit(pts, True)
+                if lg[2] < lin[2] * 0.5:
+                    a, b, res = lg
+                    return cls(a, b, log=True, axis_hash=axis_hash, residual=res)
+            a, b, res = lin
+            return cls(a, b, log=False, axis_hash=axis_hash, residual=res)
+        a, b, res = cls._fit(pts, log)
+        return cls(a, b, log=log, axis_hash=axis_hash, residual=res)
+
+    @staticmethod
+    def _fit(pts, log: bool):
+        arr = np.asarray(pts, dtype=float)
+        xs = np.log(arr[:, 0]) if log else arr[:, 0]
+        ys = arr[:, 1]
+        P = np.column_stack([xs, np.ones(len(xs))])
+        (a, b), *_ = np.linalg.lstsq(P, ys, rcond=None)
+        res = np.mean((a * xs + b - ys) ** 2)
+        return float(a), float(b), float(res)
+
+    @classmethod
+    def from_range(
+        cls, high: float, low: float, box: dict, top: float = 0.2, bottom: float = 0.8
+    ) -> "AxisModel":
+        """軸ラベルが取れない時の仮モデル：high/low をプロット領域の top/bottom 比率に置く。"""
+        y_hi = box["y"] + box["height"] * top
+        y_lo = box["y"] + box["height"] * bottom
+        if high == low:
+            return cls(0.0, (y_hi + y_lo) / 2.0, approximate=True)
+        a = (y_lo - y_hi) / (low - high)
+        return cls(a, y_hi - a * high, approximate=True)
+
+    # ---- 変換 ----
+    def price_to_y(self, price):
+        p = np.asarray(price, dtype=float)
+        y = self.a * (np.log(p) if self.log else p) + self.b
+        return float(y) if y.ndim == 0 else y
+
+    def y_to_price(self, y):
+        if self.a == 0:
+            raise ZeroDivisionError("degenerate axis model")
+        x = (np.asarray(y, dtype=float) - self.b) / self.a
+        price = np.exp(x) if self.log else x
+        return float(price) if price.ndim == 0 else price
+
+    def to_dict(self) -> dict:
+        return {
+            "a": self.a,
+            "b": self.b,
+            "log": self.log,
+            "approximate": self.approximate,
+            "residual": self.residual,
+        }
+
+
+async def get_axis_model(page, log: bool | None = None) -> AxisModel | None:
+    """ページの軸モデルを返す（軸ラベルのハッシュが同じならキャッシュを再利用）。
+    ラベルが2つ未満しか取れなければ None。"""
+    h = await axis_hash(page)
+    cached = _CACHE.get(page)
+    if h is not None and cached is not None and cached.axis_hash == h:
+        if log is None or cached.log == log:
+            return cached
+
+    snap = await take_snapshot(page)
+    pts = [
+        (float(lab["value"]), lab["y"] + lab["height"] / 2.0)
+        for lab in snap["price_axis"]
+    ]
+    if log:
+        pts = [(p, y) for p, y in pts if p > 0]
+    if len(pts) < 2:
+        _CACHE.pop(page, None)
+        return None
+    model = AxisModel.fit(pts, log=log, axis_hash=h)
+    _CACHE[page] = model
+    return model
+
+
+def invalidate(page):
+    """明示的にキャッシュを捨てる（スクロール/ズーム操作の直後など）。"""
+    _CACHE.pop(page, None)
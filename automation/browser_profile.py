@@ -0,0 +1,238 @@
+"""永続プロファイル（launch_persistent_context）で Chromium の HTTP キャッシュを使い回す（opt-in）。
+
+    browser = await launch_browser(pw, headless=True)   # Browser 互換
+    ctx = await browser.new_context(viewport=...)        # 共有プロファイル上の軽い context
+    ...
+    await ctx.close()                                    # 自分のページだけ閉じる
+
+UCAR_PROFILE_DIR を設定した時だけ有効。TradingView の数MBのバンドルがディスクキャッシュから
+読まれるので、コールドな open_chart がウォームキャッシュのヒットになる。
+
+- キャッシュ上限：--disk-cache-size（UCAR_PROFILE_CACHE_MB）。Code Cache / GPUCache /
+  Service Worker などは起動前と終了時に UCAR_PROFILE_PRUNE_H 時間ごとに刈り込む。
+- ロック：<profile>/.ucar.lock を OS のファイルロックで握る。別プロセスが使用中なら
+  プロファイルは使わず従来の chromium.launch() にフォールバックする（プロファイルを壊さない）。
+- route() を張ると HTTP キャッシュが無効になるため、この context では net_policy の route を使わず
+  起動引数 --host-resolver-rules でホスト単位の遮断だけ行う。
+"""
+
+import os
+import shutil
+import time
+from pathlib import Path
+
+from net_policy import block_categories, resolver_rules
+
+PROFILE_DIR = os.getenv("UCAR_PROFILE_DIR") or None
+PROFILE_CACHE_MB = float(os.getenv("UCAR_PROFILE_CACHE_MB", "512"))
+PRUNE_INTERVAL_H = float(os.getenv("UCAR_PROFILE_PRUNE_H", "24"))
+
+# 上限を超えたら丸ごと消してよい（Chromium が作り直す）キャッシュ類
+PRUNABLE = [
+    "Default/Code Cache",
+    "Default/GPUCache",
+    "Default/Service Worker/CacheStorage",
+    "Default/Service Worker/ScriptCache",
+    "GrShaderCache",
+    "ShaderCache",
+]
+HTTP_CACHE = "Default/Cache"
+LOCK_NAME = ".ucar.lock"
+PRUNE_STAMP = ".ucar.pruned"
+
+
+class ProfileLock:
+    """プロファイル1つにつき1プロセス。プロセスが落ちれば OS が解放する。"""
+
+    def __init__(self, root: Path):
+        self.path = Path(root) / LOCK_NAME
+        self._f = None
+
+    def acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._f = f
+        return True
+
+    def release(self):
+        if self._f is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+
+                self._f.seek(0)
+                msvcrt.locking(self._f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+        self._f.close()
+        self._f = None
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def prune_profile(root: Path, max_bytes: int, force: bool = False) -> int:
+    """ロックを握った状態（Chromium 停止中）で呼ぶ。消したバイト数を返す。
+    HTTP キャッシュは --disk-cache-size で Chromium 自身が抑えるので、それ以外の
+    キャッシュ類の合計が上限を超えたら大きい順に消す。"""
+    root = Path(root)
+    stamp = root / PRUNE_STAMP
+    if not force and stamp.exists():
+        if time.time() - stamp.stat().st_mtime < PRUNE_INTERVAL_H * 3600:
+            return 0
+    sizes = [(_dir_size(root / d), root / d) for d in PRUNABLE if (root / d).exists()]
+    total = sum(s for s, _ in sizes) + _dir_size(root / HTTP_CACHE)
+    freed = 0
+    for size, path in sorted(sizes, key=lambda x: x[0], reverse=True):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        freed += size
+    stamp.touch()
+    if freed:
+        print(f"[profile] pruned {freed // (1024 * 1024)}MB from {root}")
+    return freed
+
+
+class ProfileContext:
+    """共有の永続 context 上の「context」。ページを自分の分だけ持ち、close() でそれだけ閉じる。
+    route / add_init_script などそれ以外の属性は共有 context に委ねる。"""
+
+    uses_http_cache = True
+
+    def __init__(self, owner: "ProfileBrowser", viewport: dict | None = None):
+        self._owner = owner
+        self._viewport = viewport
+        self._pages = []
+
+    async def new_page(self):
+        page = await self._owner.context.new_page()
+        if self._viewport:
+            await page.set_viewport_size(self._viewport)
+        self._pages.append(page)
+        return page
+
+    @property
+    def pages(self):
+        return [p for p in self._pages if not p.is_closed()]
+
+    async def add_init_script(self, script=None, **kwargs):
+        # open_chart ごとに同じスクリプトが積み重ならないよう1回だけ
+        key = script if script is not None else repr(sorted(kwargs.items()))
+        if key in self._owner.init_scripts:
+            return
+        self._owner.init_scripts.add(key)
+        await self._owner.context.add_init_script(script, **kwargs)
+
+    async def close(self):
+        for p in self._pages:
+            try:
+                await p.close()
+            except Exception:
+                pass
+        self._pages.clear()
+
+    def __getattr__(self, name):
+        return getattr(self._owner.context, name)
+
+
+class ProfileBrowser:
+    """launch_persistent_context を Browser のように見せる（new_context / is_connected / close）。"""
+
+    def __init__(self, context, lock: ProfileLock, root: Path, max_bytes: int):
+        self.context = context
+        self.init_scripts: set = set()
+        self._lock = lock
+        self._root = root
+        self._max_bytes = max_bytes
+        self._closed = False
+        self._cookies_seeded = False
+        context.on("close", lambda _: setattr(self, "_closed", True))
+
+    @classmethod
+    async def launch(
+        cls, pw, root: str, headless: bool = True, **kwargs
+    ) -> "ProfileBrowser | None":
+        """ロックが取れなければ None（呼び出し側は通常の launch にフォールバック）。"""
+        root = Path(root)
+        lock = ProfileLock(root)
+        if not lock.acquire():
+            print(f"[profile] {root} is locked by another browser; using a fresh one")
+            return None
+        max_bytes = int(PROFILE_CACHE_MB * 1024 * 1024)
+        try:
+            prune_profile(root, max_bytes)
+            args = [f"--disk-cache-size={max_bytes}"]
+            rules = resolver_rules(block_categories())
+            if rules:
+                args.append(f"--host-resolver-rules={rules}")
+            context = await pw.chromium.launch_persistent_context(
+                str(root), headless=headless, args=args, **kwargs
+            )
+        except BaseException:
+            lock.release()
+            raise
+        return cls(context, lock, root, max_bytes)
+
+    async def new_context(self, storage_state=None, viewport=None, **_):
+        """storage_state のクッキーは最初の1回だけプロファイルへ入れる（以後はプロファイルが保持）。"""
+        if storage_state and not self._cookies_seeded:
+            cookies = storage_state.get("cookies") or []
+            if cookies:
+                await self.context.add_cookies(cookies)
+        self._cookies_seeded = True
+        return ProfileContext(self, viewport)
+
+    def is_connected(self) -> bool:
+        return not self._closed
+
+    async def close(self):
+        try:
+            if not self._closed:
+                await self.context.close()
+        finally:
+            self._closed = True
+            try:
+                prune_profile(self._root, self._max_bytes)
+            finally:
+                self._lock.release()
+
+
+async def launch_browser(pw, headless: bool = True, **kwargs):
+    """UCAR_PROFILE_DIR があれば永続プロファイル、無ければ（または使用中なら）通常の Browser。"""
+    if PROFILE_DIR:
+        b = await ProfileBrowser.launch(pw, PROFILE_DIR, headless=headless, **kwargs)
+        if b is not None:
+            return b
+    return await pw.chromium.launch(headless=headless, **kwargs)
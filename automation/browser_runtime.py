@@ -0,0 +1,62 @@
+import asyncio
+import contextlib
+
+from playwright.async_api import async_playwright
+
+from browser_profile import launch_browser
+from page_pool import ChartPagePool
+from session import SESSION
+
+VIEWPORT = {"width": 1600, "height": 900}
+
+
+class BrowserRuntime:
+    """常駐モード用：Playwright と Chromium を1度だけ起動し、呼び出し間で使い回す。"""
+
+    def __init__(self):
+        self._pw = None
+        self._browsers = {}  # headless(bool) -> Browser
+        self._pools = {}  # headless(bool) -> ChartPagePool
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        if self._pw is None:
+            self._pw = await async_playwright().start()
+        return self
+
+    async def browser(self, headless: bool = True):
+        """起動済みブラウザを返す（落ちていれば再起動）。"""
+        async with self._lock:
+            await self.start()
+            b = self._browsers.get(headless)
+            if b is None or not b.is_connected():
+                b = await launch_browser(self._pw, headless=headless)
+                self._browsers[headless] = b
+            return b
+
+    async def new_context(self, headless: bool = True):
+        b = await self.browser(headless)
+        # ブラウザは常駐なので、ログインのし直しは裏で走らせてよい
+        return await SESSION.new_context(b, resident=True, viewport=VIEWPORT)
+
+    def pool(self, headless: bool = True) -> ChartPagePool:
+        """symbol/tf 済みタブのプール（headless別）。"""
+        pool = self._pools.get(headless)
+        if pool is None:
+            pool = ChartPagePool(lambda: self.new_context(headless))
+            self._pools[headless] = pool
+        return pool
+
+    async def close(self):
+        for pool in list(self._pools.values()):
+            with contextlib.suppress(Exception):
+                await pool.close()
+        self._pools.clear()
+        for b in list(self._browsers.values()):
+            with contextlib.suppress(Exception):
+                await b.close()
+        self._browsers.clear()
+        if self._pw is not None:
+            with contextlib.suppress(Exception):
+                await self._pw.stop()
+            self._pw = None
@@ -0,0 +1,136 @@
+"""チャートDOMの状態を1回の page.evaluate でまとめて取るスナップショット。
+
+要素ごとに text_content()/bounding_box() を呼ぶと1件ずつPlaywrightの往復が発生するため、
+凡例・ダイアログ内のインジ一覧・価格軸ラベル（座標つき）・開いているダイアログを
+ページ内で一括収集して1つのJSONで返す。
+"""
+
+SNAPSHOT_JS = r"""
+(opts) => {
+  const txt = (el) => ((el && (el.innerText || el.textContent)) || '').trim();
+  const rect = (el) => {
+    const r = el.getBoundingClientRect();
+    return { x: r.x, y: r.y, width: r.width, height: r.height };
+  };
+  const visible = (el) => {
+    const r = el.getBoundingClientRect();
+    return r.width > 0 && r.height > 0;
+  };
+
+  // 1) 凡例（チャート上のインジ）
+  const legend = Array.from(document.querySelectorAll(opts.legend)).map((el, i) => {
+    const t = el.querySelector(opts.legendTitle);
+    const text = txt(el);
+    return { index: i, title: t ? txt(t) : text.split('\n')[0], text };
+  });
+
+  // 2) ダイアログ内「Indicators on chart」一覧（開いている場合のみ）
+  const onChart = Array.from(document.querySelectorAll(opts.dialogItems))
+    .map(txt).filter(Boolean);
+
+  // 3) 価格軸ラベル（最初にヒットしたセレクタのみ採用）
+  let axis = [];
+  for (const sel of opts.priceAxis) {
+    const els = Array.from(document.querySelectorAll(sel));
+    if (!els.length) continue;
+    for (const el of els) {
+      if (el.children.length > 1 || !visible(el)) continue;
+      const s = txt(el).replace(/,/g, '').replace(/−/g, '-');
+      const m = s.match(/[-+]?\d+(\.\d+)?/);
+      if (!m) continue;
+      axis.push({ text: s, value: parseFloat(m[0]), ...rect(el) });
+      if (axis.length >= opts.maxAxis) break;
+    }
+    if (axis.length) break;
+  }
+
+  // 4) 開いているダイアログ
+  const dialogs = Array.from(document.querySelectorAll(opts.dialogs))
+    .filter(visible)
+    .map((el) => ({
+      name: el.getAttribute('data-name') || el.getAttribute('data-dialog-name') || '',
+      text: txt(el).slice(0, 200),
+    }));
+
+  const sym = document.querySelector(opts.headerSymbol);
+  return {
+    legend,
+    indicators_on_chart: onChart,
+    price_axis: axis,
+    dialogs,
+    symbol: txt(sym),
+    title: document.title,
+  };
+}
+"""
+
+SNAPSHOT_OPTS = {
+    "legend": "div[data-name='legend-source-item']",
+    "legendTitle": "[data-name='legend-source-title']",
+    "dialogItems": (
+        "div[role='dialog'] div[role='listitem'], div[role='dialog'] div[class*='item']"
+    ),
+    "priceAxis": [
+        "div[data-name='price-axis'] span",
+        "div[data-name='price-axis'] div",
+        "div[class*='price'] span",
+        "div[class*='price'] div",
+        "div[class*='axis'] span",
+        "div[class*='axis'] div",
+    ],
+    "maxAxis": 40,
+    "dialogs": "div[role='dialog'], [data-dialog-name]",
+    "headerSymbol": "#header-toolbar-symbol-search",
+}
+
+EMPTY_SNAPSHOT = {
+    "legend": [],
+    "indicators_on_chart": [],
+    "price_axis": [],
+    "dialogs": [],
+    "symbol": "",
+    "title": "",
+}
+
+
+async def take_snapshot(page) -> dict:
+    """凡例/インジ一覧/価格軸ラベル/ダイアログを1回の evaluate で取得する。"""
+    try:
+        snap = await page.evaluate(SNAPSHOT_JS, SNAPSHOT_OPTS)
+    except Exception as e:
+        print(f"[snapshot] failed: {e}")
+        return dict(EMPTY_SNAPSHOT)
+    return {**EMPTY_SNAPSHOT, **(snap or {})}
+
+
+# 価格軸ラベルの「テキスト+y座標」だけをページ内でハッシュ化（表示レンジ変化の検出用）
+AXIS_HASH_JS = r"""
+(opts) => {
+  for (const sel of opts.priceAxis) {
+    const els = Array.from(document.querySelectorAll(sel));
+    if (!els.length) continue;
+    let x = 2166136261, n = 0;
+    for (const el of els) {
+      if (el.children.length > 1) continue;
+      const r = el.getBoundingClientRect();
+      if (!r.width || !r.height) continue;
+      const s = ((el.innerText || el.textContent) || '').trim() + '@' + Math.round(r.y);
+      for (let i = 0; i < s.length; i++) {
+        x ^= s.charCodeAt(i);
+        x = Math.imul(x, 16777619);
+      }
+      if (++n >= opts.maxAxis) break;
+    }
+    if (n) return (x >>> 0).toString(16) + ':' + n;
+  }
+  return null;
+}
+"""
+
+
+async def axis_hash(page) -> str | None:
+    """価格軸ラベルの軽量ハッシュ（ラベルが取れなければ None）。"""
+    try:
+        return await page.evaluate(AXIS_HASH_JS, SNAPSHOT_OPTS)
+    except Exception:
+        return None
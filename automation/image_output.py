@@ -0,0 +1,194 @@
+"""スクリーンショットの出力形式（PNG/JPEG/WebP）・縮小・切り抜き・サムネイル。
+
+    opts = ImageOptions.from_args({"format": "webp", "quality": 75, "scale": 0.5,
+                                   "clip": "plot", "thumbnail": 320})
+    raw = await page.screenshot(**opts.playwright_kwargs(clip_box))
+    data, thumb = await postprocess_async(raw, opts, overlay)
+
+Playwright だけで済む場合（PNG / 縮小なしの JPEG、注釈なし）は Pillow を通さずそのまま返す。
+それ以外は1回だけデコードし、注釈（overlay）→縮小→エンコード→サムネイルを同じパスで行う。
+デコード/エンコードはエグゼキュータ上で行う（UCAR_ANNOTATE_EXECUTOR / UCAR_ANNOTATE_WORKERS）。
+"""
+
+import asyncio
+import io
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image
+
+from tracing import span
+
+FORMATS = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+DEFAULT_QUALITY = 80
+
+# 既定はスレッド（Pillow の圧縮/展開は GIL を離す）。UCAR_ANNOTATE_EXECUTOR=process で別プロセス。
+_EXECUTOR: Executor | None = None
+
+
+class ImageOptions:
+    """format: png|jpeg|webp、quality: 1-100（jpeg/webp）、scale: 0<scale<=1、
+    clip: None | "plot" | {x,y,width,height}、thumbnail: サムネイルの最大幅(px)。"""
+
+    def __init__(
+        self,
+        format: str = "png",
+        quality: int | None = None,
+        scale: float = 1.0,
+        clip=None,
+        thumbnail: int | None = None,
+    ):
+        fmt = str(format or "png").lower()
+        fmt = "jpeg" if fmt == "jpg" else fmt
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        scale = float(scale if scale is not None else 1.0)
+        if not 0 < scale <= 1:
+            raise ValueError("scale must be in (0, 1]")
+        if (
+            clip is not None
+            and clip != "plot"
+            and not (
+                isinstance(clip, dict)
+                and all(k in clip for k in ("x", "y", "width", "height"))
+            )
+        ):
+            raise ValueError('clip must be "plot" or {x, y, width, height}')
+        self.format = fmt
+        self.quality = max(1, min(100, int(quality))) if quality else None
+        self.scale = scale
+        self.clip = clip
+        self.thumbnail = int(thumbnail) if thumbnail else None
+
+    @classmethod
+    def from_args(cls, args: dict) -> "ImageOptions":
+        return cls(
+            args.get("format", "png"),
+            args.get("quality"),
+            args.get("scale", 1.0),
+            args.get("clip"),
+            args.get("thumbnail"),
+        )
+
+    @property
+    def mime_type(self) -> str:
+        return FORMATS[self.format]
+
+    @property
+    def ext(self) -> str:
+        return EXTENSIONS[self.format]
+
+    def needs_pillow(self, overlay=None) -> bool:
+        return (
+            overlay is not None
+            or self.format == "webp"
+            or self.scale != 1.0
+            or bool(self.thumbnail)
+        )
+
+    def playwright_kwargs(self, clip_box: dict | None = None, overlay=None) -> dict:
+        """page.screenshot() の引数。後で Pillow を通すなら劣化の無い PNG で撮る。"""
+        kw = {}
+        if clip_box:
+            kw["clip"] = {k: clip_box[k] for k in ("x", "y", "width", "height")}
+        if self.format == "jpeg" and not self.needs_pillow(overlay):
+            kw["type"] = "jpeg"
+            kw["quality"] = self.quality or DEFAULT_QUALITY
+        return kw
+
+    def raw(self, overlay=None) -> "ImageOptions":
+        """撮影だけ（後処理なし）に使うオプション。Pillow を通すなら PNG で撮る。"""
+        fmt = "png" if self.needs_pillow(overlay) else self.format
+        return ImageOptions(fmt, self.quality, clip=self.clip)
+
+    def with_ext(self, path: str) -> str:
+        """既定の *.png 出力先を実際の形式の拡張子に合わせる。"""
+        root, ext = os.path.splitext(path)
+        if ext.lower() in (".png", ".jpg", ".jpeg", ".webp"):
+            return root + self.ext
+        return path
+
+
+def thumbnail_path(path: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.thumb{ext}"
+
+
+def _sniff(data) -> str | None:
+    head = bytes(data[:4])
+    if head.startswith(b"\x89PNG"):
+        return "png"
+    if head.startswith(b"\xff\xd8"):
+        return "jpeg"
+    return None
+
+
+def _passthrough(data, opts: "ImageOptions", overlay) -> bool:
+    return not opts.needs_pillow(overlay) and _sniff(data) == opts.format
+
+
+def _encode(im: Image.Image, opts: ImageOptions) -> bytes:
+    buf = io.BytesIO()
+    if opts.format == "png":
+        im.save(buf, format="PNG")
+    else:
+        if im.mode != "RGB":
+            im = im.convert("RGB")
+        im.save(
+            buf, format=opts.format.upper(), quality=opts.quality or DEFAULT_QUALITY
+        )
+    return buf.getvalue()
+
+
+def postprocess(data, opts: ImageOptions | None = None, overlay=None):
+    """撮影した画像 bytes → (最終画像 bytes, サムネイル bytes | None)。
+    overlay は Image を受け取り Image を返す関数（注釈の焼き込みなど）。"""
+    opts = opts or ImageOptions()
+    if _passthrough(data, opts, overlay):
+        return bytes(data), None
+    im = Image.open(io.BytesIO(data))
+    im.load()
+    if overlay is not None:
+        im = overlay(im)
+    if opts.scale != 1.0:
+        w = max(1, round(im.width * opts.scale))
+        h = max(1, round(im.height * opts.scale))
+        im = im.resize((w, h), Image.LANCZOS)
+    thumb = None
+    if opts.thumbnail and opts.thumbnail < im.width:
+        t = im.copy()
+        t.thumbnail((opts.thumbnail, im.height))  # 縦横比は保たれる
+        thumb = _encode(t, opts)
+    return _encode(im, opts), thumb
+
+
+def executor() -> Executor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        workers = int(os.getenv("UCAR_ANNOTATE_WORKERS", "0")) or min(
+            4, os.cpu_count() or 1
+        )
+        if os.getenv("UCAR_ANNOTATE_EXECUTOR", "thread").lower() == "process":
+            _EXECUTOR = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="annotate"
+            )
+    return _EXECUTOR
+
+
+async def run_in_executor(fn, *args):
+    """Pillow 処理をエグゼキュータで実行（memoryview はプロセス間で渡せないので bytes に）。"""
+    if isinstance(executor(), ProcessPoolExecutor):
+        args = tuple(bytes(a) if isinstance(a, memoryview) else a for a in args)
+    return await asyncio.get_running_loop().run_in_executor(executor(), fn, *args)
+
+
+async def postprocess_async(data, opts: ImageOptions | None = None, overlay=None):
+    """postprocess() をエグゼキュータで実行する。Pillow が不要ならその場で返す。"""
+    opts = opts or ImageOptions()
+    if _passthrough(data, opts, overlay):
+        return bytes(data), None
+    with span("postprocess", format=opts.format, executor=type(executor()).__name__):
+        return await run_in_executor(postprocess, data, opts, overlay)
@@ -0,0 +1,147 @@
+"""TradingView の時間足（interval）モデル。
+
+    iv = parse_interval("4h")      # Interval(count=240, unit="m")（時間は分に寄せる）
+    iv.code                        # "240"   URL / TradingViewApi.setResolution / 入力ダイアログ用
+    iv.label                       # "4h"    ヘッダの時間足ボタンの表記
+
+秒（"30s"）・分（"15m" / "15"）・時間（"1h" / "4H"）・日/週/月（"D" / "1W" / "3M"）・
+レンジ足（"100R"）を扱う。小文字 "m" は分、大文字 "M" は月（TradingView と同じ）。
+DOM から読んだ表記（"1h", "15", "1D", "1 hour", "15 minutes" など）も同じ関数で正規化し、
+same_interval() で要求と実際を比べる。
+"""
+
+import re
+from dataclasses import dataclass
+
+# 単位 → (TradingView コードの接尾辞, 分に換算する倍率)。分・時間はコードが分の数字になる
+_UNITS = {
+    "s": ("S", None),
+    "m": ("", 1),
+    "h": ("", 60),
+    "D": ("D", None),
+    "W": ("W", None),
+    "M": ("M", None),
+    "R": ("R", None),
+}
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "D": 86400, "W": 7 * 86400}
+# aria-label / ツールチップの英語表記（"1 hour", "15 minutes", "100 ranges"）
+_WORDS = {
+    "second": "s",
+    "minute": "m",
+    "hour": "h",
+    "day": "D",
+    "week": "W",
+    "month": "M",
+    "range": "R",
+}
+_TF_RE = re.compile(r"^(\d*)\s*([a-zA-Z]?)$")
+_WORD_RE = re.compile(r"^(\d*)\s*([a-z]+?)s?$")
+
+
+class IntervalError(ValueError):
+    """解釈できない時間足。"""
+
+
+class IntervalMismatch(RuntimeError):
+    """時間足を設定したのにチャートの表示が要求と一致しない（違う足のスクショを返さない）。"""
+
+    def __init__(self, requested: str, actual: str | None, method: str | None = None):
+        self.requested = requested
+        self.actual = actual
+        self.method = method
+        super().__init__(
+            f"interval mismatch: requested {requested}, chart shows {actual or 'unknown'}"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "error": str(self),
+            "code": "interval_mismatch",
+            "requested": self.requested,
+            "actual": self.actual,
+            "method": self.method,
+        }
+
+
+@dataclass(frozen=True)
+class Interval:
+    count: int
+    unit: str  # s / m / h / D / W / M / R
+
+    @property
+    def code(self) -> str:
+        """TradingView の interval コード（"30S", "15", "240", "1D", "1W", "1M", "100R"）。"""
+        suffix, minutes = _UNITS[self.unit]
+        if minutes is not None:
+            return str(self.count * minutes)
+        return f"{self.count}{suffix}"
+
+    @property
+    def label(self) -> str:
+        """ヘッダのボタン表記（"30s", "15m", "4h", "1D", "1W", "1M", "100R"）。"""
+        if self.unit == "m" and self.count % 60 == 0:
+            return f"{self.count // 60}h"
+        return f"{self.count}{self.unit}"
+
+    @property
+    def aliases(self) -> tuple[str, ...]:
+        """ボタンの data-value / 表記として一致を認める文字列（大文字小文字は区別する）。"""
+        out = [self.code, self.label]
+        if self.label.endswith("h"):
+            out.append(self.label[:-1] + "H")
+        if self.count == 1 and self.unit in ("D", "W", "M"):
+            out.append(self.unit)
+        return tuple(dict.fromkeys(out))
+
+    @property
+    def seconds(self) -> int | None:
+        """1本の長さ（秒）。月足とレンジ足は固定長でないので None。"""
+        per = _UNIT_SECONDS.get(self.unit)
+        return None if per is None else self.count * per
+
+    def __str__(self) -> str:
+        return self.label
+
+
+def parse_interval(tf) -> Interval:
+    """時間足の表記 → Interval（"15m" / "15" / "1h" / "4H" / "30s" / "D" / "1W" / "M" / "100R" /
+    "1 hour" など）。解釈できなければ IntervalError。"""
+    if isinstance(tf, Interval):
+        return tf
+    t = str(tf if tf is not None else "").strip()
+    m = _TF_RE.match(t)
+    if m and (m.group(1) or m.group(2)):
+        num, unit = m.groups()
+        if not unit:
+            unit = "m"  # 数字だけは分（TradingView のコード）
+        elif unit in ("d", "w", "r"):
+            unit = unit.upper()
+        elif unit in ("H", "S"):
+            unit = unit.lower()
+        if unit in _UNITS:
+            return _normalize(int(num or 1), unit)
+    m = _WORD_RE.match(t.lower())
+    if m and m.group(2) in _WORDS:
+        return _normalize(int(m.group(1) or 1), _WORDS[m.group(2)])
+    raise IntervalError(f"unknown timeframe: {tf!r}")
+
+
+def _normalize(count: int, unit: str) -> Interval:
+    if count <= 0:
+        raise IntervalError(f"timeframe must be positive: {count}{unit}")
+    # 時間は分に寄せて比較する（"1h" と "60" は同じ足）
+    if unit == "h":
+        return Interval(count * 60, "m")
+    return Interval(count, unit)
+
+
+def try_parse_interval(tf) -> Interval | None:
+    try:
+        return parse_interval(tf)
+    except IntervalError:
+        return None
+
+
+def same_interval(a, b) -> bool:
+    ia, ib = try_parse_interval(a), try_parse_interval(b)
+    return ia is not None and ia == ib
@@ -0,0 +1,209 @@
+"""ヘッドレスでチャートを描くためのネットワーク方針（遮断 + 静的バンドルのディスクキャッシュ）。
+
+    await install_net_policy(context)
+
+- 広告・解析・Webフォント・ニュースウィジェットなどチャートの canvas に影響しない通信を遮断する。
+  context.route() に URL の正規表現を渡すので、対象外の通常リクエストは Python を経由しない。
+- static.tradingview.com のハッシュ付き JS/CSS バンドルは cache/bundles/ に保存し、
+  次の context からはディスクから返す（非永続 context は Chromium の HTTP キャッシュを共有しないため）。
+
+UCAR_NET_BLOCK で遮断するカテゴリ（既定 "ads,analytics,fonts,news"、"none" で無効）、
+UCAR_BUNDLE_CACHE / UCAR_BUNDLE_CACHE_MB で保存先と上限（"0" で無効）を変えられる。
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import weakref
+from pathlib import Path
+
+# カテゴリ → 遮断するホスト（サブドメインも含む）
+BLOCK_HOSTS = {
+    "ads": [
+        "doubleclick.net",
+        "googlesyndication.com",
+        "adservice.google.com",
+        "amazon-adsystem.com",
+        "adnxs.com",
+        "criteo.com",
+        "criteo.net",
+        "taboola.com",
+        "outbrain.com",
+    ],
+    "analytics": [
+        "google-analytics.com",
+        "googletagmanager.com",
+        "telemetry.tradingview.com",
+        "connect.facebook.net",
+        "bat.bing.com",
+        "clarity.ms",
+        "hotjar.com",
+        "mc.yandex.ru",
+    ],
+    # canvas は端末のシステムフォントで描かれるので Web フォントは UI の見た目にしか効かない
+    "fonts": ["fonts.googleapis.com", "fonts.gstatic.com"],
+    "news": ["news-headlines.tradingview.com", "news-mediator.tradingview.com"],
+}
+# ホストだけでは決まらないもの（URL の正規表現、大文字小文字は区別しない）
+BLOCK_URL_PATTERNS = {
+    "ads": [],
+    "analytics": [r"snowplow", r"facebook\.com/(tr|signals)"],
+    "fonts": [r"\.(woff2?|ttf|otf|eot)(\?|$)"],
+    "news": [r"/news-flow/", r"/ideas-widget"],
+}
+DEFAULT_BLOCK = "ads,analytics,fonts,news"
+
+# ファイル名にハッシュが入っていて中身が変わらない静的バンドル
+BUNDLE_PATTERN = re.compile(
+    os.getenv(
+        "UCAR_BUNDLE_PATTERN",
+        r"^https://static\.tradingview\.com/static/bundles/[^?#]+\.(js|css)(\?.*)?$",
+    ),
+    re.IGNORECASE,
+)
+KEEP_HEADERS = {
+    "content-type",
+    "cache-control",
+    "access-control-allow-origin",
+    "timing-allow-origin",
+}
+BUNDLE_DIR = Path(os.getenv("UCAR_BUNDLE_CACHE", "cache/bundles"))
+BUNDLE_CACHE_MB = float(os.getenv("UCAR_BUNDLE_CACHE_MB", "300"))
+
+# 同じ context に2回 route を仕込まない
+_INSTALLED: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def block_categories(spec: str | None = None) -> list[str]:
+    spec = spec if spec is not None else os.getenv("UCAR_NET_BLOCK", DEFAULT_BLOCK)
+    spec = spec.strip().lower()
+    if spec in ("", "0", "none", "off"):
+        return []
+    cats = [c.strip() for c in spec.split(",") if c.strip()]
+    unknown = [c for c in cats if c not in BLOCK_HOSTS]
+    if unknown:
+        raise ValueError(f"unknown UCAR_NET_BLOCK categories: {', '.join(unknown)}")
+    return cats
+
+
+def block_regex(categories: list[str]) -> re.Pattern | None:
+    """カテゴリのパターンを1本の正規表現にまとめる（route は1つで済む）。"""
+    parts = [
+        rf"^[a-z]+://([^/?#]+\.)?{re.escape(h)}[:/]"
+        for c in categories
+        for h in BLOCK_HOSTS[c]
+    ]
+    parts += [p for c in categories for p in BLOCK_URL_PATTERNS[c]]
+    if not parts:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in parts), re.IGNORECASE)
+
+
+def resolver_rules(categories: list[str]) -> str:
+    """Chromium の --host-resolver-rules 用（route を使わずにホスト単位で遮断する）。"""
+    hosts = [h for c in categories for h in BLOCK_HOSTS[c]]
+    return ", ".join(f"MAP {h} ~NOTFOUND, MAP *.{h} ~NOTFOUND" for h in hosts)
+
+
+class BundleCache:
+    """<dir>/<sha1(url)>.body + .json（返すヘッダ）。全 context で共有する。"""
+
+    def __init__(self, root: Path = BUNDLE_DIR, max_mb: float = BUNDLE_CACHE_MB):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._stores = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return self.root / f"{key}.body", self.root / f"{key}.json"
+
+    def get(self, url: str) -> tuple[bytes, dict] | None:
+        body, meta = self._paths(url)
+        try:
+            headers = json.loads(meta.read_text(encoding="utf-8"))
+            data = body.read_bytes()
+        except (OSError, ValueError):
+            return None
+        os.utime(meta)
+        return data, headers
+
+    def put(self, url: str, data: bytes, headers: dict) -> None:
+        body, meta = self._paths(url)
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = body.with_suffix(f".tmp{os.getpid()}")
+            tmp.write_bytes(data)
+            os.replace(tmp, body)
+            meta.write_text(json.dumps(headers), encoding="utf-8")
+        except OSError as e:
+            print(f"[net] bundle cache store failed: {e}")
+            return
+        self._stores += 1
+        if self._stores % 20 == 1:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries, total = [], 0
+        for meta in self.root.glob("*.json"):
+            body = meta.with_suffix(".body")
+            try:
+                size = body.stat().st_size
+                entries.append((meta.stat().st_mtime, size, meta, body))
+            except OSError:
+                continue
+            total += size
+        for _, size, meta, body in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            for p in (meta, body):
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+
+BUNDLES = BundleCache()
+
+
+async def _serve_bundle(route):
+    req = route.request
+    if req.method != "GET":
+        await route.continue_()
+        return
+    hit = await asyncio.to_thread(BUNDLES.get, req.url)
+    if hit is not None:
+        data, headers = hit
+        await route.fulfill(status=200, headers=headers, body=data)
+        return
+    resp = await route.fetch()
+    if resp.status != 200:
+        await route.fulfill(response=resp)
+        return
+    data = await resp.body()
+    # crossorigin 付きの <script> でも通るよう CORS 系のヘッダは元のまま残す
+    headers = {k: v for k, v in resp.headers.items() if k.lower() in KEEP_HEADERS}
+    headers["x-ucar-cached-at"] = str(int(time.time()))
+    await asyncio.to_thread(BUNDLES.put, req.url, data, headers)
+    await route.fulfill(response=resp, body=data)
+
+
+async def install_net_policy(context, categories: list[str] | None = None):
+    """遮断ルールとバンドルキャッシュを context に仕込む（同じ context には1回だけ）。
+    永続プロファイル（browser_profile.py）では route を張ると Chromium の HTTP キャッシュが
+    無効になるので何もしない（遮断は起動時の --host-resolver-rules で行う）。"""
+    if context in _INSTALLED or getattr(context, "uses_http_cache", False):
+        return
+    _INSTALLED.add(context)
+    rx = block_regex(block_categories() if categories is None else categories)
+    if rx is not None:
+        await context.route(rx, lambda route: route.abort("blockedbyclient"))
+    if BUNDLES.enabled:
+        await context.route(BUNDLE_PATTERN, _serve_bundle)
@@ -0,0 +1,210 @@
+import asyncio
+import contextlib
+import os
+import time
+
+from tv_controller import (
+    open_chart,
+    navigate_chart,
+    chart_healthy,
+    remove_all_drawings,
+)
+from tracing import span
+
+# 途中で失敗したタブのインジ構成（何が載っているか分からないので必ず開き直す）
+_UNKNOWN = object()
+
+
+class PooledPage:
+    """プール内のチャートタブ1枚分（context/page と現在の symbol/tf）。"""
+
+    def __init__(self, context=None, page=None, symbol=None, tf=None):
+        self.context = context
+        self.page = page
+        self.symbol = symbol
+        self.tf = tf
+        self.last_used = time.monotonic()
+        self.busy = False
+        # 描画など後片付けが必要な変更を加えたら True にする
+        self.dirty = False
+        # インジの構成（None は開いた時のまま。プリセット等を載せた貸出先がキーを宣言する）
+        self.layout = None
+
+    def score(self, symbol, tf, layout=None) -> int:
+        """要求との近さ（3:完全一致 / 2:同シンボル / 1:同時間足 / 0:無関係）。
+        別のインジ構成を載せたタブは開き直すので無関係と同じ扱い。"""
+        if self.page is None or self.symbol is None:
+            return 0
+        if self.layout is not None and self.layout != layout:
+            return 0
+        if self.symbol == symbol:
+            return 3 if self.tf == tf else 2
+        return 1 if self.tf == tf else 0
+
+
+class ChartPagePool:
+    """symbol/tf 済みのチャートタブを最大 size 枚保持し、近いものから貸し出す。
+
+    - 完全一致があればナビゲーション無しで返す
+    - 無ければ状態が最も近いタブ（同シンボル→同時間足→LRU）を切り替えて返す
+    - 返却時・貸出前に canvas ヘルスチェックを行い、壊れたタブは作り直す
+    """
+
+    def __init__(
+        self, new_context, size: int | None = None, idle_ttl: float | None = None
+    ):
+        self._new_context = new_context  # async () -> BrowserContext
+        if size is None:
+            size = int(os.getenv("UCAR_POOL_SIZE", "2"))
+        if idle_ttl is None:
+            idle_ttl = float(os.getenv("UCAR_POOL_IDLE_S", "900"))
+        self.size = self._base_size = max(1, size)
+        self.idle_ttl = idle_ttl
+        self._entries: list[PooledPage] = []
+        self._widened: list[int] = []
+        self._cond = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def widen(self, size: int):
+        """with の間だけ上限を size 枚まで広げる（バッチ用）。抜けたら元の上限に戻し、
+        超過分の空きタブを閉じる。重なったバッチは一番大きい要求に合わせる。"""
+        self._widened.append(size)
+        self.size = max([self._base_size, *self._widened])
+        try:
+            yield self
+        finally:
+            self._widened.remove(size)
+            self.size = max([self._base_size, *self._widened])
+            async with self._cond:
+                await self._trim()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, symbol: str, tf: str, layout=None):
+        """layout: 貸出先がチャートに載せるインジ構成のキー（プリセット名など）。
+        同じキーのタブだけを再利用し、違うタブは開いた時の状態に戻してから貸す。"""
+        with span("pool.checkout", symbol=symbol, tf=tf):
+            entry = await self._checkout(symbol, tf, layout)
+        try:
+            yield entry
+        except BaseException:
+            # 途中失敗（キャンセル含む）したタブは状態が読めないので次回は必ず切り替え直す
+            entry.symbol = entry.tf = None
+            entry.layout = _UNKNOWN
+            raise
+        finally:
+            with span("pool.checkin"):
+                # 返却中に再キャンセルされても枠を返し切る
+                await asyncio.shield(self._checkin(entry))
+
+    async def _checkout(self, symbol, tf, layout=None) -> PooledPage:
+        async with self._cond:
+            await self._evict_idle()
+            while True:
+                entry = self._pick(symbol, tf, layout)
+                if entry is not None:
+                    break
+                await self._cond.wait()
+            entry.busy = True
+
+        try:
+            await self._prepare(entry, symbol, tf, layout)
+        except BaseException:
+            # キャンセルでも busy のまま残さない（枠が戻らず _checkout が待ち続ける）
+            await asyncio.shield(self._discard(entry))
+            raise
+        return entry
+
+    def _pick(self, symbol, tf, layout=None) -> PooledPage | None:
+        idle = [e for e in self._entries if not e.busy]
+        best = max(
+            idle,
+            key=lambda e: (
+                e.score(symbol, tf, layout),
+                e.layout == layout,
+                e.last_used,
+            ),
+            default=None,
+        )
+        if best is not None and best.score(symbol, tf, layout) > 0:
+            return best
+        if len(self._entries) < self.size:
+            # 空きがあれば新しいタブを作り、既存の温まったタブは残す
+            entry = PooledPage()
+            self._entries.append(entry)
+            return entry
+        if idle:
+            # 満杯：最も長く使われていないタブを追い出して再利用（LRU）
+            return min(idle, key=lambda e: e.last_used)
+        return None
+
+    async def _prepare(self, entry: PooledPage, symbol, tf, layout=None):
+        if entry.page is not None and not await chart_healthy(entry.page):
+            print(f"[pool] unhealthy tab recycled ({entry.symbol} {entry.tf})")
+            await self._close_entry(entry)
+        if entry.page is not None and entry.layout not in (None, layout):
+            # 前の貸出先が載せたインジを残さない（プール導入前と同じく新しいページから）
+            await self._close_entry(entry)
+
+        if entry.page is None:
+            entry.context = await self._new_context()
+            entry.page = await open_chart(entry.context, symbol, tf)
+            entry.symbol, entry.tf = symbol, tf
+
+        if (entry.symbol, entry.tf) != (symbol, tf):
+            # シンボルと時間足は1ステップで切り替える（ページ内API → URL → 検索UI）
+            await navigate_chart(entry.page, symbol, tf)
+            entry.symbol, entry.tf = symbol, tf
+        entry.layout = layout
+
+    async def _checkin(self, entry: PooledPage):
+        if entry.dirty and entry.page is not None:
+            cleaned = False
+            with contextlib.suppress(Exception):
+                cleaned = await remove_all_drawings(entry.page)
+            if not cleaned:
+                await self._close_entry(entry)
+            entry.dirty = False
+        entry.last_used = time.monotonic()
+        async with self._cond:
+            entry.busy = False
+            if entry.page is None and entry in self._entries:
+                self._entries.remove(entry)
+            await self._trim()
+            self._cond.notify_all()
+
+    async def _discard(self, entry: PooledPage):
+        await self._close_entry(entry)
+        async with self._cond:
+            if entry in self._entries:
+                self._entries.remove(entry)
+            self._cond.notify_all()
+
+    async def _evict_idle(self):
+        now = time.monotonic()
+        for e in list(self._entries):
+            if not e.busy and now - e.last_used > self.idle_ttl:
+                await self._close_entry(e)
+                self._entries.remove(e)
+
+    async def _trim(self):
+        # 上限を超えている分の空きタブを古い順に閉じる（_cond を持った状態で呼ぶ）
+        idle = sorted(
+            (e for e in self._entries if not e.busy), key=lambda e: e.last_used
+        )
+        for e in idle[: max(0, len(self._entries) - self.size)]:
+            await self._close_entry(e)
+            self._entries.remove(e)
+
+    @staticmethod
+    async def _close_entry(entry: PooledPage):
+        if entry.context is not None:
+            with contextlib.suppress(Exception):
+                await entry.context.close()
+        entry.context = entry.page = None
+        entry.symbol = entry.tf = entry.layout = None
+
+    async def close(self):
+        async with self._cond:
+            for e in self._entries:
+                await self._close_entry(e)
+            self._entries.clear()
@@ -0,0 +1,256 @@
+"""固定 sleep の代わりに使う、条件ベースの待機ヘルパー。
+
+各 wait_* は条件を満たした時点で True を返す。timeout_ms 内に満たせなかった場合や
+シグナル自体が取れない場合（DOM差分など）は、合計で fallback_ms（従来の固定待機）
+に達するまで待ってから False を返す。つまり従来より遅くなることはない。
+UCAR_READINESS=0 で従来どおりの固定待機のみになる。
+"""
+
+import os
+import time
+
+from intervals import parse_interval, try_parse_interval
+from tracing import traced
+
+PANE_CANVAS = "div[data-name='pane'] canvas"
+LEGEND_ITEM = "div[data-name='legend-source-item']"
+FLOATING_TOOLBAR = "[data-name='floating-toolbar']"
+HEADER_SYMBOL = "#header-toolbar-symbol-search"
+HEADER_INTERVALS = "#header-toolbar-intervals"
+LEGEND_SERIES_TITLE = (
+    "div[data-name='legend-series-item'] div[data-name='legend-source-title']"
+)
+
+# pane の canvas 群を 64x36 に縮小描画して FNV-1a ハッシュを取る（描画の変化検出用）。
+# ライブ更新される右端（最新足）15% は除外し、画素も量子化してティックで揺れないようにする。
+_CANVAS_HASH_FN = r"""
+function __ucarCanvasHash(sel) {
+  const cs = Array.from(document.querySelectorAll(sel));
+  if (!cs.length) return null;
+  const w = 64, h = 36;
+  let c = window.__ucarHashCanvas;
+  if (!c) {
+    c = window.__ucarHashCanvas = document.createElement('canvas');
+    c.width = w; c.height = h;
+  }
+  const ctx = c.getContext('2d', { willReadFrequently: true });
+  ctx.clearRect(0, 0, w, h);
+  for (const src of cs) {
+    if (!src.width || !src.height) continue;
+    try { ctx.drawImage(src, 0, 0, src.width * 0.85, src.height, 0, 0, w, h); } catch (e) {}
+  }
+  const d = ctx.getImageData(0, 0, w, h).data;
+  let x = 2166136261;
+  for (let i = 0; i < d.length; i += 4) {
+    x ^= (d[i] >> 4) | ((d[i + 1] >> 4) << 8) | ((d[i + 2] >> 4) << 16);
+    x = Math.imul(x, 16777619);
+  }
+  return x >>> 0;
+}
+"""
+
+_SETTLE_JS = (
+    "([sel, need]) => {"
+    + _CANVAS_HASH_FN
+    + """
+  const h = __ucarCanvasHash(sel);
+  if (h === null) return false;
+  const st = window.__ucarSettle || (window.__ucarSettle = { h: null, n: 0 });
+  if (st.h === h) st.n += 1; else { st.h = h; st.n = 0; }
+  return st.n >= need;
+}"""
+)
+
+_CHANGED_JS = (
+    "([sel, before]) => {"
+    + _CANVAS_HASH_FN
+    + """
+  const h = __ucarCanvasHash(sel);
+  return h !== null && h !== before;
+}"""
+)
+
+_HASH_JS = "(sel) => {" + _CANVAS_HASH_FN + "return __ucarCanvasHash(sel); }"
+
+_SYMBOL_JS = """
+([sel, sym]) => {
+  const want = sym.toUpperCase().split(':').pop();
+  const el = document.querySelector(sel);
+  const txt = ((el && (el.innerText || el.textContent)) || '').toUpperCase();
+  return txt.includes(want) || document.title.toUpperCase().startsWith(want);
+}
+"""
+
+# 現在の時間足の表記候補：ヘッダの選択中ボタン → 時間足メニューのボタン → 凡例（"USDJPY · 1h · FX"）
+_INTERVAL_JS = """
+([box, legend]) => {
+  const out = [];
+  const texts = (el) => [
+    el.getAttribute('data-value'),
+    el.innerText || el.textContent,
+    el.getAttribute('aria-label'),
+  ];
+  const root = document.querySelector(box);
+  if (root) {
+    const active = root.querySelector(
+      "[aria-pressed='true'], [aria-checked='true'], [class*='isActive']"
+    );
+    const menu = root.querySelector("[data-name*='interval'], [aria-haspopup]");
+    for (const el of [active, menu]) if (el) out.push(...texts(el));
+  }
+  const t = document.querySelector(legend);
+  const parts = ((t && (t.innerText || t.textContent)) || '').split('·');
+  if (parts.length > 1) out.push(parts[1]);
+  return out.filter((v) => v && v.trim()).map((v) => v.trim());
+}
+"""
+
+_LEGEND_COUNT_JS = "([sel, n]) => document.querySelectorAll(sel).length >= n"
+
+
+def enabled() -> bool:
+    return os.getenv("UCAR_READINESS", "1") != "0"
+
+
+async def _wait_js(page, js, arg, timeout_ms, fallback_ms, polling=100) -> bool:
+    start = time.perf_counter()
+    if enabled():
+        try:
+            await page.wait_for_function(
+                js, arg=arg, timeout=timeout_ms, polling=polling
+            )
+            return True
+        except Exception:
+            pass
+    # シグナル未確認：従来の固定待機ぶんは最低限確保する
+    elapsed = int((time.perf_counter() - start) * 1000)
+    if fallback_ms and elapsed < fallback_ms:
+        await page.wait_for_timeout(fallback_ms - elapsed)
+    return False
+
+
+async def canvas_hash(page) -> int | None:
+    """チャート canvas の縮小ハッシュ（取れなければ None）。"""
+    try:
+        return await page.evaluate(_HASH_JS, PANE_CANVAS)
+    except Exception:
+        return None
+
+
+@traced()
+async def wait_canvas_settled(
+    page,
+    stable_polls: int = 3,
+    interval_ms: int = 80,
+    timeout_ms: int = 1500,
+    fallback_ms: int = 0,
+) -> bool:
+    """canvas のハッシュが stable_polls 回連続で変わらなくなるまで待つ。"""
+    if enabled():
+        try:
+            await page.evaluate("() => { window.__ucarSettle = null; }")
+        except Exception:
+            pass
+    return await _wait_js(
+        page,
+        _SETTLE_JS,
+        [PANE_CANVAS, stable_polls],
+        timeout_ms,
+        fallback_ms,
+        polling=interval_ms,
+    )
+
+
+@traced()
+async def wait_canvas_changed(
+    page, before: int | None, timeout_ms: int = 2000, fallback_ms: int = 0
+) -> bool:
+    """canvas ハッシュが before から変化するまで待つ（描画・ロード反映の検出）。"""
+    if before is None:
+        if fallback_ms:
+            await page.wait_for_timeout(fallback_ms)
+        return False
+    return await _wait_js(
+        page, _CHANGED_JS, [PANE_CANVAS, before], timeout_ms, fallback_ms
+    )
+
+
+@traced()
+async def wait_symbol(
+    page, symbol: str, timeout_ms: int = 5000, fallback_ms: int = 0
+) -> bool:
+    """ヘッダのシンボル表示（またはタブタイトル）が symbol に変わるまで待つ。"""
+    return await _wait_js(
+        page, _SYMBOL_JS, [HEADER_SYMBOL, symbol], timeout_ms, fallback_ms
+    )
+
+
+async def active_interval(page) -> str | None:
+    """DOM から現在の時間足を読む（"15m" / "1h" / "1D" などの表記）。読めなければ None。"""
+    try:
+        raw = await page.evaluate(_INTERVAL_JS, [HEADER_INTERVALS, LEGEND_SERIES_TITLE])
+    except Exception:
+        return None
+    for v in raw or []:
+        iv = try_parse_interval(v)
+        if iv is not None:
+            return iv.label
+    return None
+
+
+@traced()
+async def wait_interval(page, tf, timeout_ms: int = 3000) -> tuple[bool, str | None]:
+    """DOM の時間足表示が tf になるまで待つ。(一致したか, 最後に読めた表示) を返す。
+    表記の揺れ（"60" / "1h" / "1 hour"）は intervals.parse_interval で吸収する。"""
+    want = parse_interval(tf)
+    deadline = time.perf_counter() + timeout_ms / 1000
+    actual = None
+    while True:
+        cur = await active_interval(page)
+        if cur is not None:
+            actual = cur
+            if parse_interval(cur) == want:
+                return True, actual
+        if time.perf_counter() >= deadline:
+            return False, actual
+        await page.wait_for_timeout(100)
+
+
+async def legend_count(page) -> int:
+    try:
+        return await page.locator(LEGEND_ITEM).count()
+    except Exception:
+        return 0
+
+
+@traced()
+async def wait_legend_count(
+    page, at_least: int, timeout_ms: int = 3000, fallback_ms: int = 0
+) -> bool:
+    """凡例（legend）の項目数が at_least 以上になるまで待つ（インジ追加の反映）。"""
+    return await _wait_js(
+        page, _LEGEND_COUNT_JS, [LEGEND_ITEM, at_least], timeout_ms, fallback_ms
+    )
+
+
+@traced()
+async def wait_drawing_added(
+    page, before: int | None, timeout_ms: int = 2000, fallback_ms: int = 0
+) -> bool:
+    """描画の追加を待つ：canvas 変化（無ければフローティングツールバー）→ 安定化。"""
+    start = time.perf_counter()
+    changed = False
+    if enabled():
+        changed = await wait_canvas_changed(page, before, timeout_ms=timeout_ms)
+        if not changed:
+            try:
+                changed = await page.locator(FLOATING_TOOLBAR).first.is_visible()
+            except Exception:
+                changed = False
+    if changed:
+        await wait_canvas_settled(page, timeout_ms=timeout_ms)
+        return True
+    elapsed = int((time.perf_counter() - start) * 1000)
+    if fallback_ms and elapsed < fallback_ms:
+        await page.wait_for_timeout(fallback_ms - elapsed)
+    return False
@@ -0,0 +1,24 @@
+"""行区切り JSON-RPC の接続先とサイズ上限（mcp_server.py と invoke_ucar.py で共有）。
+
+サーバ・クライアントの両方から import するので標準ライブラリだけに依存させる。
+"""
+
+import os
+
+# POSIX は Unix ソケット、Windows は 127.0.0.1 の TCP（asyncio に名前付きパイプの公開APIが無いため）
+DEFAULT_ADDRESS = "cache/ucar.sock" if os.name == "posix" else "127.0.0.1:8799"
+# 1行（= 1リクエスト/レスポンス）の上限。base64 画像を載せた1行も読めるように
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+def parse_address(addr: str):
+    """host:port なら ("tcp", host, port)、それ以外はソケットのパスとして ("unix", path)。"""
+    addr = addr.strip()
+    if addr.startswith("tcp://"):
+        addr = addr[len("tcp://") :]
+    elif addr.startswith("unix://"):
+        return ("unix", addr[len("unix://") :])
+    host, sep, port = addr.rpartition(":")
+    if sep and port.isdigit() and "/" not in addr and "\\" not in addr:
+        return ("tcp", host or "127.0.0.1", int(port))
+    return ("unix", addr)
@@ -1,4 +1,9 @@
-CHART_URL = "https://www.tradingview.com/chart/"
+import json
+import os
+import weakref
+
+# TV_CHART_URL でローカルの fake TradingView（bench/fake_tv_server.py）等に向けられる
+CHART_URL = os.getenv("TV_CHART_URL", "https://www.tradingview.com/chart/")
 
 # シンボル検索
 SEARCH_INPUT = "input[data-name='symbol-search-input'], input[aria-label='Symbol Search'], input[placeholder*='Symbol']"
@@ -85,6 +90,8 @@ FIB_TOOL_BUTTONS = [
     "button[data-name='linetool-fib-retracement']",
     "button[aria-label='Fib Retracement']",
     "button[aria-label*='Fibonacci Retracement']",
+    "[data-name='linetool-fib-retracement']",
+    "[data-name*='fib-retracement']",
     # タイトル属性
     "button[title*='Fib']",
     "button[title*='Fibonacci']",
@@ -93,6 +100,9 @@ FIB_TOOL_BUTTONS = [
     "button[aria-label*='Retracement']",
     "button:has-text('Fib')",
     "button:has-text('リトレースメント')",
+    "[role='button'][aria-label*='Fib']",
+    "div[role='toolbar'] [aria-label*='Fib']",
+    "[class*='button']:has-text('Fib')",
     # ツールバーグループ内の候補
     "[data-name*='linetool-group'] button[aria-label*='Fib']",
     "[data-name*='drawing-toolbar'] button[aria-label*='Fib']",
@@ -102,9 +112,188 @@ FIB_TOOL_BUTTONS = [
     "[data-name*='fibonacci']",
 ]
 
+# 左の描画ツールバーを表示させるボタン
+DRAWING_TOOLBAR_BUTTONS = [
+    "button[aria-label*='Drawing']",
+    "button[aria-label*='Tools']",
+    "button[data-name*='drawing']",
+    "button[data-name*='toolbar']",
+    "[data-name='drawing-toolbar-button']",
+    "[data-name='left-toolbar'] button",
+]
+
+# 選択中の描画をロック（浮遊ツールバーの鍵アイコン）
+LOCK_DRAWING_BUTTONS = [
+    "[data-name='floating-toolbar'] [data-name*='lock']",
+    "[data-name='floating-toolbar'] button[aria-label*='Lock']",
+    "[data-name='floating-toolbar'] [class*='lock']",
+]
+
+# 左ツールバーの全描画ロック
+LOCK_ALL_BUTTONS = [
+    "[aria-label*='Lock all drawings']",
+    "[aria-label*='Lock All']",
+    "[data-name*='lock-all']",
+    "button:has-text('Lock all')",
+    "button:has-text('すべてロック')",
+]
+
 # プロット領域（canvasの親パネル）
 PLOT_AREA = "div[data-name='pane'] canvas"
 # 右側 価格軸（価格ラベル抽出に使う）
 PRICE_AXIS_LABELS = (
     "div[data-name='price-axis'] span, div[data-name='price-axis'] div:has(span)"
 )
+
+
+# ---------------------------------------------------------------------------
+# セレクタ解決キャッシュ
+# ---------------------------------------------------------------------------
+
+SELECTOR_CACHE = os.getenv(
+    "UCAR_SELECTOR_CACHE",
+    os.path.join(os.path.dirname(__file__), ".selector_cache.json"),
+)
+
+# UI言語とビルド（バンドルのハッシュ）。UIが変わればキャッシュも別扱いにする
+_UI_CONTEXT_JS = r"""
+() => {
+  const lang = document.documentElement.lang || navigator.language || '';
+  let build = '';
+  for (const s of document.scripts) {
+    const m = (s.src || '').match(/bundles\/(?:[\w-]+\.)*?([0-9a-f]{8,})\.js/);
+    if (m) { build = m[1]; break; }
+  }
+  return lang + '|' + build;
+}
+"""
+
+
+class SelectorResolver:
+    """論理的なUI部品（"fib_tool" など）ごとに、どの候補セレクタが当たったかを覚える。
+
+    - 当たったセレクタを UI言語+ビルド 単位で JSON に保存し、次回は最初に試す
+    - まず全候補を待ち無しで見て、無ければ従来どおり候補ごとに timeout まで待つ
+    - 覚えたセレクタが miss_limit 回続けて外れたら忘れる
+    """
+
+    def __init__(self, path: str = SELECTOR_CACHE, miss_limit: int = 3):
+        self.path = path
+        self.miss_limit = miss_limit
+        self._data = None  # {ui_context: {key: {"selector", "hits", "misses"}}}
+        self._ui = weakref.WeakKeyDictionary()  # page -> ui_context
+
+    def _load(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except Exception:
+                self._data = {}
+        return self._data
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"[selectors] cache save failed: {e}")
+
+    async def _ui_context(self, page) -> str:
+        ui = self._ui.get(page)
+        if ui is None:
+            try:
+                ui = await page.evaluate(_UI_CONTEXT_JS)
+            except Exception:
+                return "|"
+            self._ui[page] = ui
+        return ui
+
+    def order(self, ui: str, key: str, candidates: list[str]) -> list[str]:
+        """覚えているセレクタを先頭にした候補リスト。"""
+        known = self._load().get(ui, {}).get(key, {}).get("selector")
+        if known in candidates:
+            return [known] + [c for c in candidates if c != known]
+        return list(candidates)
+
+    def record(self, ui: str, key: str, selector: str | None):
+        """解決結果を記録する（selector=None は全候補ミス）。"""
+        entries = self._load().setdefault(ui, {})
+        entry = entries.get(key)
+        if entry is not None and entry["selector"] == selector:
+            if entry["misses"] == 0 and entry["hits"] > 0:
+                entry["hits"] += 1  # 変化なし：ファイルには書かない
+                return
+            entry["hits"] += 1
+            entry["misses"] = 0
+        elif entry is None:
+            if selector is None:
+                return
+            entries[key] = {"selector": selector, "hits": 1, "misses": 0}
+        else:
+            entry["misses"] += 1
+            if entry["misses"] >= self.miss_limit:
+                if selector is None:
+                    del entries[key]
+                else:
+                    entries[key] = {"selector": selector, "hits": 1, "misses": 0}
+        self._save()
+
+    async def resolve(
+        self,
+        page,
+        key: str,
+        candidates: list[str],
+        timeout_ms: int = 1500,
+        state: str = "visible",
+    ) -> str | None:
+        """候補から今ページ上にあるセレクタを返す（無ければ None）。"""
+        ui = await self._ui_context(page)
+        ordered = self.order(ui, key, candidates)
+
+        # 1) 待ち無しで一巡（キャッシュが温まっていれば先頭で即決）
+        for sel in ordered:
+            try:
+                loc = page.locator(sel).first
+                ok = await (loc.is_visible() if state == "visible" else loc.count())
+            except Exception:
+                ok = False
+            if ok:
+                self.record(ui, key, sel)
+                return sel
+
+        # 2) まだ描画されていない可能性：従来どおり候補ごとに待つ
+        for sel in ordered:
+            try:
+                await page.locator(sel).first.wait_for(state=state, timeout=timeout_ms)
+            except Exception:
+                continue
+            self.record(ui, key, sel)
+            return sel
+
+        self.record(ui, key, None)
+        return None
+
+    async def click(
+        self,
+        page,
+        key: str,
+        candidates: list[str],
+        timeout_ms: int = 1500,
+        force: bool = False,
+    ) -> str | None:
+        """resolve してクリック。クリックできたセレクタを返す。"""
+        sel = await self.resolve(page, key, candidates, timeout_ms=timeout_ms)
+        if sel is None:
+            return None
+        try:
+            await page.locator(sel).first.click(timeout=timeout_ms, force=force)
+            return sel
+        except Exception:
+            self.record(await self._ui_context(page), key, None)
+            return None
+
+
+RESOLVER = SelectorResolver()
@@ -0,0 +1,168 @@
+"""TradingView のログイン状態（storage_state）を1度だけ読み、全 context で共有する。
+
+    ctx = await SESSION.new_context(browser, resident=True, viewport=VIEWPORT)
+
+- storage_state.json は mtime が変わった時だけ読み直し、dict のまま new_context に渡す
+  （呼び出しごとの JSON 読み込みをしない）。ファイルが無い/壊れている時は未ログインで続行する。
+- 常駐ランタイムがブラウザを持っている時（resident=True）は、認証クッキー（sessionid）が無い、
+  または UCAR_SESSION_REFRESH_S 秒以内に切れる場合に tv_login.login() でログインし直し、
+  バックグラウンドで保存し直す（TV_EMAIL / TV_PASSWORD が必要）。
+  単発モードはブラウザがすぐ閉じるので、期限が実際に切れている時だけその場でログインし直す。
+- 常駐モードでは save_from() で使用中の context の状態（更新されたクッキー）を
+  UCAR_SESSION_SAVE_S 秒ごとに書き戻す。
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from tracing import span
+
+TV_STORAGE = os.getenv("TV_STORAGE", "automation/storage_state.json")
+AUTH_COOKIES = ("sessionid",)
+# この秒数以内に認証クッキーが切れるならログインし直す
+REFRESH_MARGIN_S = float(os.getenv("UCAR_SESSION_REFRESH_S", "86400"))
+# 使用中の context から状態を書き戻す間隔（0 で無効）
+SAVE_INTERVAL_S = float(os.getenv("UCAR_SESSION_SAVE_S", "1800"))
+
+
+class SessionManager:
+    def __init__(self, path: str = TV_STORAGE):
+        self.path = path
+        self._state: dict | None = None
+        self._mtime: float | None = None
+        self._saved_at = time.monotonic()
+        self._refresh: asyncio.Task | None = None
+        # ログインし直しに失敗した時点のファイルの mtime（同じファイルのままなら再試行しない）
+        self._refresh_failed_for: float | None = None
+        self._lock = asyncio.Lock()
+
+    # ---- 読み込み ----
+    def state(self) -> dict | None:
+        """storage_state(dict)。ファイルが無ければ None（未ログインとして扱う）。"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._state = self._mtime = None
+            return None
+        if mtime != self._mtime:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                self._state = state if isinstance(state, dict) else None
+            except (OSError, ValueError) as e:
+                print(f"[session] ignoring unreadable {self.path}: {e}")
+                self._state = None
+            self._mtime = mtime
+        return self._state
+
+    def expires_at(self) -> float | None:
+        """認証クッキーの有効期限（epoch秒）。クッキーが無ければ None、期限無しなら inf。"""
+        state = self.state() or {}
+        exps = [
+            c.get("expires", -1)
+            for c in state.get("cookies", [])
+            if c.get("name") in AUTH_COOKIES
+        ]
+        if not exps:
+            return None
+        return min(float("inf") if e is None or e < 0 else float(e) for e in exps)
+
+    def expired(self) -> bool:
+        """保存済みの認証クッキーが既に切れているか（クッキーが無い場合は False）。"""
+        exp = self.expires_at()
+        return exp is not None and exp <= time.time()
+
+    def needs_refresh(self, margin: float = REFRESH_MARGIN_S) -> bool:
+        """保存済みの状態が未ログイン/期限切れ間近か。ファイルが無ければ False
+        （初回ログインは 2FA などがあるので tv_login.py を手動で実行する）。"""
+        if self.state() is None:
+            return False
+        exp = self.expires_at()
+        return exp is None or exp - time.time() < margin
+
+    # ---- context ----
+    async def new_context(self, browser, resident: bool = False, **kwargs):
+        """ログイン状態つきの context。
+        resident=True（常駐ランタイムのブラウザ）なら期限切れが近い時に裏でログインし直す。
+        それ以外はブラウザが呼び出しの終わりで閉じるので、切れている時だけ先にログインし直す。"""
+        if not resident and self.expired() and self._can_refresh():
+            await self._do_refresh(browser)
+        ctx = await browser.new_context(storage_state=self.state(), **kwargs)
+        if resident and self.needs_refresh():
+            self.refresh_in_background(browser)
+        return ctx
+
+    def _can_refresh(self) -> bool:
+        if self._refresh_failed_for is not None and self._refresh_failed_for == (
+            self._mtime
+        ):
+            return False  # tv_login.py で保存し直されるまで待つ
+        return bool(os.getenv("TV_EMAIL") and os.getenv("TV_PASSWORD"))
+
+    def refresh_in_background(self, browser) -> asyncio.Task | None:
+        """tv_login.login() で状態を取り直して保存する（同時に1つだけ）。
+        ブラウザが呼び出しをまたいで生きている常駐モード専用。"""
+        if self._refresh is not None and not self._refresh.done():
+            return self._refresh
+        if not self._can_refresh():
+            return None
+        self._refresh = asyncio.ensure_future(self._do_refresh(browser))
+        return self._refresh
+
+    async def _do_refresh(self, browser):
+        from tv_login import login
+
+        mtime = self._mtime
+        try:
+            with span("session.refresh"):
+                ctx = await browser.new_context()
+                try:
+                    state = await login(ctx)
+                finally:
+                    await ctx.close()
+            if not _logged_in(state):
+                raise RuntimeError("login did not yield a session cookie")
+            await self._write(state)
+            print(f"[session] refreshed {self.path}")
+        except Exception as e:
+            self._refresh_failed_for = mtime
+            print(f"[session] refresh failed: {e}")
+
+    async def save_from(self, ctx, force: bool = False):
+        """使用中の context の状態を書き戻す（SAVE_INTERVAL_S ごと。force なら即時）。"""
+        if not force and (
+            not SAVE_INTERVAL_S or time.monotonic() - self._saved_at < SAVE_INTERVAL_S
+        ):
+            return
+        self._saved_at = time.monotonic()
+        try:
+            state = await ctx.storage_state()
+        except Exception:
+            return
+        # 未ログインの context で既存のログイン状態を上書きしない
+        if _logged_in(state):
+            await self._write(state)
+
+    async def _write(self, state: dict):
+        async with self._lock:
+            await asyncio.to_thread(self._write_sync, state)
+
+    def _write_sync(self, state: dict):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+        self._state = state
+        self._mtime = os.stat(self.path).st_mtime
+        self._refresh_failed_for = None
+
+
+def _logged_in(state: dict) -> bool:
+    return any(c.get("name") in AUTH_COOKIES for c in state.get("cookies", []))
+
+
+# プロセス全体で1つ
+SESSION = SessionManager()
@@ -0,0 +1,201 @@
+"""ステップごとの所要時間を計測する軽量スパンAPI。
+
+    with span("open_chart", symbol=symbol):
+        ...
+
+    @traced("set_timeframe")
+    async def set_timeframe(page, tf): ...
+
+スパンは contextvars で親子関係を保持するため、asyncio.gather で分岐したタスク内の
+スパンも呼び出し元のスパンの子として記録される。ツール呼び出し1回分を trace() で囲むと
+ルートスパンのツリー（to_dict()）が得られ、UCAR_TRACE_DIR を設定していれば
+JSONL（既定）または Chrome trace-event 形式（UCAR_TRACE_FORMAT=chrome）でも書き出す。
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import time
+import uuid
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar(
+    "ucar_span", default=None
+)
+
+
+class Span:
+    def __init__(self, name: str, parent: "Span | None" = None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.children: list[Span] = []
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.error: str | None = None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.origin = parent.origin if parent else self.start
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return round((end - self.start) * 1000, 1)
+
+    def to_dict(self) -> dict:
+        d = {
+            "name": self.name,
+            "ms": self.ms,
+            "start_ms": round((self.start - self.origin) * 1000, 1),
+        }
+        if self.attrs:
+            d["attrs"] = self.attrs
+        if self.error:
+            d["error"] = self.error
+        if self.children:
+            d["children"] = [c.to_dict() for c in self.children]
+        return d
+
+    def walk(self, depth: int = 0):
+        yield self, depth
+        for c in self.children:
+            yield from c.walk(depth + 1)
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """現在のスパンの子として name を計測する。"""
+    s = Span(name, _current.get(), **attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _current.reset(token)
+
+
+def traced(name: str | None = None):
+    """関数呼び出しをスパンで囲むデコレータ（async / 同期どちらも可）。"""
+
+    def deco(fn):
+        label = name or fn.__name__
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with span(label):
+                    return await fn(*args, **kwargs)
+
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+@contextlib.contextmanager
+def trace(name: str, **attrs):
+    """ツール呼び出し1回分のルートスパン。終了時に設定があればファイルへ書き出す。"""
+    token = _current.set(None)
+    try:
+        with span(name, **attrs) as root:
+            yield root
+    finally:
+        _current.reset(token)
+        _export(root)
+
+
+# ---- 出力 ----
+def _export(root: Span):
+    out_dir = os.getenv("UCAR_TRACE_DIR")
+    if not out_dir:
+        return
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        if os.getenv("UCAR_TRACE_FORMAT", "jsonl").lower() == "chrome":
+            path = os.path.join(out_dir, f"{root.name}-{root.trace_id}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(to_chrome(root), f)
+        else:
+            path = os.path.join(out_dir, "spans.jsonl")
+            with open(path, "a", encoding="utf-8") as f:
+                for line in to_jsonl(root):
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[trace] export failed: {e}")
+
+
+def to_jsonl(root: Span) -> list[dict]:
+    """1スパン1行（trace_id/深さ/親名つき）。"""
+    rows = []
+    for s, depth in root.walk():
+        rows.append(
+            {
+                "trace_id": s.trace_id,
+                "name": s.name,
+                "parent": s.parent.name if s.parent else None,
+                "depth": depth,
+                "start_ms": round((s.start - s.origin) * 1000, 1),
+                "ms": s.ms,
+                **({"attrs": s.attrs} if s.attrs else {}),
+                **({"error": s.error} if s.error else {}),
+            }
+        )
+    return rows
+
+
+def to_chrome(root: Span) -> dict:
+    """chrome://tracing / Perfetto で開ける trace-event 形式（"X" 完了イベント）。
+    並列に走るルート直下の子（バッチの各 item など）は別スレッド行に分ける。"""
+    events = []
+
+    def emit(s: Span, tid: int):
+        events.append(
+            {
+                "name": s.name,
+                "ph": "X",
+                "ts": round((s.start - s.origin) * 1e6),
+                "dur": round(s.ms * 1000),
+                "pid": 1,
+                "tid": tid,
+                "args": {**s.attrs, **({"error": s.error} if s.error else {})},
+            }
+        )
+        for c in s.children:
+            emit(c, tid)
+
+    events.append(
+        {
+            "name": root.name,
+            "ph": "X",
+            "ts": 0,
+            "dur": round(root.ms * 1000),
+            "pid": 1,
+            "tid": 0,
+            "args": root.attrs,
+        }
+    )
+    lanes: list[float] = []  # 各 tid の最終終了時刻
+    for c in root.children:
+        end = c.end if c.end is not None else time.perf_counter()
+        for i, free_at in enumerate(lanes):
+            if free_at <= c.start:
+                lanes[i] = end
+                tid = i + 1
+                break
+        else:
+            lanes.append(end)
+            tid = len(lanes)
+        emit(c, tid)
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -1,7 +1,9 @@
 import asyncio, os
+import functools
 import json
 import re
 from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from dotenv import load_dotenv
 from playwright.async_api import async_playwright, TimeoutError as PWTimeout
 from tenacity import retry, stop_after_attempt, wait_fixed
@@ -11,7 +13,10 @@ load_dotenv()
 TV_STORAGE = os.getenv("TV_STORAGE", "automation/storage_state.json")
 
 # セレクタを直接定義
-CHART_URL = "https://www.tradingview.com/chart/"
+# TV_CHART_URL でローカルの fake TradingView（bench/fake_tv_server.py）等に向けられる
+CHART_URL = os.getenv("TV_CHART_URL", "https://www.tradingview.com/chart/")
+# シンボル/時間足の切替方法：url（URLパラメータ + ページ内API、既定）/ ui（従来の検索UI）
+NAV_MODE = os.getenv("UCAR_NAV", "url").lower()
 SEARCH_INPUT = "input[data-name='symbol-search-input'], input[aria-label='Symbol Search'], input[placeholder*='Symbol']"
 
 # セレクタファイルをインポート
@@ -19,40 +24,55 @@ import sys
 
 sys.path.append(os.path.dirname(__file__))
 
-# Fibツールセレクタは selectors.py を優先利用（失敗時はローカル定義をフォールバック）
-try:
-    from selectors import FIB_TOOL_BUTTONS as FIB_TOOL_BUTTONS  # type: ignore
-except Exception:
-    FIB_TOOL_BUTTONS = [
-        # 具体的なデータ名/ラベル
-        "button[data-name='linetool-fib-retracement']",
-        "button[aria-label='Fib Retracement']",
-        "button[aria-label*='Fibonacci Retracement']",
-        "[data-name='linetool-fib-retracement']",
-        "[data-name*='fib-retracement']",
-        # タイトル属性
-        "button[title*='Fib']",
-        "button[title*='Fibonacci']",
-        # 一般的なaria-label/テキスト
-        "button[aria-label*='Fib']",
-        "button[aria-label*='Retracement']",
-        "button:has-text('Fib')",
-        "button:has-text('リトレースメント')",
-        "[role='button'][aria-label*='Fib']",
-        "div[role='toolbar'] [aria-label*='Fib']",
-        "[class*='button']:has-text('Fib')",
-        # ツールバーグループ内の候補
-        "[data-name*='linetool-group'] button[aria-label*='Fib']",
-        "[data-name*='drawing-toolbar'] button[aria-label*='Fib']",
-        # data-name属性ベース（広め）
-        "[data-name*='linetool-fib']",
-        "[data-name*='fib']",
-        "[data-name*='fibonacci']",
-    ]
+# 固定 sleep の代わりに使う条件待機（シグナルが取れない時は従来の待機時間にフォールバック）
+from readiness import (
+    HEADER_INTERVALS,
+    active_interval,
+    canvas_hash,
+    legend_count,
+    wait_canvas_changed,
+    wait_canvas_settled,
+    wait_drawing_added,
+    wait_legend_count,
+    wait_interval,
+    wait_symbol,
+)
+from intervals import Interval, IntervalMismatch, parse_interval
+
+# 凡例/インジ一覧/価格軸ラベルは1回の evaluate でまとめて取る
+from chart_snapshot import take_snapshot
+from axis_model import AxisModel, get_axis_model
 
+# ステップごとの所要時間（ツール結果の timings / UCAR_TRACE_DIR）
+from tracing import span, traced
 
-def TIMEFRAME_BUTTON(tf: str):
-    return f"button[aria-label='{tf}'], button[aria-label*='{tf.upper()}'], button:has-text('{tf}')"
+# ログイン状態（storage_state）は1度だけ読んで全 context で共有する
+from session import SESSION
+from net_policy import install_net_policy
+from browser_profile import launch_browser
+
+# 注釈の焼き込み・形式変換/縮小（Pillow）はエグゼキュータで行う
+from annotate import overlay_from_annotate
+from image_output import ImageOptions, postprocess_async, thumbnail_path
+
+# selectors.py は標準ライブラリの selectors と名前が衝突する（asyncio が先に読み込む）ため、
+# ファイルパスから tv_selectors として読み込む
+import importlib.util
+
+if "tv_selectors" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        "tv_selectors", os.path.join(os.path.dirname(__file__), "selectors.py")
+    )
+    sys.modules["tv_selectors"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["tv_selectors"])
+
+from tv_selectors import (
+    DRAWING_TOOLBAR_BUTTONS,
+    FIB_TOOL_BUTTONS,
+    LOCK_ALL_BUTTONS,
+    LOCK_DRAWING_BUTTONS,
+    RESOLVER,
+)
 
 
 INDICATOR_BUTTONS = [
@@ -84,6 +104,68 @@ LEGEND_ITEM_BY_TEXT = (
 LEGEND_SETTINGS_BTN = (
     "button[aria-label*='Settings'], [data-name='legend-settings-action']"
 )
+LEGEND_ITEM = "div[data-name='legend-source-item']"
+
+# 凡例は "EMA 200 close" のように略称で表示される（英語UI）。正式名→略称
+INDICATOR_SHORT_NAMES = {
+    "Moving Average": "MA",
+    "Exponential Moving Average": "EMA",
+    "Relative Strength Index": "RSI",
+    "Volume": "Vol",
+    "MACD": "MACD",
+}
+
+
+def _legend_name_re(name: str):
+    """凡例テキストが name（正式名 or 先頭の略称）に該当するかの正規表現。"""
+    alts = [re.escape(name)]
+    short = INDICATOR_SHORT_NAMES.get(name)
+    if short:
+        # 略称は先頭一致のみ（"MA" が "EMA"/"MACD" に当たらないように）
+        alts.append(rf"^\s*{re.escape(short)}(?![A-Za-z])")
+    return re.compile("|".join(alts), re.IGNORECASE)
+
+
+def _legend_matches(name: str, text: str) -> bool:
+    return bool(_legend_name_re(name).search(text or ""))
+
+
+def _legend_rows(page, name: str):
+    return page.locator(LEGEND_ITEM).filter(has_text=_legend_name_re(name))
+
+
+LEGEND_DELETE_BTN = (
+    "[data-name='legend-delete-action'], "
+    "button[aria-label*='Remove'], button[aria-label*='Delete']"
+)
+
+# 凡例で略称の後に並ぶ入力値の順（"MA 20 close" / "MACD 12 26 close 9"）
+LEGEND_PARAM_ORDER = {
+    "Moving Average": ["Length", "Source"],
+    "Exponential Moving Average": ["Length", "Source"],
+    "Relative Strength Index": ["Length", "Source"],
+    "Volume": [],
+    "MACD": ["Fast Length", "Slow Length", "Source", "Signal Smoothing"],
+}
+
+
+def _legend_params(name: str, text: str) -> dict:
+    """凡例テキストから入力値を読む（順序が分かっているインジのみ。読めない値は入れない）。"""
+    order = LEGEND_PARAM_ORDER.get(name)
+    if not order:
+        return {}
+    m = _legend_name_re(name).search(text or "")
+    tokens = (text[m.end() :] if m else text or "").split()
+    return dict(zip(order, tokens))
+
+
+def _param_equal(expected, actual) -> bool:
+    if actual is None:
+        return False
+    try:
+        return float(expected) == float(actual)
+    except (TypeError, ValueError):
+        return str(expected).strip().lower() == str(actual).strip().lower()
 
 # ----- Indicator settings open (Dialog fallback) -----
 INDICATORS_DIALOG = "div[role='dialog']"
@@ -156,28 +238,29 @@ ANTI_POPUP_JS = r"""
 """
 
 
+POPUP_URL_RE = re.compile(
+    "|".join(
+        re.escape(x)
+        for x in [
+            "/checkout",
+            "/pricing",
+            "/upgrade",
+            "/plus",
+            "/subscription",
+            "/plans",
+            "#order",
+        ]
+    ),
+    re.IGNORECASE,
+)
+
+
 async def install_anti_popup(context):
     """Network abort + init CSS/JS to prevent and auto-dismiss popups."""
-    # 1) 通信層で危険URLを遮断
-    await context.route(
-        "**/*",
-        lambda route: (
-            route.abort()
-            if any(
-                x in route.request.url.lower()
-                for x in [
-                    "/checkout",
-                    "/pricing",
-                    "/upgrade",
-                    "/plus",
-                    "/subscription",
-                    "/plans",
-                    "#order",
-                ]
-            )
-            else route.continue_()
-        ),
-    )
+    # 1) 通信層で危険URLを遮断（URLパターンで route するので他のリクエストは Python を経由しない）。
+    #    永続プロファイルでは route が HTTP キャッシュを無効にするので 2) の JS/CSS だけで防ぐ
+    if not getattr(context, "uses_http_cache", False):
+        await context.route(POPUP_URL_RE, lambda route: route.abort())
     # 2) 読込前スクリプト（JSとCSS）を注入
     await context.add_init_script(ANTI_POPUP_JS)
     await context.add_init_script(
@@ -272,18 +355,11 @@ async def _toggle_overlap_hidden(page, enable: bool):
 
 async def _lock_last_drawing(page):
     """選択中の描画オブジェクトをロック（浮遊ツールバーの鍵アイコンをクリック）。"""
-    candidates = [
-        "[data-name='floating-toolbar'] [data-name*='lock']",
-        "[data-name='floating-toolbar'] button[aria-label*='Lock']",
-        "[data-name='floating-toolbar'] [class*='lock']",
-    ]
-    for sel in candidates:
-        try:
-            await page.locator(sel).first.click(timeout=600, force=True)
-            await page.wait_for_timeout(120)
-            return True
-        except Exception:
-            continue
+    if await RESOLVER.click(
+        page, "lock_drawing", LOCK_DRAWING_BUTTONS, timeout_ms=600, force=True
+    ):
+        await page.wait_for_timeout(120)
+        return True
     return False
 
 
@@ -311,23 +387,12 @@ async def _lock_by_context_menu(page, at_x: float, at_y: float) -> bool:
 
 async def _lock_all_drawings_toggle(page, enable: bool) -> bool:
     """左ツールバーの全描画ロック切り替え（UI差分に対し複数候補）。"""
-    selectors = [
-        "[aria-label*='Lock all drawings']",
-        "[aria-label*='Lock All']",
-        "[data-name*='lock-all']",
-        "button:has-text('Lock all')",
-        "button:has-text('すべてロック')",
-    ]
-    for sel in selectors:
-        try:
-            btn = page.locator(sel).first
-            await btn.wait_for(state="visible", timeout=800)
-            # 状態判定は難しいため2回押して戻す方法は避け、enable=Trueなら一度押す前に右クリックメニューでLock AllがONか確認…は重いので簡易化
-            await btn.click(timeout=800, force=True)
-            await page.wait_for_timeout(120)
-            return True
-        except Exception:
-            continue
+    # 状態判定は難しいため2回押して戻す方法は避け、enable=Trueなら一度押す前に右クリックメニューでLock AllがONか確認…は重いので簡易化
+    if await RESOLVER.click(
+        page, "lock_all", LOCK_ALL_BUTTONS, timeout_ms=800, force=True
+    ):
+        await page.wait_for_timeout(120)
+        return True
     return False
 
 
@@ -351,7 +416,7 @@ async def ensure_chart_ready(page):
     # 1) DOM, 2) main canvas visible, 3) 軽い遅延
     await page.wait_for_load_state("domcontentloaded")
     await page.locator("canvas").first.wait_for(state="visible", timeout=20000)
-    await page.wait_for_timeout(600)
+    await wait_canvas_settled(page, fallback_ms=600)
 
 
 async def _safe_click_any(page, selectors: list[str], timeout=5000):
@@ -366,7 +431,42 @@ async def _safe_click_any(page, selectors: list[str], timeout=5000):
     return False
 
 
-async def open_chart(context, symbol: str):
+def chart_url(symbol: str | None = None, tf: str | None = None, base: str = CHART_URL):
+    """symbol / interval をクエリに載せたチャートURL（ロード時点で目的の足が出る）。"""
+    parts = urlsplit(base)
+    q = dict(parse_qsl(parts.query))
+    if symbol:
+        q["symbol"] = symbol
+    if tf:
+        q["interval"] = parse_interval(tf).code
+    return urlunsplit(parts._replace(query=urlencode(q)))
+
+
+# TradingViewApi.activeChart() でシンボルと時間足をまとめて切り替え、データ読込完了を待つ
+_API_SWITCH_JS = r"""
+async ([symbol, interval, timeoutMs]) => {
+  const api = window.TradingViewApi;
+  let chart = null;
+  try { chart = api && (api.activeChart ? api.activeChart() : api.chart()); } catch (e) {}
+  if (!chart || typeof chart.setSymbol !== 'function') return { ok: false, reason: 'no api' };
+  const call = (fn, arg) => new Promise((resolve) => {
+    let done = false;
+    const fin = () => { if (!done) { done = true; resolve(); } };
+    setTimeout(fin, timeoutMs);
+    try { chart[fn](arg, fin); } catch (e) { fin(); }
+  });
+  if (symbol) await call('setSymbol', symbol);
+  if (interval && typeof chart.setResolution === 'function') await call('setResolution', interval);
+  const read = (fn) => { try { return chart[fn](); } catch (e) { return null; } };
+  return { ok: true, symbol: read('symbol'), interval: read('resolution') };
+}
+"""
+
+
+@traced()
+async def open_chart(context, symbol: str, tf: str | None = None):
+    """チャートを開く。url モードでは symbol/interval を URL に載せて直接ロードする。
+    tf を渡せば時間足もここで合わせる（呼び出し側の set_timeframe は不要）。"""
     page = await context.new_page()
 
     # Anti-popup を必ず最初に仕込む（表示前に効かせる）
@@ -374,8 +474,16 @@ async def open_chart(context, symbol: str):
         await install_anti_popup(context)
     except Exception:
         pass
+    # 広告/解析/フォント等の遮断と静的バンドルのディスクキャッシュ（UCAR_NET_BLOCK）
+    try:
+        await install_net_policy(context)
+    except ValueError:
+        raise
+    except Exception:
+        pass
 
-    await page.goto(CHART_URL)
+    direct = NAV_MODE == "url"
+    await page.goto(chart_url(symbol, tf) if direct else CHART_URL)
     await ensure_chart_ready(page)
     # キャンバスにフォーカス & オーバーレイ強制排除
     await page.click("canvas", force=True)
@@ -385,6 +493,51 @@ async def open_chart(context, symbol: str):
     except Exception:
         pass
 
+    if direct and await wait_symbol(page, symbol, timeout_ms=5000):
+        if tf:
+            # 保存レイアウトが interval を上書きすることがあるので DOM で確認する
+            await set_timeframe(page, tf)
+        return page
+    # URL が効かなかった（ログイン直後のリダイレクト等）／ui モード
+    await switch_symbol(page, symbol)
+    if tf:
+        await set_timeframe(page, tf)
+    return page
+
+
+@traced()
+async def navigate_chart(page, symbol: str, tf: str | None = None) -> bool:
+    """開いているチャートの symbol / tf を1ステップで切り替え、ヘッダのシンボルと時間足で確認する。
+    url モード：ページ内API（TradingViewApi）→ 無ければ URL で再ロード。
+    どちらでも確認が取れない時と ui モードでは従来の検索UIで切り替える。"""
+    if NAV_MODE == "url":
+        res = None
+        with contextlib.suppress(Exception):
+            with span("nav.api"):
+                code = parse_interval(tf).code if tf else None
+                res = await page.evaluate(_API_SWITCH_JS, [symbol, code, 10000])
+        if not (res and res.get("ok")):
+            with span("nav.goto"):
+                await page.goto(chart_url(symbol, tf))
+                await ensure_chart_ready(page)
+                with contextlib.suppress(Exception):
+                    await close_popups_fast(page)
+        if await wait_symbol(page, symbol, timeout_ms=5000):
+            if tf:
+                # 時間足は DOM で確認（合っていれば何もしない。違えば設定し直す）
+                await set_timeframe(page, tf)
+            await wait_canvas_settled(page)
+            return True
+        print(f"[nav] header does not show {symbol}; falling back to symbol search")
+    ok = await switch_symbol(page, symbol)
+    if tf:
+        await set_timeframe(page, tf)
+    return ok
+
+
+@traced()
+async def switch_symbol(page, symbol: str) -> bool:
+    """開いているチャートのシンボルをUI検索で切り替える。"""
     # シンボル検索（複数のアプローチを試行）
     symbol_search_success = False
 
@@ -402,7 +555,8 @@ async def open_chart(context, symbol: str):
     if not symbol_search_success:
         try:
             await page.keyboard.press("/")
-            await page.wait_for_timeout(1000)
+            with contextlib.suppress(Exception):
+                await page.wait_for_selector(SEARCH_INPUT, timeout=1000)
             await page.keyboard.type(symbol)
             await page.keyboard.press("Enter")
             symbol_search_success = True
@@ -428,25 +582,117 @@ async def open_chart(context, symbol: str):
     if not symbol_search_success:
         print(f"警告: シンボル {symbol} の検索に失敗しました")
 
-    await page.wait_for_timeout(1200)
-    return page
+    # ヘッダのシンボル表示が切り替わり、足の描画が落ち着くまで待つ
+    if await wait_symbol(page, symbol, timeout_ms=5000, fallback_ms=1200):
+        await wait_canvas_settled(page)
+    return symbol_search_success
+
+
+# ヘッダの時間足ボタンを表記の完全一致で押す（has-text の部分一致だと "1m" が "1M" 等に当たる）
+_CLICK_INTERVAL_JS = """
+([box, values]) => {
+  const root = document.querySelector(box);
+  if (!root) return false;
+  for (const b of root.querySelectorAll("button, [role='radio']")) {
+    const cand = [b.getAttribute('data-value'), b.getAttribute('aria-label'), b.innerText];
+    if (cand.some((c) => c && values.includes(c.trim()))) {
+      b.click();
+      return true;
+    }
+  }
+  return false;
+}
+"""
+
+
+async def _interval_by_api(page, iv: Interval) -> bool:
+    try:
+        res = await page.evaluate(_API_SWITCH_JS, [None, iv.code, 10000])
+    except Exception:
+        return False
+    return bool(res and res.get("ok"))
 
 
-async def set_timeframe(page, tf: str):
+async def _interval_by_button(page, iv: Interval) -> bool:
     try:
-        await page.locator(TIMEFRAME_BUTTON(tf)).first.click(timeout=3000)
+        return await page.evaluate(
+            _CLICK_INTERVAL_JS, [HEADER_INTERVALS, list(iv.aliases)]
+        )
     except Exception:
-        # ホットキーfallback（1,5,15,60,240, D）
-        mapping = {"1m": "1", "5m": "5", "15m": "15", "1h": "60", "4h": "240", "D": "D"}
-        key = mapping.get(tf, "60")
-        await page.keyboard.type(str(key))
+        return False
+
+
+async def _interval_by_typing(page, iv: Interval) -> bool:
+    # チャート上で数字を打つと "Change interval" ダイアログが開く
+    try:
+        await page.keyboard.type(iv.code)
         await page.keyboard.press("Enter")
-    await page.wait_for_timeout(400)
+    except Exception:
+        return False
+    return True
+
+
+# 速い順（ページ内API → ヘッダのボタン → キー入力）
+_INTERVAL_METHODS = (
+    ("api", _interval_by_api),
+    ("button", _interval_by_button),
+    ("typed", _interval_by_typing),
+)
+
+
+@traced()
+async def set_timeframe(page, tf: str) -> str:
+    """時間足を最速の経路で設定し、DOM の表示で確認してから返す（戻り値は表示中の時間足）。
+    表示が要求と違う時、または DOM から読めず確認できない時は IntervalMismatch
+    （actual=None は「未確認」。確認できない足のスクショは返さない）。"""
+    iv = parse_interval(tf)
+    current = await active_interval(page)
+    if current is not None and parse_interval(current) == iv:
+        return current
+
+    before = await canvas_hash(page)
+    actual, method = current, None
+    for name, apply in _INTERVAL_METHODS:
+        with span("interval." + name):
+            if not await apply(page, iv):
+                continue
+            method = name
+            ok, actual = await wait_interval(page, iv, timeout_ms=3000)
+        if ok:
+            break
+        if actual is None:
+            # 表示が読めないので他の経路でも確認できない
+            raise IntervalMismatch(iv.label, None, method)
+    else:
+        raise IntervalMismatch(iv.label, actual, method)
+
+    # 足の再描画が始まって落ち着くまで待つ
+    if await wait_canvas_changed(page, before, timeout_ms=1500, fallback_ms=400):
+        await wait_canvas_settled(page)
+    return actual
+
+
+DIALOG_LIST_ITEMS = (
+    "div[role='dialog'] div[role='listitem'], div[role='dialog'] div[class*='item']"
+)
+
+
+async def _wait_dialog_list(page, timeout_ms: int):
+    """ダイアログのタブ切替後、一覧の行が出るまで待つ（最大 timeout_ms）。"""
+    with contextlib.suppress(Exception):
+        await page.locator(DIALOG_LIST_ITEMS).first.wait_for(
+            state="attached", timeout=timeout_ms
+        )
 
 
 async def check_indicator_exists(page, indicator_name: str) -> bool:
     """インジケーターが既にチャートに存在するかチェック"""
     try:
+        # まず凡例をスナップショットで確認（ダイアログを開かずに済む）
+        snap = await take_snapshot(page)
+        if any(_legend_matches(indicator_name, it["text"]) for it in snap["legend"]):
+            return True
+
         # インジケーターダイアログを開く
         opened = await open_indicators_dialog(page)
         if not opened:
@@ -455,36 +701,29 @@ async def check_indicator_exists(page, indicator_name: str) -> bool:
         # "Indicators on chart"タブに切り替え
         try:
             await page.locator(INDICATORS_ON_CHART_TAB).first.click(timeout=1500)
-            await page.wait_for_timeout(500)
+            await _wait_dialog_list(page, 500)
         except Exception:
             pass
 
-        # リスト内でインジケーター名を検索
-        indicator_items = page.locator(
-            "div[role='dialog'] div[role='listitem'], div[role='dialog'] div[class*='item']"
+        # リスト内でインジケーター名を検索（一覧は1回の evaluate で取得）
+        snap = await take_snapshot(page)
+        found = any(
+            indicator_name.lower() in text.lower()
+            for text in snap["indicators_on_chart"]
         )
-        count = await indicator_items.count()
-
-        for i in range(count):
-            try:
-                item = indicator_items.nth(i)
-                text = await item.text_content()
-                if indicator_name.lower() in text.lower():
-                    return True
-            except Exception:
-                continue
 
         # ダイアログを閉じる
         await page.keyboard.press("Escape")
-        return False
+        return found
     except Exception:
         return False
 
 
-async def open_settings_for_indicator(page, text_match: str) -> bool:
+async def open_settings_for_indicator(page, text_match: str, nth: int = 0) -> bool:
+    """text_match に該当する nth 番目（同名インジが複数ある場合）の設定を開く。"""
     # ① Legend 行 → 歯車（最優先）
     try:
-        row = page.locator(LEGEND_ITEM_BY_TEXT(text_match)).first
+        row = _legend_rows(page, text_match).nth(nth)
         await row.wait_for(state="visible", timeout=2000)
         await row.hover()
         await row.locator(LEGEND_SETTINGS_BTN).first.click(timeout=1200)
@@ -495,7 +734,7 @@ async def open_settings_for_indicator(page, text_match: str) -> bool:
 
     # ② Legend 行 → 右クリック → コンテキストメニュー「Settings」（UI差分用）
     try:
-        row = page.locator(LEGEND_ITEM_BY_TEXT(text_match)).first
+        row = _legend_rows(page, text_match).nth(nth)
         await row.wait_for(state="visible", timeout=2000)
         await row.click(button="right")
         # メニューはロケール差分に備え英/日両方
@@ -509,24 +748,18 @@ async def open_settings_for_indicator(page, text_match: str) -> bool:
     # ③ ダイアログ → "Indicators on chart" → 行の歯車（フォールバック）
     try:
         # 既存の open_indicators_dialog があればそれを使ってOK
-        opened = False
-        for sel in INDICATOR_BUTTONS:
-            try:
-                await page.locator(sel).first.click(timeout=1500)
-                opened = True
-                break
-            except Exception:
-                continue
-        if not opened:
+        if not await RESOLVER.click(
+            page, "indicator_button", INDICATOR_BUTTONS, timeout_ms=1500
+        ):
             return False
 
         try:
             await page.locator(INDICATORS_ON_CHART_TAB).first.click(timeout=1500)
-            await page.wait_for_timeout(300)
+            await _wait_dialog_list(page, 300)
         except Exception:
             pass
 
-        row = page.locator(INDICATORS_LIST_ROW(text_match)).first
+        row = page.locator(INDICATORS_LIST_ROW(text_match)).nth(nth)
         await row.wait_for(state="visible", timeout=2500)
         await row.locator(ROW_SETTINGS_BTN).first.click(timeout=1200)
         await page.wait_for_selector(INDICATORS_DIALOG, timeout=2500)
@@ -540,17 +773,28 @@ def _label_candidates(label: str):
     return LABEL_ALIASES.get(label, [label])
 
 
+def _after_label(label: str, controls: str) -> str:
+    """ラベルの後ろの兄弟（またはその中）にある入力欄。
+    "label ~ a, b" だと b がラベルに縛られず、ダイアログ内の最初の入力欄に当たってしまうので、
+    候補ごとにダイアログの前置きを外してラベルを付け直す。"""
+    out = []
+    for c in controls.split(","):
+        c = c.strip().removeprefix(f"{INDICATORS_DIALOG} ")
+        out += [f"{PARAM_LABEL(label)} ~ {c}", f"{PARAM_LABEL(label)} ~ * {c}"]
+    return ", ".join(out)
+
+
 async def _set_numeric(page, label: str, value):
     for lbl in _label_candidates(label):
         try:
-            cand = page.locator(f"{PARAM_LABEL(lbl)} ~ {PARAM_NUM_INPUT}").first
+            cand = page.locator(_after_label(lbl, PARAM_NUM_INPUT)).first
             await cand.wait_for(state="visible", timeout=1000)
             await cand.fill(str(value))
             return True
         except Exception:
             # text/contenteditable fallback
             try:
-                cand = page.locator(f"{PARAM_LABEL(lbl)} ~ {PARAM_TEXT_INPUT}").first
+                cand = page.locator(_after_label(lbl, PARAM_TEXT_INPUT)).first
                 await cand.wait_for(state="visible", timeout=800)
                 await cand.click()
                 await cand.fill(str(value))
@@ -578,13 +822,13 @@ async def _set_select(page, label: str, option_text: str):
 async def _read_numeric(page, label: str):
     for lbl in _label_candidates(label):
         try:
-            cand = page.locator(f"{PARAM_LABEL(lbl)} ~ {PARAM_NUM_INPUT}").first
+            cand = page.locator(_after_label(lbl, PARAM_NUM_INPUT)).first
             await cand.wait_for(state="visible", timeout=800)
             val = await cand.input_value()
             return val
         except Exception:
             try:
-                cand = page.locator(f"{PARAM_LABEL(lbl)} ~ {PARAM_TEXT_INPUT}").first
+                cand = page.locator(_after_label(lbl, PARAM_TEXT_INPUT)).first
                 await cand.wait_for(state="visible", timeout=800)
                 val = await cand.input_value()
                 return val
@@ -606,9 +850,14 @@ async def verify_indicator_params(page, expected: dict) -> dict[str, bool | None
     return ok_map
 
 
-async def apply_indicator_params(page, indicator_match: str, params: dict) -> dict:
-    """設定ダイアログで params を適用。例: {'Length': 200, 'Source': 'close'}"""
-    opened = await open_settings_for_indicator(page, indicator_match)
+@traced()
+async def apply_indicator_params(
+    page, indicator_match: str, params: dict, nth: int = 0, verify: str = "reopen"
+) -> dict:
+    """設定ダイアログで params を適用。例: {'Length': 200, 'Source': 'close'}
+    verify: 'reopen'（OK後に開き直して検証） | 'inline'（OK前に同じダイアログで検証） | 'none'
+    """
+    opened = await open_settings_for_indicator(page, indicator_match, nth=nth)
     if not opened:
         return {"ok": False, "reason": "settings_open_failed"}
 
@@ -631,6 +880,11 @@ async def apply_indicator_params(page, indicator_match: str, params: dict) -> di
 
         applied[k] = bool(ok)
 
+    # 同じダイアログ上で読み戻す（開き直し1回分を省略）
+    verified = {}
+    if verify == "inline":
+        verified = await verify_indicator_params(page, params)
+
     # OK/Apply
     try:
         await page.locator(SETTINGS_OK).first.click(timeout=1200)
@@ -641,8 +895,9 @@ async def apply_indicator_params(page, indicator_match: str, params: dict) -> di
             pass
 
     # 再オープンして検証（簡易）
-    verified = {}
-    if await open_settings_for_indicator(page, indicator_match):
+    if verify == "reopen" and await open_settings_for_indicator(
+        page, indicator_match, nth=nth
+    ):
         verified = await verify_indicator_params(page, params)
         # 閉じる
         try:
@@ -656,6 +911,7 @@ async def apply_indicator_params(page, indicator_match: str, params: dict) -> di
     return {"ok": True, "applied": applied, "verified": verified}
 
 
+@traced()
 async def add_indicator(page, name: str, params: dict | None = None):
     """インジケーターを追加（冪等化対応）"""
     # 既存チェック
@@ -664,7 +920,9 @@ async def add_indicator(page, name: str, params: dict | None = None):
         return True
 
     # 1) ボタン複数候補から開く
-    opened = await _safe_click_any(page, INDICATOR_BUTTONS, timeout=4000)
+    opened = await RESOLVER.click(
+        page, "indicator_button", INDICATOR_BUTTONS, timeout_ms=4000
+    )
     if not opened:
         # 画面が狭いとメニュー化されることがある → コマンドパレット風メニュー経由 (Cmd/Ctrl + K) ※環境で効かない場合はスキップ
         try:
@@ -676,14 +934,16 @@ async def add_indicator(page, name: str, params: dict | None = None):
     try:
         await page.wait_for_selector(INDICATOR_SEARCH, timeout=5000)
         await page.fill(INDICATOR_SEARCH, name)
+        before = await legend_count(page)
         await page.keyboard.press("Enter")
-        await page.wait_for_timeout(500)
+        # 凡例に項目が増えたら追加完了
+        await wait_legend_count(page, before + 1, timeout_ms=3000, fallback_ms=500)
         # Escで閉じる
         await page.keyboard.press("Escape")
 
         # 3) パラメータ適用（指定がある場合）
         if params:
-            await page.wait_for_timeout(1000)  # 描画待機
+            await wait_canvas_settled(page, fallback_ms=1000)  # 描画待機
             await apply_indicator_params(page, name, params)
 
         return True
@@ -693,12 +953,7 @@ async def add_indicator(page, name: str, params: dict | None = None):
 
 async def open_indicators_dialog(page):
     # 開く
-    for sel in INDICATOR_BUTTONS:
-        try:
-            await page.locator(sel).first.click(timeout=2000)
-            break
-        except Exception:
-            continue
+    await RESOLVER.click(page, "indicator_button", INDICATOR_BUTTONS, timeout_ms=2000)
     # 検索欄 or ダイアログの出現を確認
     try:
         await page.wait_for_selector(INDICATOR_SEARCH, timeout=3000)
@@ -712,6 +967,118 @@ async def open_indicators_dialog(page):
             return False
 
 
+async def _legend_texts(page) -> list[str]:
+    """凡例（チャート上のインジ一覧）のテキストを1回のDOMクエリで取る。"""
+    snap = await take_snapshot(page)
+    return [it["text"] for it in snap["legend"]]
+
+
+@traced()
+async def add_indicators_bulk(page, names: list[str]) -> dict:
+    """インジダイアログを1回だけ開き、チャートに無いものをまとめて追加する。
+    同名インジ（EMA×2など）は個数で比較する。"""
+    legend = await _legend_texts(page)
+    used = [False] * len(legend)
+    missing, existing = [], []
+    for name in names:
+        hit = next(
+            (
+                i
+                for i, t in enumerate(legend)
+                if not used[i] and _legend_matches(name, t)
+            ),
+            None,
+        )
+        if hit is None:
+            missing.append(name)
+        else:
+            used[hit] = True
+            existing.append(name)
+
+    added, failed = [], []
+    if missing:
+        if not await open_indicators_dialog(page):
+            return {"added": [], "existing": existing, "failed": missing}
+        for name in missing:
+            try:
+                before = await legend_count(page)
+                await page.fill(INDICATOR_SEARCH, name, timeout=3000)
+                await page.keyboard.press("Enter")
+                await wait_legend_count(
+                    page, before + 1, timeout_ms=3000, fallback_ms=500
+                )
+                added.append(name)
+            except Exception:
+                failed.append(name)
+        # Escで閉じる（セッション終了）
+        with contextlib.suppress(Exception):
+            await page.keyboard.press("Escape")
+
+    return {"added": added, "existing": existing, "failed": failed}
+
+
+async def remove_indicator_at(page, index: int) -> bool:
+    """凡例の index 番目のインジを行の×ボタンで削除する。"""
+    try:
+        before = await legend_count(page)
+        row = page.locator(LEGEND_ITEM).nth(index)
+        await row.hover(timeout=1500)
+        await row.locator(LEGEND_DELETE_BTN).first.click(timeout=1200)
+        await wait_legend_count(page, before - 1, timeout_ms=2000, fallback_ms=250)
+        return True
+    except Exception:
+        return False
+
+
+def diff_chart_state(legend: list[str], entries, skip_params: bool = False) -> dict:
+    """凡例テキスト一覧とプリセット entries [(name, params)] を突き合わせる。
+    keep: [(entry, legend)] そのまま / retune: [(entry, legend, {変える値})] /
+    add: [entry] 追加が必要 / remove: [legend] プリセットに無い。index で返す。"""
+    # 長い名前から判定（"Exponential Moving Average" を "Moving Average" と取り違えない）
+    names = sorted({n for n, _ in entries}, key=len, reverse=True)
+    ident = [next((n for n in names if _legend_matches(n, t)), None) for t in legend]
+    used = [False] * len(legend)
+
+    def take(name, params, exact: bool):
+        for j, t in enumerate(legend):
+            if used[j] or ident[j] != name:
+                continue
+            if exact and not skip_params and _param_delta(name, params, t):
+                continue
+            used[j] = True
+            return j
+        return None
+
+    keep, pending = [], []
+    for i, (name, params) in enumerate(entries):
+        j = take(name, params, exact=True)
+        if j is None:
+            pending.append(i)
+        else:
+            keep.append((i, j))
+
+    retune, add = [], []
+    for i in pending:
+        name, params = entries[i]
+        j = take(name, params, exact=False)
+        if j is None:
+            add.append(i)
+        else:
+            retune.append((i, j, _param_delta(name, params, legend[j])))
+
+    remove = [j for j in range(len(legend)) if not used[j]]
+    return {"keep": keep, "retune": retune, "add": add, "remove": remove}
+
+
+def _param_delta(name: str, params: dict, legend_text: str) -> dict:
+    current = _legend_params(name, legend_text)
+    return {k: v for k, v in params.items() if not _param_equal(v, current.get(k))}
+
+
+def _legend_label(text: str) -> str:
+    return (text or "").split("\n")[0].strip()
+
+
 async def remove_all_indicators_on_chart(page):
     """ダイアログの 'Indicators on chart' タブからゴミ箱/×で既存インジを削除（最大10回）。"""
     opened = await open_indicators_dialog(page)
@@ -721,7 +1088,7 @@ async def remove_all_indicators_on_chart(page):
     # タブ切り替え（ある場合のみ）
     try:
         await page.locator(INDICATORS_ON_CHART_TAB).first.click(timeout=1500)
-        await page.wait_for_timeout(400)
+        await _wait_dialog_list(page, 400)
     except Exception:
         pass  # タブが無いUIもある
 
@@ -744,31 +1111,157 @@ async def remove_all_indicators_on_chart(page):
     return removed_any
 
 
+@traced()
 async def apply_preset(
     page,
     preset_name: str,
     clear_existing: bool = False,
     preset_path: str = "automation/indicators.json",
     skip_params: bool = False,
+    bulk: bool = True,
 ):
-    """indicators.jsonからプリセットを読み、順次 add_indicator()（冪等化対応）。"""
-    # 事前にキャンバスへフォーカス
-    await page.click("canvas", force=True)
-
-    # 既存インジ削除オプション
-    if clear_existing:
-        _ = await remove_all_indicators_on_chart(page)
-
+    """indicators.jsonからプリセットを読み、インジを追加（冪等化対応）。
+    bulk=True: 凡例の現在の構成/値とプリセットの差分だけを削除・追加（ダイアログ1回）・
+               設定変更し、結果の diff に kept/removed/added/retuned を返す
+    bulk=False: 従来どおり（clear_existing なら全削除→）1件ずつ add_indicator()
+    """
     # プリセット読込
     path = Path(preset_path)
     if not path.exists():
         raise FileNotFoundError(f"preset file not found: {preset_path}")
-    data = json.loads(path.read_text(encoding="utf-8"))
+    data = _load_presets(str(path), path.stat().st_mtime)
     preset = data.get(preset_name)
     if not preset:
         raise ValueError(f"preset not found: {preset_name}")
-
     inds = preset.get("indicators", [])
+
+    if bulk:
+        res = await _apply_preset_diff(page, inds, clear_existing, skip_params)
+        added = res["added"]
+    else:
+        # 事前にキャンバスへフォーカス
+        await page.click("canvas", force=True)
+        # 既存インジ削除オプション
+        if clear_existing:
+            _ = await remove_all_indicators_on_chart(page)
+        added = await _apply_preset_sequential(page, inds, skip_params)
+        res = {"added": added}
+
+    # 重いレイアウトの場合は描画待機
+    if len(added) > 2:
+        await wait_canvas_settled(page, fallback_ms=1000)
+
+    return {"preset": preset_name, **res, "requested": inds}
+
+
+@functools.lru_cache(maxsize=4)
+def _load_presets(path: str, mtime: float) -> dict:
+    # mtime をキーに含めるので indicators.json を書き換えれば読み直す
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+async def _apply_preset_diff(page, inds, clear_existing: bool, skip_params: bool):
+    """凡例の現在値とプリセットを比べ、違う分だけ削除/追加/設定変更する。
+    同じプリセットを温まったページに再適用した場合は凡例を1回読むだけで終わる。"""
+    entries = _preset_entries(inds)
+    legend = await _legend_texts(page)
+    d = diff_chart_state(legend, entries, skip_params)
+    diff = {
+        "kept": [entries[i][0] for i, _ in d["keep"]],
+        "removed": [],
+        "added": [],
+        "retuned": [],
+        "failed": [],
+    }
+    to_remove = d["remove"] if clear_existing else []
+    if not (to_remove or d["add"] or (d["retune"] and not skip_params)):
+        return {"added": [], "diff": {**diff, "noop": True}}
+
+    await page.click("canvas", force=True)
+
+    # 1) プリセットに無いものを後ろから1件ずつ削除（だめなら従来の全削除→全追加）
+    for j in sorted(to_remove, reverse=True):
+        if not await remove_indicator_at(page, j):
+            print("[WARN] per-item remove failed; falling back to full re-apply")
+            await remove_all_indicators_on_chart(page)
+            added = await _apply_preset_bulk(page, inds, skip_params)
+            return {"added": added, "diff": {**diff, "fallback": True, "noop": False}}
+        diff["removed"].append(_legend_label(legend[j]))
+
+    # 2) 足りないもの（同名は個数で比較）をダイアログ1回で追加
+    if d["add"]:
+        res = await add_indicators_bulk(page, [name for name, _ in entries])
+        diff["added"], diff["failed"] = res["added"], res["failed"]
+        for name in res["failed"]:
+            print(f"[WARN] failed to add indicator: {name}")
+
+    # 3) 凡例を読み直し、値が違うものだけ該当パラメータを設定
+    if not skip_params and (d["retune"] or diff["added"]):
+        if diff["added"]:
+            await wait_canvas_settled(page, fallback_ms=1000)
+        legend = await _legend_texts(page)
+        for i, j, delta in diff_chart_state(legend, entries)["retune"]:
+            name = entries[i][0]
+            nth = sum(1 for t in legend[:j] if _legend_matches(name, t))
+            r = await apply_indicator_params(
+                page, name, delta, nth=nth, verify="inline"
+            )
+            if not r.get("ok"):
+                print(f"[WARN] failed to apply params for {name}: {r}")
+            diff["retuned"].append(
+                {"name": name, "nth": nth, "params": delta, "ok": bool(r.get("ok"))}
+            )
+
+    return {"added": diff["added"], "diff": {**diff, "noop": False}}
+
+
+def _preset_entries(inds) -> list[tuple[str, dict]]:
+    # item は "Volume" のような str or {"name": "...", "params": {...}}
+    out = []
+    for item in inds:
+        if isinstance(item, str):
+            out.append((item, {}))
+        else:
+            out.append((item.get("name"), item.get("params", {}) or {}))
+    return out
+
+
+async def _apply_preset_bulk(page, inds, skip_params: bool) -> list[str]:
+    entries = _preset_entries(inds)
+    res = await add_indicators_bulk(page, [name for name, _ in entries])
+    for name in res["failed"]:
+        print(f"[WARN] failed to add indicator: {name}")
+
+    # 追加に失敗した分（同名は個数）を除いて、プリセット順に並べる
+    failed = list(res["failed"])
+    ok_entries = []
+    for name, params in entries:
+        if name in failed:
+            failed.remove(name)
+        else:
+            ok_entries.append((name, params))
+
+    # パラメータはまとめて1パス（設定ダイアログは1インジにつき1回）
+    if ok_entries and not skip_params:
+        await wait_canvas_settled(page, fallback_ms=1000)
+    seen: dict[str, int] = {}
+    for name, params in ok_entries:
+        nth = seen.get(name, 0)
+        seen[name] = nth + 1
+        if not params:
+            continue
+        if skip_params:
+            print(f"[SKIP] parameter tuning skipped for {name} (fast mode)")
+            continue
+        r = await apply_indicator_params(
+            page, name, params, nth=nth, verify="inline"
+        )
+        if not r.get("ok"):
+            print(f"[WARN] failed to apply params for {name}: {r}")
+    return [name for name, _ in ok_entries]
+
+
+async def _apply_preset_sequential(page, inds, skip_params: bool) -> list[str]:
     added = []
     for item in inds:
         # item は "Volume" のような str or {"name": "...", "params": {...}}
@@ -794,12 +1287,7 @@ async def apply_preset(
                     print(f"[SKIP] parameter tuning skipped for {name} (fast mode)")
             else:
                 print(f"[WARN] failed to add indicator: {name}")
-
-    # 重いレイアウトの場合は描画待機
-    if len(added) > 2:
-        await page.wait_for_timeout(1000)
-
-    return {"preset": preset_name, "added": added, "requested": inds}
+    return added
 
 
 async def close_popups(page):
@@ -817,6 +1305,7 @@ import time
 from contextlib import suppress
 
 
+@traced()
 async def close_popups_fast(page, budget_ms: int | None = None):
     """並列・時間上限つきの高速ポップアップ排除。
     budget_ms: 上限ミリ秒（環境変数 POPUP_BUDGET_MS が優先）
@@ -873,15 +1362,6 @@ async def close_popups_fast(page, budget_ms: int | None = None):
             return True
         return False
 
-    async def _healthy():
-        try:
-            await page.locator("div[data-name='pane'] canvas").first.wait_for(
-                state="visible", timeout=200
-            )
-            return True
-        except Exception:
-            return False
-
     tasks = [
         asyncio.create_task(_click_prefer_buttons()),
         asyncio.create_task(_click_close_icon()),
@@ -897,12 +1377,53 @@ async def close_popups_fast(page, budget_ms: int | None = None):
     finally:
         pass
 
-    ok = await _healthy()
+    ok = await chart_healthy(page)
     elapsed = int((time.perf_counter() - start) * 1000)
     print(f"[close_popups_fast] {elapsed}ms, healthy={ok}")
     return ok
 
 
+async def chart_healthy(page, timeout: int = 200) -> bool:
+    """チャートのpane canvasが見えているか（タブの生存確認）。"""
+    if page.is_closed():
+        return False
+    try:
+        await page.locator("div[data-name='pane'] canvas").first.wait_for(
+            state="visible", timeout=timeout
+        )
+        return True
+    except Exception:
+        return False
+
+
+REMOVE_DRAWINGS_BUTTONS = [
+    "[data-name='removeAllDrawingTools']",
+    "button[aria-label*='Remove Drawings']",
+    "button[aria-label*='Remove objects']",
+    "button[aria-label*='描画を削除']",
+]
+REMOVE_DRAWINGS_MENU = (
+    "div[role='menu'] div:has-text('Remove'), div[role='menu'] div:has-text('削除')"
+)
+
+
+@traced()
+async def remove_all_drawings(page) -> bool:
+    """左ツールバーのゴミ箱から描画を全削除（ページ再利用前の掃除用）。"""
+    with contextlib.suppress(Exception):
+        await page.keyboard.press("Escape")
+    for sel in REMOVE_DRAWINGS_BUTTONS:
+        try:
+            await page.locator(sel).first.click(timeout=800, force=True)
+        except Exception:
+            continue
+        # ドロップダウン形式のUIではメニュー項目を選ぶ
+        with contextlib.suppress(Exception):
+            await page.locator(REMOVE_DRAWINGS_MENU).first.click(timeout=800)
+        return True
+    return False
+
+
 async def go_back_if_navigated(page, original_url: str):
     """URLが変化してしまった場合に素早く戻る（軽量待機）。"""
     if page.url != original_url:
@@ -957,135 +1478,37 @@ async def _focus_plot_canvas(page):
             await target.click(force=True)
 
 
-async def _price_to_y_converter(page):
+async def _price_to_y_converter(page, fallback_range=None, box=None):
     """
-    価格軸のラベル（テキストとy座標）を複数取って、線形近似で price->y の変換関数を返す。
+    価格軸ラベルから当てはめた軸モデル（ページ単位でキャッシュ）の price->y 関数を返す。
+    ラベルが取れない場合は fallback_range=(high, low) をプロット領域の20%〜80%に置く仮変換。
     """
-    # 価格軸のラベルを探す（複数のセレクタを試行）
-    price_selectors = [
-        "div[data-name='price-axis'] span",
-        "div[data-name='price-axis'] div",
-        "div[class*='price'] span",
-        "div[class*='price'] div",
-        "div[class*='axis'] span",
-        "div[class*='axis'] div",
-    ]
-
-    labs = None
-    for selector in price_selectors:
-        try:
-            labs = page.locator(selector)
-            count = await labs.count()
-            if count > 0:
-                break
-        except Exception:
-            continue
-
-    if not labs:
-        # フォールバック：簡易な価格→ピクセル変換
-        def simple_price_to_y(price: float) -> float:
-            # 画面の高さを基準に簡易変換
-            viewport = page.viewport_size
-            if not viewport:
-                return 100.0
-            # 価格範囲を仮定（USDJPYの場合）
-            min_price = 140.0
-            max_price = 160.0
-            if price < min_price:
-                price = min_price
-            elif price > max_price:
-                price = max_price
-            # 線形変換
-            ratio = (price - min_price) / (max_price - min_price)
-            return viewport["height"] * (1 - ratio)  # 上から下へ
-
-        return simple_price_to_y
-
-    count = await labs.count()
-    pts = []
-    for i in range(min(count, 12)):
-        el = labs.nth(i)
-        txt = (await el.text_content() or "").strip()
-        # 通貨記号など除去して float へ
-        m = re.search(r"[-+]?\d+(\.\d+)?", txt.replace(",", ""))
-        if not m:
-            continue
-        val = float(m.group(0))
-        box = await el.bounding_box()
-        if not box:
-            continue
-        y = box["y"]
-        pts.append((val, y))
-
-    if len(pts) < 2:
-        # フォールバック：簡易な価格→ピクセル変換
-        def simple_price_to_y(price: float) -> float:
-            # 画面の高さを基準に簡易変換
-            viewport = page.viewport_size
-            if not viewport:
-                return 100.0
-            # 価格範囲を仮定（USDJPYの場合）
-            min_price = 140.0
-            max_price = 160.0
-            if price < min_price:
-                price = min_price
-            elif price > max_price:
-                price = max_price
-            # 線形変換
-            ratio = (price - min_price) / (max_price - min_price)
-            return viewport["height"] * (1 - ratio)  # 上から下へ
-
-        return simple_price_to_y
-
-    # 近似：y = a*price + b（最小二乗）。numpyが無ければ両端2点で近似。
-    try:
-        import numpy as np  # type: ignore
-
-        P = np.array([[p, 1.0] for p, _ in pts])
-        Y = np.array([y for _, y in pts])
-        a, b = np.linalg.lstsq(P, Y, rcond=None)[0]
-
-        def price_to_y(price: float) -> float:
-            return float(a * price + b)
-
-    except Exception:
-        # フォールバック：最初と最後の点から直線近似
-        p1, y1 = pts[0]
-        p2, y2 = pts[-1]
-        a = (y2 - y1) / (p2 - p1) if p2 != p1 else 0.0
-        b = y1 - a * p1
-
-        def price_to_y(price: float) -> float:
-            return float(a * price + b)
-
-    return price_to_y
-
-
+    model = await get_axis_model(page)
+    if model is None:
+        if fallback_range is None:
+            raise RuntimeError("price axis labels not found")
+        high, low = fallback_range
+        if box is None:
+            box = await _get_plot_bbox(page)
+        print("[WARN] 価格軸ラベルを取得できず、指定レンジで仮の価格→y変換を使用")
+        model = AxisModel.from_range(high, low, box)
+    return model.price_to_y
+
+
+@traced()
 async def _select_fib_tool(page, debug=False):
     """Fibツールを選択"""
     if debug:
         print("🔧 フィボナッチツール選択開始...")
 
     # 1) 描画ツールバーを表示させる（左側のツールバーアイコンをクリック）
-    drawing_toolbar_selectors = [
-        "button[aria-label*='Drawing']",
-        "button[aria-label*='Tools']",
-        "button[data-name*='drawing']",
-        "button[data-name*='toolbar']",
-        "[data-name='drawing-toolbar-button']",
-        "[data-name='left-toolbar'] button",
-    ]
-
     if debug:
         print("🎨 描画ツールバー表示を試行...")
-    for sel in drawing_toolbar_selectors:
-        try:
-            await page.locator(sel).first.click(timeout=800, force=True)
-            if debug:
-                print(f"✅ 描画ツールバー表示成功: {sel}")
-            break
-        except Exception:
-            continue
+    sel = await RESOLVER.click(
+        page, "drawing_toolbar", DRAWING_TOOLBAR_BUTTONS, timeout_ms=800, force=True
+    )
+    if debug and sel:
+        print(f"✅ 描画ツールバー表示成功: {sel}")
 
     # 少し待機してツールバーが表示されるのを待つ
     await page.wait_for_timeout(500)
@@ -1100,43 +1523,34 @@ async def _select_fib_tool(page, debug=False):
         await _set_overlap_pointer_events(page, True)
     except Exception:
         pass
-    for i, sel in enumerate(FIB_TOOL_BUTTONS):
+    sel = await RESOLVER.resolve(page, "fib_tool", FIB_TOOL_BUTTONS, timeout_ms=1200)
+    if sel is not None:
+        if debug:
+            print(f"🔍 フィボツールボタン: {sel}")
+        element = page.locator(sel).first
+        with contextlib.suppress(Exception):
+            await element.scroll_into_view_if_needed(timeout=500)
+        # 強制クリック試行 → ダメならJS clickで貫通
         try:
-            if debug:
-                print(f"🔍 フィボツールボタン試行 {i+1}: {sel}")
-
-            # 要素の存在を確認
-            element = page.locator(sel).first
-            await element.wait_for(state="attached", timeout=1200)
-            with contextlib.suppress(Exception):
-                await element.scroll_into_view_if_needed(timeout=500)
-            await element.wait_for(state="visible", timeout=1200)
-            # 強制クリック試行 → ダメならJS clickで貫通
-            try:
-                await element.click(timeout=1800, force=True)
-            except Exception:
-                _ = await _js_force_click(page, sel, timeout_ms=1200)
+            await element.click(timeout=1800, force=True)
+        except Exception:
+            _ = await _js_force_click(page, sel, timeout_ms=1200)
 
-            if debug:
-                print("✅ フィボツールボタンクリック成功")
+        if debug:
+            print("✅ フィボツールボタンクリック成功")
 
-            # ツール選択が成功したかを確認 + Alt+F 追撃
-            for _ in range(3):
-                with contextlib.suppress(Exception):
-                    await page.keyboard.press("Alt+F")
-                await page.wait_for_timeout(120)
-            if debug:
-                print("🔍 フィボツール選択状態を確認...")
+        # Alt+F 追撃（ボタンがグループを開くだけだった場合の保険）
+        with contextlib.suppress(Exception):
+            await page.keyboard.press("Alt+F")
+        await page.wait_for_timeout(120)
+        if debug:
             with contextlib.suppress(Exception):
                 await page.screenshot(
                     path="automation/screenshots/debug_fib_selected.png"
                 )
-
-            return True
-        except Exception as e:
-            if debug:
-                print(f"❌ フィボツールボタン {i+1} 失敗: {e}")
-            continue
+        return True
+    if debug:
+        print("❌ フィボツールボタンが見つからない")
 
     # 3) フォールバック：Alt+F
     if debug:
@@ -1198,6 +1612,7 @@ async def _select_fib_tool(page, debug=False):
             await _toggle_overlap_hidden(page, False)
 
 
+@traced()
 async def draw_fibo_by_prices(
     page,
     high: float,
@@ -1218,7 +1633,7 @@ async def draw_fibo_by_prices(
         pass
 
     box = await _get_plot_bbox(page)
-    price_to_y = await _price_to_y_converter(page)
+    price_to_y = await _price_to_y_converter(page, fallback_range=(high, low), box=box)
 
     # x座標：プロット領域の内側に割合で配置
     x1 = box["x"] + box["width"] * x_ratio_start
@@ -1236,7 +1651,7 @@ async def draw_fibo_by_prices(
         end = (x2, y_high)
 
     # フィボツール選択前にページを安定させ、キャンバスへ明示フォーカス
-    await page.wait_for_timeout(400)
+    await wait_canvas_settled(page, fallback_ms=400)
     # 余計なフローティングUIを閉じる
     with contextlib.suppress(Exception):
         await page.keyboard.press("Escape")
@@ -1255,6 +1670,7 @@ async def draw_fibo_by_prices(
 
     # 描画（少しの待機を入れてからドラッグ）
     await page.wait_for_timeout(150)
+    before = await canvas_hash(page)
     print("🖱️ マウス移動開始...")
     # キャンバス直上でのヒットを確実化するため、JSで canvas に mousedown/mousemove/mouseup を発火
     try:
@@ -1293,18 +1709,19 @@ async def draw_fibo_by_prices(
                 await _set_overlap_pointer_events(page, False)
 
     # もし反応がなければ微妙にずらしてもう一度ドラッグ
-    await page.wait_for_timeout(300)
-    try:
-        await page.mouse.move(start[0] + 6, start[1] + 6)
-        await page.mouse.down()
-        await page.mouse.move(end[0] + 6, end[1] + 6, steps=12)
-        await page.mouse.up()
-    except Exception:
-        pass
+    drawn = await wait_drawing_added(page, before, timeout_ms=800, fallback_ms=300)
+    if not drawn:
+        try:
+            await page.mouse.move(start[0] + 6, start[1] + 6)
+            await page.mouse.down()
+            await page.mouse.move(end[0] + 6, end[1] + 6, steps=12)
+            await page.mouse.up()
+        except Exception:
+            pass
 
-    # フィボナッチ描画の安定化待機（ESCキー無し）
-    print("⏳ フィボナッチ描画の安定化を待機中...")
-    await page.wait_for_timeout(2000)  # 2秒待機
+        # フィボナッチ描画の安定化待機（ESCキー無し）
+        print("⏳ フィボナッチ描画の安定化を待機中...")
+        await wait_drawing_added(page, before, timeout_ms=2000, fallback_ms=2000)
 
     # ESCキーは使わない（フィボナッチが消去される可能性があるため）
     print("⚠️ フィボナッチ保持のためツール選択は維持...")
@@ -1313,6 +1730,7 @@ async def draw_fibo_by_prices(
     return {"from": start, "to": end, "high": high, "low": low}
 
 
+@traced()
 async def draw_fibo_quick(page, direction: str = "high_to_low"):
     """
     データ無しの簡易版：画面上部20%⇔下部80%を結んでフィボを引く。
@@ -1340,6 +1758,7 @@ async def draw_fibo_quick(page, direction: str = "high_to_low"):
     ok = await _select_fib_tool(page, debug=True)
     if not ok:
         raise RuntimeError("Fib tool could not be selected")
+    before = await canvas_hash(page)
     try:
         await page.evaluate(
             """
@@ -1372,17 +1791,17 @@ async def draw_fibo_quick(page, direction: str = "high_to_low"):
             with contextlib.suppress(Exception):
                 await _set_overlap_pointer_events(page, False)
 
-    # 念のため2回目の微調整ドラッグ
-    await page.wait_for_timeout(250)
-    with contextlib.suppress(Exception):
-        await page.mouse.move(start[0] + 6, start[1] + 6)
-        await page.mouse.down()
-        await page.mouse.move(end[0] + 6, end[1] + 6, steps=12)
-        await page.mouse.up()
+    # 反応がなければ2回目の微調整ドラッグ
+    if not await wait_drawing_added(page, before, timeout_ms=800, fallback_ms=250):
+        with contextlib.suppress(Exception):
+            await page.mouse.move(start[0] + 6, start[1] + 6)
+            await page.mouse.down()
+            await page.mouse.move(end[0] + 6, end[1] + 6, steps=12)
+            await page.mouse.up()
 
-    # フィボナッチ描画の安定化待機（短縮）
-    print("⏳ クイックフィボ描画の安定化を待機中...")
-    await page.wait_for_timeout(400)
+        # フィボナッチ描画の安定化待機（短縮）
+        print("⏳ クイックフィボ描画の安定化を待機中...")
+        await wait_drawing_added(page, before, timeout_ms=1000, fallback_ms=400)
 
     # ロック優先手順
     locked = False
@@ -1398,7 +1817,7 @@ async def draw_fibo_quick(page, direction: str = "high_to_low"):
         with contextlib.suppress(Exception):
             locked = await _lock_all_drawings_toggle(page, enable=True)
     print("🔒 ロック状態:", locked)
-    await page.wait_for_timeout(400)
+    await wait_canvas_settled(page, timeout_ms=800, fallback_ms=400)
 
     # オーバーレイを元に戻す
     with contextlib.suppress(Exception):
@@ -1414,19 +1833,198 @@ async def draw_fibo_quick(page, direction: str = "high_to_low"):
     return {"from": start, "to": end}
 
 
-async def screenshot(page, outfile: str):
-    """ポップアップを閉じてからスクショを撮る"""
+# 描画ツールのホットキー（TradingView既定）
+DRAWING_HOTKEYS = {
+    "fib": {"key": "f", "code": "KeyF", "alt": True, "shift": False},
+    "hline": {"key": "h", "code": "KeyH", "alt": True, "shift": False},
+    "rect": {"key": "R", "code": "KeyR", "alt": True, "shift": True},
+}
+
+# 1回の evaluate でツール選択（ホットキー）→マウス操作を全描画ぶん流す
+DRAW_BATCH_JS = r"""
+(ops) => {
+  const target = () => document.activeElement || document.body;
+  function key(k) {
+    const init = { key: k.key, code: k.code, altKey: !!k.alt, shiftKey: !!k.shift,
+                   bubbles: true, cancelable: true };
+    target().dispatchEvent(new KeyboardEvent('keydown', init));
+    target().dispatchEvent(new KeyboardEvent('keyup', init));
+  }
+  function fire(type, x, y) {
+    const el = document.elementFromPoint(x, y);
+    if (!el) return false;
+    el.dispatchEvent(new MouseEvent(type, {bubbles:true, cancelable:true, clientX:x, clientY:y}));
+    return true;
+  }
+  let n = 0;
+  for (const op of ops) {
+    key(op.hotkey);
+    const [a, b] = [op.points[0], op.points[op.points.length - 1]];
+    if (!fire('mousedown', a[0], a[1])) continue;
+    if (op.points.length > 1) fire('mousemove', b[0], b[1]);
+    fire('mouseup', b[0], b[1]);
+    n += 1;
+  }
+  return n;
+}
+"""
+
+
+# 種類ごとの必須価格フィールド（タプルは別名。先に見つかった方を使う）
+DRAWING_PRICE_FIELDS = {
+    "fib": (("high",), ("low",)),
+    "hline": (("price",),),
+    "rect": (("top", "high"), ("bottom", "low")),
+}
+
+
+def _price_field(d: dict, names: tuple):
+    return next((d[n] for n in names if d.get(n) is not None), None)
+
+
+def _drawing_prices(d: dict) -> list[float]:
+    return [
+        float(_price_field(d, names))
+        for names in DRAWING_PRICE_FIELDS[d.get("type", "fib")]
+    ]
+
+
+def _validate_drawing(i: int, d: dict):
+    kind = d.get("type", "fib")
+    if kind not in DRAWING_HOTKEYS:
+        raise ValueError(f"drawings[{i}]: unknown drawing type: {d.get('type')}")
+    for names in DRAWING_PRICE_FIELDS[kind]:
+        v = _price_field(d, names)
+        if v is None:
+            raise ValueError(f"drawings[{i}] ({kind}): missing field {'/'.join(names)}")
+        try:
+            float(v)
+        except (TypeError, ValueError):
+            raise ValueError(
+                f"drawings[{i}] ({kind}): {'/'.join(names)} is not a number: {v!r}"
+            ) from None
+
+
+@traced()
+async def draw_levels(page, drawings: list[dict], settle_ms: int = 2000) -> dict:
+    """
+    複数の描画（fib / hline / rect）を1回のツール操作パスでまとめて描く。
+      fib:   {"type":"fib", "high", "low", "direction"?, "x_ratio_start"?, "x_ratio_end"?}
+      hline: {"type":"hline", "price", "x_ratio"?}
+      rect:  {"type":"rect", "top"|"high", "bottom"|"low", "x_ratio_start"?, "x_ratio_end"?}
+    座標は軸モデルで一括計算し、合成マウスイベントは1回の page.evaluate で送る。
+    安定化待機は最後に1回だけ。
+    """
+    for i, d in enumerate(drawings):
+        _validate_drawing(i, d)
+    if not drawings:
+        return {"count": 0, "drawings": []}
+
+    with contextlib.suppress(Exception):
+        await page.add_style_tag(content=ANTI_POPUP_CSS)
+        await close_popups_fast(page)
+
+    box = await _get_plot_bbox(page)
+
+    # 価格→y を全描画ぶん一括変換
+    per = [_drawing_prices(d) for d in drawings]
+    flat = [p for ps in per for p in ps]
+    model = await get_axis_model(page)
+    if model is None:
+        print("[WARN] 価格軸ラベルを取得できず、描画レンジ全体で仮の価格→y変換を使用")
+        model = AxisModel.from_range(max(flat), min(flat), box)
+    ys = [float(y) for y in model.price_to_y(flat)]
+
+    ops, out, i = [], [], 0
+    for d, ps in zip(drawings, per):
+        kind = d.get("type", "fib")
+        yv = ys[i : i + len(ps)]
+        i += len(ps)
+        if kind == "hline":
+            x = box["x"] + box["width"] * float(d.get("x_ratio", 0.5))
+            points = [(x, yv[0])]
+        else:
+            x1 = box["x"] + box["width"] * float(d.get("x_ratio_start", 0.25))
+            x2 = box["x"] + box["width"] * float(d.get("x_ratio_end", 0.75))
+            y_a, y_b = yv[0], yv[1]
+            if kind == "fib" and d.get("direction", "high_to_low") != "high_to_low":
+                y_a, y_b = y_b, y_a
+            points = [(x1, y_a), (x2, y_b)]
+        ops.append({"hotkey": DRAWING_HOTKEYS[kind], "points": points})
+        out.append({"type": kind, "prices": ps, "points": points})
+
+    # 前処理: 余計なUIを閉じてからキャンバスへフォーカス
+    with contextlib.suppress(Exception):
+        await page.keyboard.press("Escape")
+    await _focus_plot_canvas(page)
+    with contextlib.suppress(Exception):
+        await _toggle_overlap_hidden(page, True)
+
+    before = await canvas_hash(page)
+    dispatched = 0
+    try:
+        dispatched = await page.evaluate(DRAW_BATCH_JS, ops)
+    except Exception as e:
+        print(f"[draw_levels] batch dispatch failed: {e}")
+
+    drawn = await wait_drawing_added(page, before, timeout_ms=1000)
+    if not drawn:
+        # 合成キーが効かないUI向け：Playwright のキー/マウスで1件ずつ描く
+        print("[draw_levels] batched events ignored, falling back to real input")
+        for op in ops:
+            hk = op["hotkey"]
+            combo = ("Alt+" if hk["alt"] else "") + ("Shift+" if hk["shift"] else "")
+            with contextlib.suppress(Exception):
+                await page.keyboard.press(combo + hk["code"].replace("Key", ""))
+                (sx, sy), (ex, ey) = op["points"][0], op["points"][-1]
+                await page.mouse.move(sx, sy)
+                await page.mouse.down()
+                if len(op["points"]) > 1:
+                    await page.mouse.move(ex, ey, steps=12)
+                await page.mouse.up()
+        drawn = await wait_drawing_added(
+            page, before, timeout_ms=settle_ms, fallback_ms=settle_ms
+        )
+
+    with contextlib.suppress(Exception):
+        await _toggle_overlap_hidden(page, False)
+
+    return {
+        "count": len(ops),
+        "dispatched": dispatched,
+        "drawn": drawn,
+        "axis": model.to_dict(),
+        "drawings": out,
+    }
+
+
+async def capture_bytes(page, opts: ImageOptions | None = None, annotated=False):
+    """opts に従って page.screenshot() の bytes を撮る（clip="plot" はプロット領域だけ）。
+    後で注釈や WebP/縮小をかける場合は劣化の無い PNG で撮る。"""
+    opts = opts or ImageOptions()
+    clip = opts.clip
+    if clip == "plot":
+        clip = await _get_plot_bbox(page)
+    kwargs = opts.playwright_kwargs(clip, overlay=annotated or None)
+    return await page.screenshot(**kwargs)
+
+
+@traced()
+async def screenshot(
+    page, outfile: str | None = None, opts: ImageOptions | None = None, annotated=False
+):
+    """ポップアップを閉じてからスクショを撮る。outfile=None なら画像の bytes を返す"""
     # スクショ直前の軽いクリーンのみ（強いCSS注入は避ける）
     with contextlib.suppress(Exception):
         await page.keyboard.press("Escape")
-        await page.wait_for_timeout(80)
 
-    # 少し待機してからスクショ
-    await page.wait_for_timeout(250)
+    # 描画が落ち着いてからスクショ
+    await wait_canvas_settled(page, timeout_ms=1000, fallback_ms=330)
 
-    os.makedirs(os.path.dirname(outfile), exist_ok=True)
-    await page.screenshot(path=outfile)
-    return outfile
+    data = await capture_bytes(page, opts, annotated)
+    if outfile is None:
+        return data
+    return await finish_capture(data, outfile, opts=opts)
 
 
 async def capture(
@@ -1436,59 +2034,91 @@ async def capture(
     outfile="automation/screenshots/shot.png",
     headless=True,
     annotate: dict | None = None,
+    browser=None,
+    opts: ImageOptions | None = None,
 ):
+    """browser を渡すと既存ブラウザを使い回す（常駐サーバー用）。無ければ都度起動。
+    注釈はブラウザ（context）を閉じた後にエグゼキュータで焼き込む。
+    outfile=None ならファイルを書かずに最終画像の bytes を返す。
+    opts で形式（png/jpeg/webp）・品質・縮小・切り抜き・サムネイルを指定できる。"""
     indicators = indicators or []
+    annotated = bool(overlay_from_annotate(annotate))
+    if browser is not None:
+        png = await _capture_in_browser(
+            browser, symbol, tf, indicators, opts, annotated
+        )
+        return await finish_capture(png, outfile, annotate, opts)
+
     async with async_playwright() as p:
         # デバッグ快適化：ヘッドフル時はslow_mo追加
         browser_options = {"headless": headless}
         if not headless:
             browser_options["slow_mo"] = 150
 
-        browser = await p.chromium.launch(**browser_options)
-        context = await browser.new_context(
-            storage_state=TV_STORAGE if os.path.exists(TV_STORAGE) else None,
-            viewport={"width": 1600, "height": 900},
-        )
-        page = await open_chart(context, symbol)
+        browser = await launch_browser(p, **browser_options)
+        try:
+            png = await _capture_in_browser(
+                browser, symbol, tf, indicators, opts, annotated
+            )
+        finally:
+            await browser.close()
+    return await finish_capture(png, outfile, annotate, opts)
 
-        # 既定タイムアウトを引き上げ
-        page.set_default_timeout(45000)
 
-        await set_timeframe(page, tf)
-
-        for ind in indicators:
-            ok = await add_indicator(page, ind)
-            if not ok:
-                print(f"[WARN] インジ追加失敗: {ind}")
+async def _capture_in_browser(
+    browser, symbol, tf, indicators, opts=None, annotated=False
+) -> bytes:
+    context = await SESSION.new_context(
+        browser, viewport={"width": 1600, "height": 900}
+    )
+    try:
+        page = await open_chart(context, symbol, tf)
 
-        path = await screenshot(page, outfile)
+        # 既定タイムアウトを引き上げ
+        page.set_default_timeout(45000)
 
-        # ▼ 注釈（QuietTrapなど）— 画像後処理
-        if annotate and annotate.get("quiet_trap"):
-            try:
-                from annotate import annotate_quiet_trap
-            except Exception:
-                # 明示パスでimport（python実行ディレクトリ差分対策）
-                import importlib.util, sys
-
-                ap = Path(__file__).parent / "annotate.py"
-                spec = importlib.util.spec_from_file_location("annotate", str(ap))
-                if spec is None or spec.loader is None:
-                    raise ImportError("failed to load annotate module spec")
-                mod = importlib.util.module_from_spec(spec)
-                sys.modules["annotate"] = mod
-                spec.loader.exec_module(mod)
-                annotate_quiet_trap = getattr(mod, "annotate_quiet_trap")
-
-            qt = annotate["quiet_trap"]
-            side = qt.get("side", "sell")
-            score = float(qt.get("score", 0.0))
-            notes = qt.get("notes", [])
-            footer = qt.get("footer")
-            annotate_quiet_trap(outfile, side, score, notes, footer)
-
-        await browser.close()
-        return path
+        return await shoot_on_page(page, indicators, opts, annotated)
+    finally:
+        await context.close()
+
+
+async def shoot_on_page(
+    page, indicators=None, opts: ImageOptions | None = None, annotated=False
+) -> bytes:
+    """シンボル/時間足を設定済みのページでインジ追加→スクショ（bytes）。
+    annotated=True なら後で注釈を焼き込む前提で劣化の無い PNG で撮る。"""
+    for ind in indicators or []:
+        ok = await add_indicator(page, ind)
+        if not ok:
+            print(f"[WARN] インジ追加失敗: {ind}")
+    return await screenshot(page, None, opts, annotated)
+
+
+async def finish_capture(
+    png: bytes | memoryview,
+    outfile: str | None = None,
+    annotate=None,
+    opts: ImageOptions | None = None,
+) -> str | bytes:
+    """スクショ bytes の後処理（注釈→縮小→エンコード→サムネイル）→ outfile へ1回だけ
+    書き出してパスを返す（形式に合わせて拡張子を変える。サムネイルは *.thumb.*）。
+    outfile=None ならディスクに触らず最終画像の bytes を返す。ページは不要。"""
+    opts = opts or ImageOptions()
+    data, thumb = await postprocess_async(png, opts, overlay_from_annotate(annotate))
+    if outfile is None:
+        return data
+    path = opts.with_ext(outfile)
+    await save_image(data, path)
+    if thumb is not None:
+        await save_image(thumb, thumbnail_path(path))
+    return path
+
+
+async def save_image(data: bytes | memoryview, outfile: str) -> str:
+    """bytes をファイルへ書く（書き込みはイベントループの外）。"""
+    os.makedirs(os.path.dirname(outfile) or ".", exist_ok=True)
+    await asyncio.to_thread(Path(outfile).write_bytes, data)
+    return outfile
 
 
 if __name__ == "__main__":
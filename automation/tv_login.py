@@ -10,11 +10,16 @@ TV_STORAGE = os.getenv("TV_STORAGE", "automation/storage_state.json")
 TV_URL = "https://www.tradingview.com/"
 
 
-async def main():
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)  # 初回はFalse
-        ctx = await browser.new_context()
-        page = await ctx.new_page()
+async def login(ctx, email: str | None = None, password: str | None = None) -> dict:
+    """context 上でメールログインし、storage_state(dict) を返す（保存は呼び出し側）。
+    automation/session.py のバックグラウンド更新からも使う。"""
+    email = email or TV_EMAIL
+    password = password or TV_PASSWORD
+    if not email or not password:
+        raise RuntimeError("TV_EMAIL / TV_PASSWORD are not set")
+
+    page = await ctx.new_page()
+    try:
         await page.goto(TV_URL, wait_until="domcontentloaded")
 
         # 画面右上のログイン
@@ -22,12 +27,22 @@ async def main():
         # "Email"ログインを選ぶ（UI変更に合わせて調整）
         await page.get_by_role("button", name="Email").click()
 
-        await page.get_by_placeholder("Email").fill(TV_EMAIL)
-        await page.get_by_placeholder("Password").fill(TV_PASSWORD)
+        await page.get_by_placeholder("Email").fill(email)
+        await page.get_by_placeholder("Password").fill(password)
         await page.get_by_role("button", name="Sign in").click()
 
         # 2FAがある場合は待機/手動入力 or 別実装
         await page.wait_for_load_state("networkidle")
+        return await ctx.storage_state()
+    finally:
+        await page.close()
+
+
+async def main():
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=False)  # 初回はFalse
+        ctx = await browser.new_context()
+        await login(ctx)
         await ctx.storage_state(path=TV_STORAGE)
         print(f"[OK] Saved storage to: {TV_STORAGE}")
         await browser.close()
@@ -0,0 +1,848 @@
+// Fake TradingView: 自動化が依存する DOM 契約（automation/selectors.py / tv_controller.py）
+// だけを再現したオフライン用のチャートアプリ。ベンチマークとE2E確認用。
+//
+// URL パラメータ:
+//   symbol / interval  初期シンボル・時間足（TradingView の /chart/?symbol=...&interval=60 と同じ）
+//
+// window.TradingViewApi.activeChart() の setSymbol / setResolution / symbol / resolution も再現する。
+//   latency            シンボル/時間足切替時のデータ読込の遅延ms（既定 250）
+//   popups             1 ならロード後にランダムなポップアップを出す（既定 1）
+//   indicators         1 なら保存レイアウト相当のインジ（Volume, MA 9）で開始（既定 1）
+//   seed               乱数シード（チャート形状・ポップアップ）
+(() => {
+  'use strict';
+
+  const qs = new URLSearchParams(location.search);
+  const LATENCY = Number(qs.get('latency') || 250);
+  const POPUPS = qs.get('popups') !== '0';
+  const SEED = qs.get('seed') || '1';
+
+  const BASE_PRICE = {
+    USDJPY: 150, EURUSD: 1.08, GBPUSD: 1.27, AUDUSD: 0.66, EURJPY: 162,
+    GBPJPY: 190, XAUUSD: 2400, BTCUSD: 60000, SPX: 5400,
+  };
+  const INTERVALS = ['1m', '5m', '15m', '30m', '1h', '4h', 'D', 'W'];
+  const VOL = {
+    '1m': 0.0004, '5m': 0.0008, '15m': 0.0012, '30m': 0.0016, '1h': 0.002, '4h': 0.004, D: 0.008, W: 0.016,
+  };
+  const TYPED_INTERVAL = {
+    1: '1m', 5: '5m', 15: '15m', 30: '30m', 60: '1h', 240: '4h', D: 'D', '1D': 'D', W: 'W', '1W': 'W',
+  };
+  const RESOLUTION = { '1m': '1', '5m': '5', '15m': '15', '30m': '30', '1h': '60', '4h': '240', D: '1D', W: '1W' };
+  const toInterval = (v) => {
+    v = String(v || '').trim();
+    return INTERVALS.includes(v) ? v : TYPED_INTERVAL[v.toUpperCase()];
+  };
+  const N_BARS = 150;
+  const BAR_SPAN = 0.92; // 右端 8% は余白（最新足はここに入る）
+
+  const DEFS = {
+    'Moving Average': { short: 'MA', overlay: true, params: { Length: 9, Source: 'close' } },
+    'Exponential Moving Average': { short: 'EMA', overlay: true, params: { Length: 9, Source: 'close' } },
+    'Bollinger Bands': { short: 'BB', overlay: true, params: { Length: 20, Source: 'close' } },
+    'Relative Strength Index': { short: 'RSI', params: { Length: 14, Source: 'close' } },
+    Volume: { short: 'Vol', params: {} },
+    MACD: {
+      short: 'MACD',
+      params: { 'Fast Length': 12, 'Slow Length': 26, Source: 'close', 'Signal Smoothing': 9 },
+    },
+  };
+  const SOURCES = ['open', 'high', 'low', 'close', 'hl2', 'hlc3', 'ohlc4'];
+  const COLORS = ['#2962ff', '#ff9800', '#e91e63', '#00bcd4', '#9c27b0', '#8bc34a'];
+
+  const $ = (sel, root = document) => root.querySelector(sel);
+  const el = (tag, attrs = {}, ...kids) => {
+    const e = document.createElement(tag);
+    for (const [k, v] of Object.entries(attrs)) {
+      if (k === 'text') e.textContent = v;
+      else if (k.startsWith('on')) e.addEventListener(k.slice(2), v);
+      else e.setAttribute(k, v);
+    }
+    for (const k of kids) e.append(k);
+    return e;
+  };
+  // 自動化側の ANTI_POPUP_CSS は [role=dialog] を !important で隠すため、
+  // 本物のUIダイアログはインライン !important で表示する（TradingView 本体と同じ状況）
+  const forceShow = (e, display = 'flex') => {
+    e.style.setProperty('display', display, 'important');
+    e.style.setProperty('visibility', 'visible', 'important');
+    e.style.setProperty('pointer-events', 'auto', 'important');
+    return e;
+  };
+
+  function rng(seedStr) {
+    let h = 1779033703 ^ seedStr.length;
+    for (let i = 0; i < seedStr.length; i++) {
+      h = Math.imul(h ^ seedStr.charCodeAt(i), 3432918353);
+      h = (h << 13) | (h >>> 19);
+    }
+    let a = h >>> 0;
+    return () => {
+      a = (a + 0x6d2b79f5) >>> 0;
+      let t = a;
+      t = Math.imul(t ^ (t >>> 15), t | 1);
+      t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+      return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+    };
+  }
+
+  // ---------------------------------------------------------------- state
+  const state = {
+    symbol: (qs.get('symbol') || 'USDJPY').toUpperCase().split(':').pop(),
+    tf: toInterval(qs.get('interval')) || '1h',
+    bars: [],
+    lo: 0,
+    hi: 1,
+    indicators: [],
+    drawings: [],
+    tool: null,
+    pending: null,
+    dragStart: null,
+    selected: null,
+    lockAll: false,
+    loading: true,
+    nextId: 1,
+  };
+
+  const pane = $("div[data-name='pane']");
+  const mainCanvas = $("canvas[data-name='pane-main']");
+  const topCanvas = $("canvas[data-name='pane-top']");
+  const legendBox = $("div[data-name='legend']");
+  const axisBox = $("div[data-name='price-axis']");
+  const headerSymbol = $('#header-toolbar-symbol-search');
+
+  function genBars() {
+    const r = rng(`${state.symbol}|${state.tf}|${SEED}`);
+    const vol = VOL[state.tf] || 0.002;
+    let prev = BASE_PRICE[state.symbol] || 100;
+    const bars = [];
+    for (let i = 0; i < N_BARS; i++) {
+      const o = prev;
+      const c = o * (1 + (r() - 0.5) * vol * 2);
+      const h = Math.max(o, c) * (1 + r() * vol * 0.6);
+      const l = Math.min(o, c) * (1 - r() * vol * 0.6);
+      bars.push({ o, h, l, c, v: 100 + r() * 900 });
+      prev = c;
+    }
+    state.bars = bars;
+    const hi = Math.max(...bars.map((b) => b.h));
+    const lo = Math.min(...bars.map((b) => b.l));
+    const pad = (hi - lo) * 0.08;
+    state.hi = hi + pad;
+    state.lo = lo - pad;
+  }
+
+  // ---------------------------------------------------------------- geometry
+  const size = () => ({ w: pane.clientWidth, h: pane.clientHeight });
+  const barW = () => (size().w * BAR_SPAN) / N_BARS;
+  const xOfBar = (i) => (i + 0.5) * barW();
+  const barOfX = (x) => x / barW() - 0.5;
+  const yOfPrice = (p) => ((state.hi - p) / (state.hi - state.lo)) * size().h;
+  const priceOfY = (y) => state.hi - (y / size().h) * (state.hi - state.lo);
+
+  function fitCanvas(c) {
+    const dpr = window.devicePixelRatio || 1;
+    const { w, h } = size();
+    if (c.width !== Math.round(w * dpr) || c.height !== Math.round(h * dpr)) {
+      c.width = Math.round(w * dpr);
+      c.height = Math.round(h * dpr);
+    }
+    const ctx = c.getContext('2d');
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    return ctx;
+  }
+
+  function niceStep(range) {
+    const raw = range / 10;
+    const mag = Math.pow(10, Math.floor(Math.log10(raw)));
+    for (const m of [1, 2, 2.5, 5, 10]) if (m * mag >= raw) return m * mag;
+    return 10 * mag;
+  }
+
+  // ---------------------------------------------------------------- indicators
+  function source(b, s) {
+    switch (s) {
+      case 'open': return b.o;
+      case 'high': return b.h;
+      case 'low': return b.l;
+      case 'hl2': return (b.h + b.l) / 2;
+      case 'hlc3': return (b.h + b.l + b.c) / 3;
+      case 'ohlc4': return (b.o + b.h + b.l + b.c) / 4;
+      default: return b.c;
+    }
+  }
+  function sma(xs, n) {
+    const out = [];
+    let sum = 0;
+    for (let i = 0; i < xs.length; i++) {
+      sum += xs[i];
+      if (i >= n) sum -= xs[i - n];
+      out.push(i >= n - 1 ? sum / n : null);
+    }
+    return out;
+  }
+  function ema(xs, n) {
+    const k = 2 / (n + 1);
+    const out = [];
+    let e = xs[0];
+    for (let i = 0; i < xs.length; i++) {
+      e = i ? xs[i] * k + e * (1 - k) : xs[0];
+      out.push(i >= n - 1 ? e : null);
+    }
+    return out;
+  }
+  function rsi(xs, n) {
+    const out = [null];
+    let up = 0, dn = 0;
+    for (let i = 1; i < xs.length; i++) {
+      const d = xs[i] - xs[i - 1];
+      up = (up * (n - 1) + Math.max(d, 0)) / n;
+      dn = (dn * (n - 1) + Math.max(-d, 0)) / n;
+      out.push(i >= n ? 100 - 100 / (1 + up / (dn || 1e-9)) : null);
+    }
+    return out;
+  }
+
+  function legendValues(ind) {
+    return Object.values(ind.params).join(' ');
+  }
+
+  // ---------------------------------------------------------------- render
+  function renderMain() {
+    const ctx = fitCanvas(mainCanvas);
+    const { w, h } = size();
+    ctx.fillStyle = '#131722';
+    ctx.fillRect(0, 0, w, h);
+
+    ctx.strokeStyle = '#1e222d';
+    ctx.lineWidth = 1;
+    const step = niceStep(state.hi - state.lo);
+    for (let v = Math.ceil(state.lo / step) * step; v <= state.hi; v += step) {
+      const y = Math.round(yOfPrice(v)) + 0.5;
+      ctx.beginPath();
+      ctx.moveTo(0, y);
+      ctx.lineTo(w, y);
+      ctx.stroke();
+    }
+
+    if (state.loading) {
+      // 読込中スピナー（canvas が変化し続けるので「安定」とは判定されない）
+      const t = performance.now() / 120;
+      ctx.strokeStyle = '#2962ff';
+      ctx.lineWidth = 4;
+      ctx.beginPath();
+      ctx.arc(w / 2, h / 2, 18, t, t + Math.PI * 1.4);
+      ctx.stroke();
+      return;
+    }
+
+    const bw = barW();
+    const closes = state.bars.map((b) => b.c);
+    state.indicators.forEach((ind, k) => {
+      const color = COLORS[k % COLORS.length];
+      if (ind.name === 'Volume') {
+        const vmax = Math.max(...state.bars.map((b) => b.v));
+        state.bars.forEach((b, i) => {
+          const vh = (b.v / vmax) * h * 0.15;
+          ctx.fillStyle = b.c >= b.o ? 'rgba(38,166,154,.35)' : 'rgba(239,83,80,.35)';
+          ctx.fillRect(xOfBar(i) - bw * 0.35, h - vh, bw * 0.7, vh);
+        });
+        return;
+      }
+      let series;
+      let toY = yOfPrice;
+      const xs = state.bars.map((b) => source(b, ind.params.Source));
+      if (ind.name === 'Moving Average' || ind.name === 'Bollinger Bands') {
+        series = sma(xs, Number(ind.params.Length) || 9);
+      } else if (ind.name === 'Exponential Moving Average') {
+        series = ema(xs, Number(ind.params.Length) || 9);
+      } else if (ind.name === 'Relative Strength Index') {
+        series = rsi(xs, Number(ind.params.Length) || 14);
+        toY = (v) => h - 4 - (v / 100) * h * 0.18;
+      } else if (ind.name === 'MACD') {
+        const f = ema(closes, Number(ind.params['Fast Length']) || 12);
+        const s = ema(closes, Number(ind.params['Slow Length']) || 26);
+        series = f.map((v, i) => (v === null || s[i] === null ? null : v - s[i]));
+        const m = Math.max(...series.map((v) => Math.abs(v || 0))) || 1;
+        toY = (v) => h - 4 - h * 0.09 - (v / m) * h * 0.09;
+      }
+      ctx.strokeStyle = color;
+      ctx.lineWidth = 1.5;
+      ctx.beginPath();
+      let started = false;
+      series.forEach((v, i) => {
+        if (v === null) return;
+        const x = xOfBar(i), y = toY(v);
+        if (started) ctx.lineTo(x, y);
+        else { ctx.moveTo(x, y); started = true; }
+      });
+      ctx.stroke();
+    });
+
+    state.bars.forEach((b, i) => {
+      const x = xOfBar(i);
+      const up = b.c >= b.o;
+      ctx.strokeStyle = ctx.fillStyle = up ? '#26a69a' : '#ef5350';
+      ctx.beginPath();
+      ctx.moveTo(Math.round(x) + 0.5, yOfPrice(b.h));
+      ctx.lineTo(Math.round(x) + 0.5, yOfPrice(b.l));
+      ctx.stroke();
+      const y1 = yOfPrice(Math.max(b.o, b.c)), y2 = yOfPrice(Math.min(b.o, b.c));
+      ctx.fillRect(x - bw * 0.35, y1, bw * 0.7, Math.max(1, y2 - y1));
+    });
+  }
+
+  const FIB_LEVELS = [0, 0.236, 0.382, 0.5, 0.618, 0.786, 1];
+  function renderTop() {
+    const ctx = fitCanvas(topCanvas);
+    const { w, h } = size();
+    ctx.clearRect(0, 0, w, h);
+    for (const d of state.drawings) {
+      const sel = d === state.selected;
+      const x1 = xOfBar(d.p1.bar), y1 = yOfPrice(d.p1.price);
+      ctx.lineWidth = sel ? 2 : 1;
+      if (d.type === 'hline') {
+        ctx.strokeStyle = '#f7525f';
+        ctx.beginPath();
+        ctx.moveTo(0, y1);
+        ctx.lineTo(w, y1);
+        ctx.stroke();
+        continue;
+      }
+      const x2 = xOfBar(d.p2.bar), y2 = yOfPrice(d.p2.price);
+      if (d.type === 'rect') {
+        ctx.strokeStyle = '#9c27b0';
+        ctx.fillStyle = 'rgba(156,39,176,.15)';
+        ctx.fillRect(Math.min(x1, x2), Math.min(y1, y2), Math.abs(x2 - x1), Math.abs(y2 - y1));
+        ctx.strokeRect(Math.min(x1, x2), Math.min(y1, y2), Math.abs(x2 - x1), Math.abs(y2 - y1));
+        continue;
+      }
+      // fib: p1 が 1.0、p2 が 0.0
+      ctx.font = '11px sans-serif';
+      for (const lv of FIB_LEVELS) {
+        const price = d.p2.price + (d.p1.price - d.p2.price) * lv;
+        const y = yOfPrice(price);
+        ctx.strokeStyle = ctx.fillStyle = lv === 0.5 ? '#4caf50' : '#787b86';
+        ctx.beginPath();
+        ctx.moveTo(Math.min(x1, x2), y);
+        ctx.lineTo(Math.max(x1, x2), y);
+        ctx.stroke();
+        ctx.fillText(`${lv} (${price.toFixed(decimals())})`, Math.min(x1, x2) + 2, y - 2);
+      }
+      ctx.setLineDash([4, 4]);
+      ctx.beginPath();
+      ctx.moveTo(x1, y1);
+      ctx.lineTo(x2, y2);
+      ctx.stroke();
+      ctx.setLineDash([]);
+    }
+  }
+
+  function places(step) {
+    let p = 0;
+    while (p < 8 && Math.abs(Math.round(step * 10 ** p) - step * 10 ** p) > 1e-9) p++;
+    return p;
+  }
+  const decimals = () => places(niceStep(state.hi - state.lo)) + 1;
+
+  function renderAxis() {
+    axisBox.textContent = '';
+    if (state.loading) return;
+    const step = niceStep(state.hi - state.lo);
+    const p = places(step);
+    for (let v = Math.ceil(state.lo / step) * step; v <= state.hi; v += step) {
+      const s = el('span', { text: v.toFixed(p) });
+      s.style.top = `${yOfPrice(v) - 7}px`;
+      axisBox.append(s);
+    }
+  }
+
+  function renderLegend() {
+    legendBox.textContent = '';
+    state.indicators.forEach((ind) => {
+      legendBox.append(
+        el(
+          'div',
+          { 'data-name': 'legend-source-item' },
+          el('div', { 'data-name': 'legend-source-title', text: DEFS[ind.name].short }),
+          el('div', { class: 'values', text: legendValues(ind) }),
+          el('button', {
+            'data-name': 'legend-settings-action',
+            'aria-label': 'Settings',
+            text: '⚙',
+            onclick: () => openSettings(ind),
+          }),
+          el('button', {
+            'data-name': 'legend-delete-action',
+            'aria-label': 'Delete',
+            text: '✕',
+            onclick: () => removeIndicator(ind),
+          }),
+        ),
+      );
+    });
+  }
+
+  function renderHeader() {
+    headerSymbol.textContent = state.symbol;
+    for (const b of document.querySelectorAll('#header-toolbar-intervals button')) {
+      const active = b.getAttribute('aria-label') === state.tf;
+      b.style.background = active ? '#2962ff' : '';
+      b.setAttribute('aria-pressed', String(active));
+    }
+    const last = state.bars[state.bars.length - 1];
+    document.title = last && !state.loading
+      ? `${state.symbol} ${last.c.toFixed(decimals())} — Fake TradingView`
+      : `${state.symbol} — Fake TradingView`;
+  }
+
+  function renderAll() {
+    renderMain();
+    renderTop();
+    renderAxis();
+    renderLegend();
+    renderHeader();
+    renderFloating();
+  }
+
+  // ---------------------------------------------------------------- data loading
+  let loadTimer = null;
+  let spinTimer = null;
+  function load() {
+    state.loading = true;
+    state.selected = null;
+    renderAll();
+    clearTimeout(loadTimer);
+    clearInterval(spinTimer);
+    spinTimer = setInterval(renderMain, 60);
+    loadTimer = setTimeout(() => {
+      clearInterval(spinTimer);
+      genBars();
+      state.loading = false;
+      renderAll();
+    }, LATENCY);
+  }
+
+  function setSymbol(sym) {
+    sym = String(sym || '').trim().toUpperCase().split(':').pop();
+    if (!sym || sym === state.symbol) return;
+    state.symbol = sym;
+    headerSymbol.textContent = sym;
+    load();
+  }
+
+  function setInterval_(tf) {
+    if (!INTERVALS.includes(tf) || tf === state.tf) return;
+    state.tf = tf;
+    load();
+  }
+
+  // ---------------------------------------------------------------- in-page API（TradingViewApi 相当）
+  function whenLoaded(cb) {
+    if (typeof cb !== 'function') return;
+    const poll = () => (state.loading ? setTimeout(poll, 20) : cb());
+    poll();
+  }
+  const chartApi = {
+    symbol: () => state.symbol,
+    resolution: () => RESOLUTION[state.tf],
+    setSymbol: (sym, cb) => { setSymbol(sym); whenLoaded(cb); },
+    setResolution: (res, cb) => {
+      const tf = toInterval(res);
+      if (tf) setInterval_(tf);
+      whenLoaded(cb);
+    },
+  };
+  window.TradingViewApi = { activeChart: () => chartApi, chart: () => chartApi };
+
+  // 最新足のティック（右端のみ変化する）
+  setInterval(() => {
+    if (state.loading || !state.bars.length) return;
+    const b = state.bars[state.bars.length - 1];
+    b.c = b.l + (b.h - b.l) * Math.random();
+    renderMain();
+    renderHeader();
+  }, 1000);
+
+  // ---------------------------------------------------------------- dialogs
+  const dialogs = [];
+  function openDialog(node) {
+    closeDialogs();
+    node.classList.add('ucar-dialog');
+    node.setAttribute('role', 'dialog');
+    forceShow(node);
+    document.body.append(node);
+    dialogs.push(node);
+    return node;
+  }
+  function closeTopDialog() {
+    const d = dialogs.pop();
+    if (d) d.remove();
+    return !!d;
+  }
+  function closeDialogs() {
+    while (closeTopDialog());
+  }
+
+  function openSymbolSearch(prefill = '') {
+    const input = el('input', {
+      'data-name': 'symbol-search-input',
+      'aria-label': 'Symbol Search',
+      placeholder: 'Symbol, ISIN, or CUSIP',
+    });
+    input.value = prefill;
+    input.addEventListener('keydown', (e) => {
+      if (e.key === 'Enter') {
+        e.preventDefault();
+        const v = input.value;
+        closeDialogs();
+        setSymbol(v);
+      }
+    });
+    openDialog(el('div', { 'data-name': 'symbol-search-dialog' }, el('div', { text: 'Symbol Search' }), input));
+    input.focus();
+  }
+
+  function openIntervalDialog(prefill) {
+    const input = el('input', { 'data-name': 'change-interval-input' });
+    input.value = prefill;
+    input.addEventListener('keydown', (e) => {
+      if (e.key === 'Enter') {
+        e.preventDefault();
+        const tf = TYPED_INTERVAL[input.value.trim().toUpperCase()];
+        closeDialogs();
+        if (tf) setInterval_(tf);
+      }
+    });
+    openDialog(el('div', { 'data-name': 'change-interval-dialog' }, el('div', { text: 'Change interval' }), input));
+    input.focus();
+  }
+
+  function bestDef(q) {
+    q = q.trim().toLowerCase();
+    const names = Object.keys(DEFS);
+    return (
+      names.find((n) => n.toLowerCase() === q) ||
+      names.find((n) => DEFS[n].short.toLowerCase() === q) ||
+      names.find((n) => n.toLowerCase().startsWith(q)) ||
+      names.find((n) => n.toLowerCase().includes(q))
+    );
+  }
+
+  function addIndicator(name) {
+    const def = DEFS[name];
+    if (!def) return;
+    // 追加は少し遅れて凡例に反映される（スクリプトのコンパイル相当）
+    setTimeout(() => {
+      state.indicators.push({ id: state.nextId++, name, params: { ...def.params } });
+      renderAll();
+      refreshIndicatorsDialog();
+    }, 60);
+  }
+
+  function removeIndicator(ind) {
+    state.indicators = state.indicators.filter((x) => x !== ind);
+    renderAll();
+    refreshIndicatorsDialog();
+  }
+
+  let indDialog = null;
+  function openIndicatorsDialog() {
+    const input = el('input', { 'data-role': 'search', placeholder: 'Search' });
+    const list = el('div', { class: 'list' });
+    const tabSearch = el('button', { 'data-tab': 'search', text: 'Technicals' });
+    const tabOnChart = el('button', { 'data-tab': 'on-chart', text: 'Indicators on chart' });
+    indDialog = el(
+      'div',
+      { 'data-name': 'indicators-dialog' },
+      el('div', { class: 'tabs' }, tabSearch, tabOnChart),
+      input,
+      list,
+    );
+    indDialog.dataset.tab = 'search';
+    tabSearch.addEventListener('click', () => { indDialog.dataset.tab = 'search'; refreshIndicatorsDialog(); });
+    tabOnChart.addEventListener('click', () => { indDialog.dataset.tab = 'on-chart'; refreshIndicatorsDialog(); });
+    input.addEventListener('input', refreshIndicatorsDialog);
+    input.addEventListener('keydown', (e) => {
+      if (e.key === 'Enter') {
+        e.preventDefault();
+        const name = bestDef(input.value);
+        if (name) addIndicator(name);
+      }
+    });
+    openDialog(indDialog);
+    refreshIndicatorsDialog();
+    input.focus();
+  }
+
+  function refreshIndicatorsDialog() {
+    if (!indDialog || !indDialog.isConnected) return;
+    const list = $('.list', indDialog);
+    list.textContent = '';
+    if (indDialog.dataset.tab === 'on-chart') {
+      state.indicators.forEach((ind) => {
+        const rm = el('span', { 'data-name': 'remove', role: 'button', 'aria-label': 'Remove' });
+        rm.innerHTML = '<svg width="12" height="12" viewBox="0 0 12 12"><path d="M2 2L10 10M10 2L2 10" stroke="currentColor"/></svg>';
+        rm.addEventListener('click', (e) => { e.stopPropagation(); removeIndicator(ind); });
+        list.append(
+          el(
+            'div',
+            { role: 'listitem', class: 'item' },
+            el('span', { text: ind.name }),
+            el(
+              'span',
+              {},
+              el('button', { 'data-name': 'settings', 'aria-label': 'Settings', text: '⚙', onclick: () => openSettings(ind) }),
+              rm,
+            ),
+          ),
+        );
+      });
+      return;
+    }
+    const q = $('input', indDialog).value.trim().toLowerCase();
+    for (const name of Object.keys(DEFS)) {
+      if (q && !name.toLowerCase().includes(q) && !DEFS[name].short.toLowerCase().includes(q)) continue;
+      list.append(el('div', { class: 'item', text: name, onclick: () => addIndicator(name) }));
+    }
+  }
+
+  function openSettings(ind) {
+    const rows = [];
+    const inputs = {};
+    for (const [k, v] of Object.entries(ind.params)) {
+      if (k === 'Source') {
+        const combo = el('div', { role: 'combobox', tabindex: '0', text: v });
+        const row = el('div', { class: 'row' }, el('label', { text: k }), el('div', {}, combo));
+        combo.addEventListener('click', () => {
+          const open = $("[role='listbox']", dlg);
+          if (open) { open.remove(); return; }
+          const lb = el('div', { role: 'listbox' });
+          for (const s of SOURCES) {
+            lb.append(el('div', { role: 'option', text: s, onclick: () => { combo.textContent = s; lb.remove(); } }));
+          }
+          row.after(lb);
+        });
+        inputs[k] = () => combo.textContent;
+        rows.push(row);
+      } else {
+        const input = el('input', { type: 'text', inputmode: 'numeric' });
+        input.value = v;
+        inputs[k] = () => Number(input.value);
+        rows.push(el('div', { class: 'row' }, el('label', { text: k }), input));
+      }
+    }
+    const ok = el('button', { 'data-name': 'submit-button', text: 'OK' });
+    const cancel = el('button', { 'data-name': 'cancel-button', text: 'Cancel', onclick: closeDialogs });
+    const dlg = el(
+      'div',
+      { 'data-name': 'indicator-properties-dialog' },
+      el('div', { class: 'title', text: ind.name }),
+      ...rows,
+      el('div', { class: 'footer' }, cancel, ok),
+    );
+    ok.addEventListener('click', () => {
+      for (const [k, get] of Object.entries(inputs)) {
+        const v = get();
+        if (typeof v === 'number' && !Number.isFinite(v)) continue;
+        ind.params[k] = v;
+      }
+      closeDialogs();
+      renderAll();
+    });
+    openDialog(dlg);
+  }
+
+  // ---------------------------------------------------------------- drawings
+  let floating = null;
+  function renderFloating() {
+    if (floating) floating.remove();
+    floating = null;
+    if (!state.selected) return;
+    const d = state.selected;
+    floating = el(
+      'div',
+      { 'data-name': 'floating-toolbar' },
+      el('button', {
+        'data-name': 'lock',
+        'aria-label': d.locked ? 'Unlock' : 'Lock',
+        text: d.locked ? '🔒' : '🔓',
+        onclick: () => { d.locked = !d.locked; renderFloating(); },
+      }),
+      el('button', {
+        'data-name': 'remove',
+        'aria-label': 'Delete drawing',
+        text: '🗑',
+        onclick: () => {
+          state.drawings = state.drawings.filter((x) => x !== d);
+          state.selected = null;
+          renderAll();
+        },
+      }),
+    );
+    // ツールバーはペイン上端中央（次の描画の座標と重ならない位置）
+    const r = pane.getBoundingClientRect();
+    floating.style.left = `${r.left + r.width / 2 - 40}px`;
+    floating.style.top = `${r.top + 4}px`;
+    document.body.append(floating);
+  }
+
+  function selectTool(tool) {
+    state.tool = tool;
+    state.pending = null;
+    for (const b of document.querySelectorAll("div[data-name='drawing-toolbar'] button")) {
+      const t = { 'linetool-fib-retracement': 'fib', 'linetool-horizontal-line': 'hline', 'linetool-rectangle': 'rect' }[b.dataset.name];
+      b.classList.toggle('active', !!t && t === tool);
+    }
+  }
+
+  function panePoint(e) {
+    const r = pane.getBoundingClientRect();
+    const x = e.clientX - r.left, y = e.clientY - r.top;
+    return { x, y, bar: barOfX(x), price: priceOfY(y) };
+  }
+
+  function addDrawing(type, p1, p2) {
+    const d = { id: state.nextId++, type, p1, p2, locked: state.lockAll };
+    state.drawings.push(d);
+    state.selected = d;
+    selectTool(null);
+    renderTop();
+    renderFloating();
+  }
+
+  pane.addEventListener('mousedown', (e) => {
+    if (e.button !== 0 || state.loading) return;
+    const p = panePoint(e);
+    if (!state.tool) {
+      if (state.selected) { state.selected = null; renderTop(); renderFloating(); }
+      return;
+    }
+    if (state.tool === 'hline') { addDrawing('hline', p, p); return; }
+    state.dragStart = p;
+  });
+  pane.addEventListener('mouseup', (e) => {
+    if (e.button !== 0 || !state.tool || !state.dragStart) return;
+    const p = panePoint(e);
+    const s = state.dragStart;
+    state.dragStart = null;
+    if (Math.hypot(p.x - s.x, p.y - s.y) > 3) { addDrawing(state.tool, s, p); return; }
+    // クリック-クリック方式：1回目で始点、2回目で終点
+    if (state.pending) { addDrawing(state.tool, state.pending, p); return; }
+    state.pending = p;
+  });
+
+  // ---------------------------------------------------------------- toolbar / header
+  const intervalsBox = $('#header-toolbar-intervals');
+  for (const tf of INTERVALS) {
+    intervalsBox.append(el('button', { 'aria-label': tf, text: tf, onclick: () => setInterval_(tf) }));
+  }
+  headerSymbol.addEventListener('click', () => openSymbolSearch());
+  $("button[data-name='open-indicators-dialog']").addEventListener('click', openIndicatorsDialog);
+
+  const toolButtons = {
+    'linetool-fib-retracement': () => selectTool('fib'),
+    'linetool-horizontal-line': () => selectTool('hline'),
+    'linetool-rectangle': () => selectTool('rect'),
+    'drawing-toolbar-button': () => {},
+    'lock-all': () => { state.lockAll = !state.lockAll; state.drawings.forEach((d) => (d.locked = state.lockAll)); },
+    removeAllDrawingTools: (btn) => {
+      closeMenus();
+      const r = btn.getBoundingClientRect();
+      const menu = forceShow(el(
+        'div',
+        { role: 'menu', class: 'popup' },
+        el('div', { text: `Remove ${state.drawings.length} drawings`, onclick: () => { clearDrawings(); closeMenus(); } }),
+        el('div', { text: `Remove ${state.indicators.length} indicators`, onclick: () => { state.indicators = []; renderAll(); closeMenus(); } }),
+      ), 'block');
+      menu.style.left = `${r.right + 4}px`;
+      menu.style.top = `${r.top}px`;
+      document.body.append(menu);
+    },
+  };
+  for (const b of document.querySelectorAll("div[data-name='drawing-toolbar'] button")) {
+    b.addEventListener('click', (e) => { e.stopPropagation(); toolButtons[b.dataset.name]?.(b); });
+  }
+  function closeMenus() {
+    for (const m of document.querySelectorAll("[role='menu']")) m.remove();
+  }
+  document.addEventListener('click', (e) => {
+    if (!e.target.closest("[role='menu']")) closeMenus();
+  });
+  function clearDrawings() {
+    state.drawings = [];
+    state.selected = null;
+    renderTop();
+    renderFloating();
+  }
+
+  // ---------------------------------------------------------------- keyboard
+  document.addEventListener('keydown', (e) => {
+    const t = e.target;
+    const typing = t && (t.tagName === 'INPUT' || t.isContentEditable);
+    if (e.key === 'Escape') {
+      if (!closeTopDialog()) {
+        closeMenus();
+        selectTool(null);
+        if (state.selected) { state.selected = null; renderTop(); renderFloating(); }
+      }
+      return;
+    }
+    if (typing) return;
+    if (e.altKey && !e.ctrlKey && !e.metaKey) {
+      const tool = e.shiftKey
+        ? { KeyR: 'rect' }[e.code]
+        : { KeyF: 'fib', KeyH: 'hline' }[e.code];
+      if (tool) { e.preventDefault(); selectTool(tool); }
+      return;
+    }
+    if (e.ctrlKey || e.metaKey) return;
+    if (e.key === '/') { e.preventDefault(); openSymbolSearch(); return; }
+    if (/^[0-9]$/.test(e.key)) { e.preventDefault(); openIntervalDialog(e.key); return; }
+    if (/^[a-zA-Z]$/.test(e.key)) { e.preventDefault(); openSymbolSearch(e.key); }
+  });
+
+  // ---------------------------------------------------------------- popups
+  function popups() {
+    const r = rng(`popups|${SEED}|${Date.now() % 7}`);
+    const kinds = [
+      () => {
+        // 購読案内モーダル（ANTI_POPUP_CSS に隠される種類）
+        const m = el(
+          'div',
+          { role: 'dialog', 'data-dialog-name': 'subscription-offer', class: 'popup' },
+          el('div', { text: 'Get 30 days of Premium for free' }),
+          el('button', { text: 'No thanks', onclick: () => m.remove() }),
+        );
+        m.style.left = '40%';
+        m.style.top = '30%';
+        document.body.append(m);
+      },
+      () => {
+        // 右下トースト（CSS では隠れないのでクリックで閉じる必要がある）
+        const m = el(
+          'div',
+          { 'data-name': 'toast', class: 'popup' },
+          el('div', { text: 'New feature: Pine Script v6' }),
+          el('button', { text: 'Not now', onclick: () => m.remove() }),
+          el('button', { 'aria-label': 'close', text: '×', onclick: () => m.remove() }),
+        );
+        m.style.right = '80px';
+        m.style.bottom = '36px';
+        document.body.append(m);
+      },
+    ];
+    for (const k of kinds) {
+      if (r() < 0.6) setTimeout(k, 300 + r() * 900);
+    }
+  }
+
+  // ---------------------------------------------------------------- boot
+  if (qs.get('indicators') !== '0') {
+    state.indicators.push({ id: state.nextId++, name: 'Volume', params: {} });
+    state.indicators.push({ id: state.nextId++, name: 'Moving Average', params: { ...DEFS['Moving Average'].params } });
+  }
+  window.addEventListener('resize', renderAll);
+  load();
+  if (POPUPS) popups();
+})();
@@ -0,0 +1,56 @@
+"""オフライン用の fake TradingView（bench/fake_tv/）を localhost で配信する。
+
+    python bench/fake_tv_server.py --port 8765
+    TV_CHART_URL=http://127.0.0.1:8765/chart/ python mcp/mcp_server.py --serve
+
+/chart/ 以下のパスは index.html を返す（/chart/<layout-id>/ や ?symbol= 付きも同じ）。
+"""
+
+import argparse
+import functools
+import http.server
+import os
+import threading
+
+FAKE_TV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_tv")
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0].startswith("/chart"):
+            self.path = "/index.html"
+        return super().do_GET()
+
+    def end_headers(self):
+        self.send_header("Cache-Control", "no-store")
+        super().end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0):
+    """バックグラウンドスレッドで起動し、(server, chart_url) を返す。port=0 は空きポート。"""
+    handler = functools.partial(_Handler, directory=FAKE_TV_DIR)
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/chart/"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve the offline fake TradingView chart")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+
+    handler = functools.partial(_Handler, directory=FAKE_TV_DIR)
+    server = http.server.ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"fake TradingView: http://{args.host}:{server.server_address[1]}/chart/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
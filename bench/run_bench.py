@@ -0,0 +1,340 @@
+"""fake TradingView に対して各 MCP ツールを N 回実行し、ステップ別の p50/p95 を出す。
+
+    python bench/run_bench.py -n 5
+    python bench/run_bench.py -n 10 --tools capture_chart,draw_fibo --json bench.json
+    python bench/run_bench.py --oneshot -n 3       # 1リクエスト1プロセス（コールドスタート）
+    python bench/run_bench.py --chart-url https://www.tradingview.com/chart/   # 本番相手
+    python bench/run_bench.py -n 3 --baseline bench/baseline.json   # 基準より遅ければ失敗
+    python bench/run_bench.py -n 10 --update-baseline bench/baseline.json   # 基準を取り直す
+
+ステップ時間は各結果の timings（automation/tracing.py）から取り、同じ名前のスパンを
+ルートからのパス（"macro_quiettrap_report > apply_preset > add_indicators_bulk" など）で
+まとめ、1回の呼び出し内で複数回出たものは合計する。
+
+--baseline を渡すと、基準ファイルにあるツール（wall）とステップの p95 が
+基準 × (1 + margin) を超え、かつ差が min_delta_ms 以上なら速度の劣化として扱う。
+終了コード: 0 = OK / 1 = ツールの失敗 / 2 = 基準超え / 3 = fake サーバを起動できない
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_tv_server import start_server  # noqa: E402
+
+SERVER = [sys.executable, os.path.join("mcp", "mcp_server.py")]
+
+# 各ツールのベンチ用引数（fake TradingView の USDJPY は 150 前後）
+SCENARIOS = {
+    "capture_chart": {"symbol": "USDJPY", "tf": "1h"},
+    "tv_action": {
+        "action": "apply_preset",
+        "name": "senior_ma_cloud",
+        "symbol": "USDJPY",
+        "tf": "1h",
+        "clear_existing": True,
+    },
+    "tune_indicator": {"name": "Moving Average", "params": {"Length": 20}},
+    "draw_fibo": {
+        "mode": "prices",
+        "symbol": "USDJPY",
+        "tf": "1h",
+        "high": 150.6,
+        "low": 149.6,
+    },
+    "draw_levels": {
+        "symbol": "USDJPY",
+        "tf": "1h",
+        "drawings": [
+            {"type": "fib", "high": 150.6, "low": 149.6},
+            {"type": "hline", "price": 150.2},
+            {"type": "rect", "top": 150.4, "bottom": 149.9},
+        ],
+    },
+    "macro_quiettrap_report": {
+        "symbol": "USDJPY",
+        "tf": "1h",
+        "preset_name": "senior_ma_cloud",
+        "high": 150.6,
+        "low": 149.6,
+    },
+    "batch_macro_quiettrap_report": {
+        "items": [{"symbol": s} for s in ("USDJPY", "EURUSD", "GBPUSD", "AUDUSD")],
+        "defaults": {"tf": "1h", "preset_name": "senior_ma_cloud", "draw_fibo": False},
+        "concurrency": 2,
+    },
+}
+DEFAULT_TOOLS = [t for t in SCENARIOS if t != "batch_macro_quiettrap_report"]
+
+# 終了コード
+EXIT_FAILURES, EXIT_REGRESSION, EXIT_FIXTURE = 1, 2, 3
+# 基準ファイルに margin / min_delta_ms が無い時の既定値
+DEFAULT_MARGIN = 0.5
+DEFAULT_MIN_DELTA_MS = 200.0
+
+
+class FixtureError(RuntimeError):
+    """fake TradingView / サーバプロセスを起動できない（計測以前の失敗）。"""
+
+
+def percentile(values: list[float], q: float) -> float:
+    """線形補間のパーセンタイル（q は 0〜100）。"""
+    xs = sorted(values)
+    if not xs:
+        return 0.0
+    k = (len(xs) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def flatten(node: dict, prefix: str = "", out: dict | None = None) -> dict:
+    """timings ツリー → {パス: 合計ms}（同じパスは合計）。"""
+    out = {} if out is None else out
+    path = f"{prefix} > {node['name']}" if prefix else node["name"]
+    out[path] = out.get(path, 0.0) + float(node.get("ms", 0.0))
+    for c in node.get("children", []):
+        flatten(c, path, out)
+    return out
+
+
+def _request(i: int, tool: str) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "id": f"bench-{i}",
+        "method": "tools/call",
+        "params": {"name": tool, "arguments": SCENARIOS[tool]},
+    }
+
+
+class ServeClient:
+    """常駐モード（--serve）のサーバに1行ずつ投げる。"""
+
+    def __init__(self, env, log):
+        self.proc = subprocess.Popen(
+            SERVER + ["--serve"],
+            cwd=ROOT,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=log,
+            text=True,
+        )
+
+    def call(self, req: dict) -> dict:
+        self.proc.stdin.write(json.dumps(req) + "\n")
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("server exited")
+        return json.loads(line)
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=30)
+        except Exception:
+            self.proc.kill()
+
+
+class OneshotClient:
+    """従来の単発モード：1リクエストごとにサーバを起動する。"""
+
+    def __init__(self, env, log):
+        self.env, self.log = env, log
+
+    def call(self, req: dict) -> dict:
+        p = subprocess.run(
+            SERVER,
+            cwd=ROOT,
+            env=self.env,
+            input=json.dumps(req),
+            stdout=subprocess.PIPE,
+            stderr=self.log,
+            text=True,
+        )
+        lines = [ln for ln in p.stdout.splitlines() if ln.strip()]
+        return json.loads(lines[-1]) if lines else {"error": "no output"}
+
+    def close(self):
+        pass
+
+
+def run(args) -> dict:
+    server = None
+    chart_url = args.chart_url
+    if not chart_url:
+        try:
+            server, chart_url = start_server()
+        except OSError as e:
+            raise FixtureError(f"fake TradingView did not start: {e}") from e
+    env = {**os.environ, "TV_CHART_URL": chart_url}
+
+    log = open(args.log, "a") if args.log else subprocess.DEVNULL
+    client = (OneshotClient if args.oneshot else ServeClient)(env, log)
+
+    tools = [t.strip() for t in args.tools.split(",")] if args.tools else DEFAULT_TOOLS
+    report = {"chart_url": chart_url, "mode": "oneshot" if args.oneshot else "serve"}
+    report["tools"] = {}
+    errors = 0
+    try:
+        for tool in tools:
+            if tool not in SCENARIOS:
+                raise SystemExit(f"unknown tool: {tool}")
+            wall, steps, failures = [], defaultdict(list), []
+            for i in range(args.warmup + args.n):
+                t0 = time.perf_counter()
+                resp = client.call(_request(i, tool))
+                ms = (time.perf_counter() - t0) * 1000
+                res = resp.get("result") or {}
+                err = resp.get("error") or res.get("error")
+                if i < args.warmup:
+                    continue
+                if err or res.get("ok") is False:
+                    failures.append(str(err or res)[:200])
+                wall.append(ms)
+                if "timings" in res:
+                    for path, v in flatten(res["timings"]).items():
+                        steps[path].append(v)
+            errors += len(failures)
+            report["tools"][tool] = {
+                "n": len(wall),
+                "wall": _stats(wall),
+                "steps": {p: _stats(v) for p, v in steps.items()},
+                "failures": failures,
+            }
+            _print_tool(tool, report["tools"][tool])
+    finally:
+        client.close()
+        if server is not None:
+            server.shutdown()
+        if args.log:
+            log.close()
+    report["errors"] = errors
+    return report
+
+
+def compare(report: dict, baseline: dict) -> list[str]:
+    """基準の p95 を margin 以上（かつ min_delta_ms 以上）超えた項目の一覧。"""
+    margin = float(baseline.get("margin", DEFAULT_MARGIN))
+    min_delta = float(baseline.get("min_delta_ms", DEFAULT_MIN_DELTA_MS))
+    out = []
+    for tool, base in baseline.get("tools", {}).items():
+        cur = report["tools"].get(tool)
+        if cur is None:
+            continue
+        checks = [("wall", base.get("wall_p95"), cur["wall"]["p95"])]
+        for path, p95 in base.get("steps", {}).items():
+            if path in cur["steps"]:
+                checks.append((path, p95, cur["steps"][path]["p95"]))
+        for name, limit, p95 in checks:
+            if limit is None:
+                continue
+            if p95 > limit * (1 + margin) and p95 - limit >= min_delta:
+                out.append(
+                    f"{tool}: {name} p95 {p95:.0f}ms > baseline {limit:.0f}ms "
+                    f"+{margin:.0%}"
+                )
+    return out
+
+
+def make_baseline(report: dict, old: dict | None = None) -> dict:
+    """レポートの p95 から基準ファイルを作る（margin などの設定は旧ファイルから引き継ぐ）。"""
+    old = old or {}
+    return {
+        "margin": old.get("margin", DEFAULT_MARGIN),
+        "min_delta_ms": old.get("min_delta_ms", DEFAULT_MIN_DELTA_MS),
+        "mode": report["mode"],
+        "tools": {
+            tool: {
+                "wall_p95": r["wall"]["p95"],
+                "steps": {p: s["p95"] for p, s in r["steps"].items()},
+            }
+            for tool, r in report["tools"].items()
+            if not r["failures"]
+        },
+    }
+
+
+def _load_json(path: str) -> dict | None:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _stats(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 1),
+        "p95": round(percentile(values, 95), 1),
+        "max": round(max(values), 1) if values else 0.0,
+    }
+
+
+def _print_tool(tool: str, r: dict):
+    w = r["wall"]
+    print(f"\n== {tool}  n={r['n']}  p50={w['p50']:.0f}ms  p95={w['p95']:.0f}ms")
+    for path, s in r["steps"].items():  # 最初の呼び出しの実行順
+        depth = path.count(" > ")
+        if depth == 0:
+            continue
+        name = "  " * depth + path.rsplit(" > ", 1)[-1]
+        print(f"  {name:<52} p50={s['p50']:>8.1f}  p95={s['p95']:>8.1f}  n={s['count']}")
+    for f in r["failures"]:
+        print(f"  !! {f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark MCP tools against fake TradingView")
+    ap.add_argument("-n", type=int, default=5, help="measured runs per tool")
+    ap.add_argument("--warmup", type=int, default=1, help="unmeasured runs per tool")
+    ap.add_argument("--tools", help="comma separated tool names (default: all single tools)")
+    ap.add_argument("--oneshot", action="store_true", help="spawn the server per request")
+    ap.add_argument("--chart-url", help="chart URL to test against (default: local fake)")
+    ap.add_argument("--json", help="write the full report to this file")
+    ap.add_argument("--log", help="append server stderr to this file")
+    ap.add_argument("--baseline", help="fail when a p95 exceeds this baseline file")
+    ap.add_argument(
+        "--update-baseline", help="write this run's p95 values to this baseline file"
+    )
+    args = ap.parse_args()
+
+    try:
+        report = run(args)
+    except FixtureError as e:
+        print(f"[bench] {e}", file=sys.stderr)
+        sys.exit(EXIT_FIXTURE)
+
+    baseline = _load_json(args.baseline)
+    if args.baseline and baseline is None:
+        print(f"[bench] baseline not found: {args.baseline}", file=sys.stderr)
+    elif baseline and baseline.get("mode", report["mode"]) != report["mode"]:
+        # serve と oneshot は別物なので比べない
+        print(f"[bench] baseline is for {baseline['mode']} mode; not compared")
+        baseline = None
+    regressions = compare(report, baseline) if baseline else []
+    report["regressions"] = regressions
+    for r in regressions:
+        print(f"  !! regression: {r}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        new = make_baseline(report, _load_json(args.update_baseline))
+        with open(args.update_baseline, "w", encoding="utf-8") as f:
+            json.dump(new, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    if report["errors"]:
+        sys.exit(EXIT_FAILURES)
+    sys.exit(EXIT_REGRESSION if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,28 @@ Usage:
 
   # On Windows PowerShell, prefer file-based args to avoid quoting issues:
   python invoke_ucar.py draw_fibo --args-file .\tmp_args.json --overrides-file .\tmp_overrides.json
+
+Result cache:
+  Render tools (capture_chart, draw_fibo, draw_levels, macro_quiettrap_report) are cached
+  under cache/results/ keyed by make_cache_key() plus the current bar of `tf`, so an
+  identical request within the same bar returns the stored result and screenshot
+  without starting a browser. Range bars and unrecognised timeframes have no
+  clock-based bar and are never cached. Use --no-cache to bypass.
+  UCAR_RESULT_CACHE (dir) and UCAR_RESULT_CACHE_MB (LRU size bound, default 200).
+  Bars follow the session open in UCAR_BAR_SESSION_OFFSET ("HH:MM Area/City",
+  default "17:00 America/New_York", the FX day).
+
+Resident daemon:
+  python mcp/mcp_server.py --listen            # cache/ucar.sock (127.0.0.1:8799 on Windows)
+  When a daemon is listening on UCAR_SOCKET (or the default address), requests are sent
+  over the socket and reuse its browser; otherwise the server is spawned as before.
+  Use --no-daemon to always spawn.
+
+Batch (one connection for many requests, one JSON response per output line):
+  python invoke_ucar.py --batch jobs.jsonl     # or --batch - to read stdin
+  Each input line is {"tool": "...", "args": {...}} (also accepts "name"/"arguments").
+  Requests are pipelined (UCAR_BATCH_WINDOW in flight, default 16) and matched by id;
+  output stays in input order.
 """
 from __future__ import annotations
 
@@ -16,17 +38,53 @@ import argparse
 import hashlib
 import json
 import os
+import shutil
+import socket
 import subprocess
 import sys
 import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from datetime import time as dt_time
 from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Timeframes and daemon addresses are parsed with the server's own modules
+# (automation/intervals.py, automation/rpc_transport.py).
+# Appended, not prepended: automation/selectors.py would shadow the stdlib module.
+sys.path.append(str(Path(__file__).resolve().parent / "automation"))
+from intervals import try_parse_interval  # noqa: E402
+from rpc_transport import DEFAULT_ADDRESS, STREAM_LIMIT, parse_address  # noqa: E402
 
 REQUESTS_DIR = Path("requests")
 SERVER = [sys.executable, "mcp/mcp_server.py"]
 
+# Resident server (mcp_server.py --listen): Unix socket path or host:port
+DAEMON_ADDRESS = os.getenv("UCAR_SOCKET", DEFAULT_ADDRESS)
+DAEMON_CONNECT_TIMEOUT = 0.5
+# --batch: requests kept in flight on the connection before waiting for responses
+BATCH_WINDOW = max(1, int(os.getenv("UCAR_BATCH_WINDOW", "16")))
+
 # Keys to ignore when building the cache key (frequently changed or non-essential)
 IGNORE_KEYS = {"outfile", "headless", "id", "timestamp"}
 
+# Result cache (screenshots + metadata), LRU-bounded on disk
+RESULTS_DIR = Path(os.getenv("UCAR_RESULT_CACHE", "cache/results"))
+RESULT_CACHE_MB = float(os.getenv("UCAR_RESULT_CACHE_MB", "200"))
+# Tools whose output only depends on the arguments and the chart data (no UI side effects)
+CACHEABLE_TOOLS = {
+    "capture_chart",
+    "draw_fibo",
+    "draw_levels",
+    "macro_quiettrap_report",
+}
+# Session open that bars are aligned to ("HH:MM Area/City"); default is the FX day
+# (17:00 New York). Use e.g. "00:00 UTC" for 24h markets.
+BAR_SESSION_OFFSET = os.getenv("UCAR_BAR_SESSION_OFFSET", "17:00 America/New_York")
+# Result fields that hold output file paths (restored on a cache hit)
+RESULT_FILE_KEYS = ("file", "screenshot", "thumbnail")
+
 # Human-readable label fields to include in filename when present
 PREFERRED_LABEL_FIELDS = [
     "symbol",
@@ -84,6 +142,159 @@ def make_cache_key(tool: str, args: dict) -> str:
     return f"{label}__{h}"
 
 
+def _parse_session(spec: str):
+    """Parse "HH:MM Area/City" into (minutes after midnight, tzinfo); None if unusable."""
+    try:
+        hhmm, _, zone = spec.strip().partition(" ")
+        h, _, m = hhmm.partition(":")
+        minutes = int(h) * 60 + int(m or 0)
+        tz = ZoneInfo(zone.strip()) if zone.strip() else timezone.utc
+    except (ValueError, ZoneInfoNotFoundError):
+        return None
+    return (minutes, tz) if 0 <= minutes < 1440 else None
+
+
+def bar_bucket(tf: str, now: float | None = None) -> str | None:
+    """Identifier of the bar that contains `now` for timeframe `tf`.
+
+    Uses the same interval model as the server (automation/intervals.py). Bars are
+    aligned to the trading session (BAR_SESSION_OFFSET, FX 17:00 New York by
+    default): a session that opens in the evening belongs to the next day, days and
+    intraday bars count from the session open, weeks start on the Monday session.
+    Returns
+    None when the bar cannot be derived from the clock (range bars, unknown tf,
+    unusable BAR_SESSION_OFFSET); such requests bypass the result cache.
+    """
+    iv = try_parse_interval(tf)
+    session = _parse_session(BAR_SESSION_OFFSET)
+    if iv is None or iv.unit == "R" or session is None:
+        return None
+    open_min, tz = session
+    now = time.time() if now is None else now
+    local = datetime.fromtimestamp(now, tz)
+    evening = open_min >= 12 * 60
+    day = (local - timedelta(minutes=open_min) + timedelta(days=evening)).date()
+    if iv.unit == "M":  # calendar months of the trading day
+        return str((day.year * 12 + day.month - 1) // iv.count)
+    if iv.unit == "W":  # date.toordinal() is 1 on a Monday
+        return str((day.toordinal() - 1) // (7 * iv.count))
+    if iv.unit == "D":
+        return str(day.toordinal() // iv.count)
+    opened = datetime.combine(day - timedelta(days=evening), dt_time(), tz)
+    opened += timedelta(minutes=open_min)
+    return f"{day.toordinal()}.{int((now - opened.timestamp()) // iv.seconds)}"
+
+
+def result_cache_key(tool: str, args: dict, now: float | None = None) -> str | None:
+    bucket = bar_bucket(args.get("tf", "1h"), now)
+    if bucket is None:
+        return None
+    return f"{make_cache_key(tool, args)}__b{bucket}"
+
+
+class ResultCache:
+    """On-disk LRU of tool results: <dir>/<key>/result.json + copies of the output files.
+
+    Entries are touched on every hit and the least recently used ones are evicted
+    once the directory grows past `max_bytes`. Entries for older bars of the same
+    request are dropped as soon as a newer bar is stored.
+    """
+
+    def __init__(self, root: Path = RESULTS_DIR, max_mb: float = RESULT_CACHE_MB):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def get(self, key: str, outfile: str | None = None) -> dict | None:
+        entry = self.root / key
+        try:
+            stored = json.loads((entry / "result.json").read_text(encoding="utf-8"))
+        except Exception:
+            return None
+        result = stored.get("result") or {}
+        main_dest = None
+        for field in RESULT_FILE_KEYS:
+            src_name = stored.get("files", {}).get(field)
+            if not src_name or field not in result:
+                continue
+            dest = Path(result[field])
+            if outfile and field in ("file", "screenshot"):
+                dest = main_dest = Path(outfile).with_suffix(Path(src_name).suffix)
+            elif field == "thumbnail" and main_dest is not None:
+                # Same naming as image_output.thumbnail_path, next to the new outfile
+                dest = main_dest.with_name(f"{main_dest.stem}.thumb{main_dest.suffix}")
+            try:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(entry / src_name, dest)
+            except OSError:
+                return None  # cached file vanished; treat as a miss
+            result[field] = str(dest.resolve())
+        os.utime(entry)
+        stored["response"]["result"] = {
+            **result,
+            "cache": {
+                "hit": True,
+                "key": key,
+                "age_s": round(time.time() - stored.get("stored_at", time.time()), 1),
+            },
+        }
+        return stored["response"]
+
+    def put(self, key: str, response: dict) -> None:
+        result = response.get("result")
+        if not isinstance(result, dict) or result.get("error") or not result.get("ok"):
+            return
+        entry = self.root / key
+        tmp = self.root / f".{key}.tmp{os.getpid()}"
+        try:
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir(parents=True)
+            files = {}
+            for field in RESULT_FILE_KEYS:
+                path = result.get(field)
+                if isinstance(path, str) and os.path.isfile(path):
+                    name = f"{field}{Path(path).suffix}"
+                    shutil.copyfile(path, tmp / name)
+                    files[field] = name
+            stored = {
+                "stored_at": time.time(),
+                "response": response,
+                "result": result,
+                "files": files,
+            }
+            (tmp / "result.json").write_text(
+                json.dumps(stored, ensure_ascii=False), encoding="utf-8"
+            )
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+        except OSError as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            print(f"[cache] store failed: {e}", file=sys.stderr)
+            return
+        self._drop_older_bars(key)
+        self._evict()
+
+    def _drop_older_bars(self, key: str) -> None:
+        base = key.rsplit("__b", 1)[0]
+        for d in self.root.glob(f"{base}__b*"):
+            if d.name != key:
+                shutil.rmtree(d, ignore_errors=True)
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for d in self.root.iterdir():
+            if not d.is_dir() or d.name.startswith("."):
+                continue
+            size = sum(f.stat().st_size for f in d.iterdir() if f.is_file())
+            entries.append((d.stat().st_mtime, size, d))
+            total += size
+        for _, size, d in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+
+
 def ensure_requests_dir(tool: str) -> Path:
     d = REQUESTS_DIR / tool
     d.mkdir(parents=True, exist_ok=True)
@@ -99,7 +310,8 @@ def build_payload(tool: str, args: dict) -> dict:
     }
 
 
-def run_server(payload: dict) -> int:
+def run_server(payload: dict) -> tuple[int, dict | None]:
+    """Run one request through the server; echo its output and return the parsed response."""
     payload_json = json.dumps(payload, ensure_ascii=False)
     proc = subprocess.run(
         SERVER,
@@ -107,16 +319,271 @@ def run_server(payload: dict) -> int:
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
-    sys.stdout.write(proc.stdout.decode("utf-8", errors="ignore"))
+    out = proc.stdout.decode("utf-8", errors="ignore")
+    sys.stdout.write(out)
     if proc.returncode != 0:
         sys.stderr.write(proc.stderr.decode("utf-8", errors="ignore"))
-    return proc.returncode
+    return proc.returncode, _last_json_line(out)
+
+
+class RequestTooLarge(ValueError):
+    """The request line exceeds the server's STREAM_LIMIT; it was not sent."""
+
+
+class _LineChannel(ABC):
+    """Line-delimited JSON-RPC: one request per line out, one response per line in."""
+
+    @abstractmethod
+    def _write(self, data: bytes) -> None: ...
+
+    @abstractmethod
+    def _readline(self) -> bytes: ...
+
+    def send(self, payload: dict) -> None:
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        if len(data) > STREAM_LIMIT:
+            # The server would drop the line and answer with an id-less error
+            raise RequestTooLarge(
+                f"request too large: {len(data)} bytes (limit {STREAM_LIMIT})"
+            )
+        self._write(data)
+
+    def recv(self) -> dict:
+        line = self._readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        return json.loads(line)
+
+    def call(self, payload: dict) -> dict:
+        """Send one request and wait for its response.
+
+        An error without an id (unparseable line, oversized request) can only belong
+        to the request in flight, so it is returned as that request's failure.
+        """
+        self.send(payload)
+        req_id = payload.get("id")
+        while True:
+            response = self.recv()
+            if response.get("id") == req_id:
+                return response
+            if response.get("id") is None and "error" in response:
+                return {"id": req_id, "error": response["error"]}
+
+
+class DaemonConnection(_LineChannel):
+    """Line-delimited JSON-RPC over a socket to `mcp_server.py --listen`."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+
+    @classmethod
+    def connect(cls, addr: str = DAEMON_ADDRESS) -> "DaemonConnection | None":
+        """Return a connection, or None when no daemon is listening."""
+        kind, *where = parse_address(addr)
+        try:
+            if kind == "unix":
+                if not hasattr(socket, "AF_UNIX") or not os.path.exists(where[0]):
+                    return None
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+                sock.connect(where[0])
+            else:
+                sock = socket.create_connection(
+                    (where[0], where[1]), timeout=DAEMON_CONNECT_TIMEOUT
+                )
+        except OSError:
+            return None
+        sock.settimeout(None)  # tool calls can take a while
+        return cls(sock)
+
+    def _write(self, data: bytes) -> None:
+        self.sock.sendall(data)
+
+    def _readline(self) -> bytes:
+        return self.rfile.readline()
+
+    def close(self) -> None:
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ServeProcess(_LineChannel):
+    """Fallback for --batch without a daemon: one `--serve` process for all requests."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            SERVER + ["--serve"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+
+    def _write(self, data: bytes) -> None:
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def _readline(self) -> bytes:
+        return self.proc.stdout.readline()
+
+    def close(self) -> None:
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=30)
+        except Exception:
+            self.proc.kill()
+
+
+def call_daemon(conn: DaemonConnection, payload: dict) -> tuple[int, dict | None]:
+    """Send one request to the daemon and echo the response like run_server does."""
+    response = conn.call(payload)
+    print(json.dumps(response, ensure_ascii=False))
+    return (1 if response is None or "error" in response else 0), response
+
+
+def _last_json_line(text: str) -> dict | None:
+    for line in reversed(text.splitlines()):
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+    return None
+
+
+def cached_response(
+    tool: str, payload: dict
+) -> tuple[ResultCache | None, str | None, dict | None]:
+    """Look the request up in the per-bar result cache.
+
+    Returns (None, None, None) when the request's timeframe has no clock-based bar.
+    """
+    args = payload.get("params", {}).get("arguments", {})
+    key = result_cache_key(tool, args)
+    if key is None:
+        return None, None, None
+    cache = ResultCache()
+    hit = cache.get(key, args.get("outfile"))
+    if hit is not None:
+        hit["id"] = payload.get("id")
+        print(f"[cache] hit: {key}", file=sys.stderr)
+    return cache, key, hit
+
+
+def _batch_requests(src: str):
+    """Yield (line_no, tool, args) from a JSONL file ('-' for stdin).
+
+    Blank and # lines are skipped; a malformed line yields (line_no, None, error_response).
+    """
+    f = sys.stdin if src == "-" else open(src, encoding="utf-8")
+    try:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                req = json.loads(line)
+                tool = req.get("tool") or req.get("name")
+                args = req.get("args", req.get("arguments", {}))
+                if not tool or not isinstance(args, dict):
+                    raise ValueError('expected {"tool": ..., "args": {...}}')
+            except Exception as e:
+                yield n, None, {"error": f"line {n}: {e}"}
+                continue
+            yield n, tool, args
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def run_batch(src: str, use_cache: bool = True, use_daemon: bool = True) -> int:
+    """Stream every request in `src` over one connection (daemon, else one --serve process).
+
+    Up to BATCH_WINDOW requests are kept in flight and responses are matched by id,
+    so the server can work on them concurrently. Responses are printed as JSON lines
+    in input order; returns the number of failures.
+    """
+    conn = None
+    failures = 0
+    order: deque[int] = deque()  # input order of everything not printed yet
+    done: dict[int, dict] = {}
+    pending: dict[int, tuple] = {}  # id -> (cache, key) of requests in flight
+
+    def finish(n: int, response: dict) -> None:
+        nonlocal failures
+        cache, key = pending.pop(n, (None, None))
+        result = response.get("result") or {}
+        if "error" in response or result.get("error"):
+            failures += 1
+        elif cache is not None:
+            cache.put(key, response)
+        done[n] = response
+        while order and order[0] in done:
+            print(json.dumps(done.pop(order.popleft()), ensure_ascii=False), flush=True)
+
+    def fail_all(reason: str) -> None:
+        # Drop the connection; everything still in flight failed with it
+        nonlocal conn
+        conn.close()
+        conn = None  # reconnect (or spawn) for the next request
+        for n in list(pending):
+            finish(n, {"id": n, "error": f"transport: {reason}"})
+
+    def receive() -> None:
+        try:
+            response = conn.recv()
+        except (OSError, ValueError) as e:
+            fail_all(str(e))
+            return
+        n = response.get("id")
+        if n is None and "error" in response:
+            # The server answers concurrently, so an id-less error cannot be matched to
+            # a request; treat the connection as broken rather than guess
+            fail_all(f"server error without id: {response['error']}")
+        elif n in pending:
+            finish(n, response)
+
+    try:
+        for n, tool, args in _batch_requests(src):
+            order.append(n)
+            if tool is None:
+                finish(n, args)
+                continue
+            payload = build_payload(tool, args)
+            payload["id"] = n
+            cache = key = hit = None
+            if use_cache and tool in CACHEABLE_TOOLS:
+                cache, key, hit = cached_response(tool, payload)
+            if hit is not None:
+                finish(n, hit)
+                continue
+            while pending and len(pending) >= BATCH_WINDOW:
+                receive()
+            if conn is None:
+                conn = (DaemonConnection.connect() if use_daemon else None) or (
+                    ServeProcess()
+                )
+            pending[n] = (cache, key)
+            try:
+                conn.send(payload)
+            except RequestTooLarge as e:
+                finish(n, {"id": n, "error": str(e)})
+            except (OSError, ValueError) as e:
+                fail_all(str(e))
+        while pending and conn is not None:
+            receive()
+    finally:
+        if conn is not None:
+            conn.close()
+    return failures
 
 
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument(
         "tool",
+        nargs="?",
         help="tool name (e.g., draw_fibo, tune_indicator, macro_quiettrap_report)",
     )
     ap.add_argument("--args", help="JSON string for arguments")
@@ -128,8 +595,30 @@ def main() -> None:
     ap.add_argument(
         "--no-save", action="store_true", help="Do not save request template"
     )
+    ap.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always run the tool (skip the per-bar result cache)",
+    )
+    ap.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Always spawn the server (do not connect to a running --listen daemon)",
+    )
+    ap.add_argument(
+        "--batch",
+        metavar="FILE",
+        help='JSONL of {"tool":...,"args":{...}} requests to stream over one connection'
+        " ('-' for stdin)",
+    )
     ns = ap.parse_args()
 
+    if ns.batch:
+        sys.exit(1 if run_batch(ns.batch, not ns.no_cache, not ns.no_daemon) else 0)
+    if not ns.tool:
+        print("[ERROR] a tool name (or --batch) is required", file=sys.stderr)
+        sys.exit(2)
+
     if not ns.args and not ns.args_file:
         print("[ERROR] either --args or --args-file is required", file=sys.stderr)
         sys.exit(2)
@@ -189,7 +678,26 @@ def main() -> None:
             print(f"[ERROR] overrides JSON parse failed: {e}", file=sys.stderr)
             sys.exit(2)
 
-    rc = run_server(payload)
+    cache = None
+    if ns.tool in CACHEABLE_TOOLS and not ns.no_cache:
+        cache, result_key, hit = cached_response(ns.tool, payload)
+        if hit is not None:
+            print(json.dumps(hit, ensure_ascii=False))
+            sys.exit(0)
+
+    conn = None if ns.no_daemon else DaemonConnection.connect()
+    if conn is not None:
+        try:
+            rc, response = call_daemon(conn, payload)
+        except (OSError, ValueError) as e:
+            print(f"[daemon] {e}; spawning the server", file=sys.stderr)
+            rc, response = run_server(payload)
+        finally:
+            conn.close()
+    else:
+        rc, response = run_server(payload)
+    if cache is not None and rc == 0 and response:
+        cache.put(result_key, response)
     sys.exit(rc)
 
 
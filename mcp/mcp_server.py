@@ -1,4 +1,12 @@
 import os, sys, json, asyncio
+import base64
+import contextlib
+import contextvars
+import hashlib
+import shutil
+import socket
+import threading
+import time
 from dotenv import load_dotenv
 from datetime import datetime
 from pathlib import Path
@@ -10,15 +18,146 @@ automation_path = os.path.abspath("automation")
 sys.path.insert(0, automation_path)
 from tv_controller import (
     capture as tv_capture,
+    shoot_on_page,
+    capture_bytes,
+    save_image,
     apply_preset as tv_apply_preset,
     apply_indicator_params as tv_tune,
     open_chart,
-    set_timeframe,
     close_popups_fast,
     draw_fibo_by_prices,
     draw_fibo_quick,
+    draw_levels,
 )
+from readiness import wait_canvas_settled
+from intervals import IntervalMismatch
 from playwright.async_api import async_playwright
+from browser_runtime import BrowserRuntime
+from browser_profile import launch_browser
+from page_pool import PooledPage
+from tracing import span, trace
+from rpc_transport import DEFAULT_ADDRESS, STREAM_LIMIT, parse_address
+from annotate import overlay_from_annotate, quiet_trap_overlay
+from image_output import ImageOptions, postprocess_async, thumbnail_path
+from session import SESSION
+
+# 引数の正規化は invoke_ucar.py のキャッシュキーと同じ規則を使う
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from invoke_ucar import (
+    CACHEABLE_TOOLS,
+    _canonical_json,
+    _remove_ignored,
+    _round_numbers,
+)
+
+# 常駐モード（--serve）時のみ設定される共有ランタイム
+_RUNTIME: BrowserRuntime | None = None
+
+# バッチ実行中に同時に借りるタブ数の上限（各 item のタスク内でだけ設定される）。
+# item 全体ではなくタブの貸出だけを絞るので、注釈の後処理中に次の item が走り出せる
+_PAGE_GATE: contextvars.ContextVar[asyncio.Semaphore | None] = contextvars.ContextVar(
+    "ucar_page_gate", default=None
+)
+
+
+@contextlib.asynccontextmanager
+async def _browser(headless: bool = True):
+    """常駐モードなら共有ブラウザを、単発モードなら使い捨てのブラウザを渡す。"""
+    if _RUNTIME is not None:
+        yield await _RUNTIME.browser(headless)
+        return
+    async with async_playwright() as p:
+        with span("browser.launch"):
+            b = await launch_browser(p, headless=headless)
+        try:
+            yield b
+        finally:
+            await b.close()
+
+
+@contextlib.asynccontextmanager
+async def _chart_page(symbol: str, tf: str, headless: bool = True, layout=None):
+    """symbol/tf 設定済みのチャートページを借りる（PooledPage を返す）。
+
+    常駐モードではプールから温まったタブを貸し出し（同じペアならナビゲーション無し）、
+    単発モードでは新しい context で open_chart(symbol, tf) する。
+    インジを載せる呼び出しは layout にその構成のキーを渡す（同じ構成のタブだけ使い回す）。
+    ログイン状態はどちらも SESSION から渡す。
+    """
+    gate = _PAGE_GATE.get()
+    async with gate or contextlib.nullcontext():
+        if _RUNTIME is not None:
+            pool = _RUNTIME.pool(headless)
+            async with pool.acquire(symbol, tf, layout) as lease:
+                yield lease
+                # 更新されたクッキーを時々書き戻す（間隔は UCAR_SESSION_SAVE_S）
+                await SESSION.save_from(lease.context)
+            return
+        async with _oneshot_page(symbol, tf, headless) as lease:
+            yield lease
+
+
+async def _new_context(b):
+    with span("new_context"):
+        return await SESSION.new_context(
+            b, resident=_RUNTIME is not None, viewport={"width": 1600, "height": 900}
+        )
+
+
+@contextlib.asynccontextmanager
+async def _oneshot_page(symbol: str, tf: str, headless: bool):
+    async with _browser(headless) as b:
+        ctx = await _new_context(b)
+        try:
+            page = await open_chart(ctx, symbol, tf)
+            yield PooledPage(ctx, page, symbol, tf)
+        finally:
+            await ctx.close()
+
+
+OUTPUT_MODES = ("file", "base64", "both")
+
+
+def _output_mode(args: dict) -> str:
+    """画像の返し方：file（既定）/ base64（ディスクに書かない）/ both。"""
+    mode = str(args.get("output") or "file").lower()
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"output must be one of {', '.join(OUTPUT_MODES)}")
+    return mode
+
+
+async def _emit_image(
+    raw: bytes,
+    outfile: str,
+    mode: str,
+    opts: ImageOptions | None = None,
+    key: str = "file",
+    overlay=None,
+) -> dict:
+    """撮影した bytes を後処理（注釈/形式/縮小/サムネイル）し、mode に応じて
+    1回だけ書き出す／base64 で結果に載せる。"""
+    opts = opts or ImageOptions()
+    data, thumb = await postprocess_async(raw, opts, overlay)
+    out = {}
+    if mode in ("file", "both"):
+        path = opts.with_ext(outfile)
+        out[key] = os.path.abspath(await save_image(data, path))
+        if thumb is not None:
+            tpath = thumbnail_path(path)
+            out["thumbnail"] = os.path.abspath(await save_image(thumb, tpath))
+    if mode in ("base64", "both"):
+        out["image"] = _b64_image(data, opts)
+        if thumb is not None:
+            out["thumbnail_image"] = _b64_image(thumb, opts)
+    return out
+
+
+def _b64_image(data: bytes, opts: ImageOptions) -> dict:
+    return {
+        "mime_type": opts.mime_type,
+        "bytes": len(data),
+        "data": base64.b64encode(data).decode("ascii"),
+    }
 
 
 async def handle_capture_chart(args: dict):
@@ -27,11 +166,20 @@ async def handle_capture_chart(args: dict):
     indicators = args.get("indicators", [])
     outfile = args.get("outfile", f"automation/screenshots/{symbol}_{tf}.png")
     annotate = args.get("annotate")  # ← 追加（任意）
-
-    path = await tv_capture(symbol, tf, indicators, outfile, annotate=annotate)
+    output = _output_mode(args)
+    opts = ImageOptions.from_args(args)
+    overlay = overlay_from_annotate(annotate)
+
+    if _RUNTIME is not None:
+        layout = "indicators:" + ",".join(indicators) if indicators else None
+        async with _chart_page(symbol, tf, layout=layout) as lease:
+            raw = await shoot_on_page(lease.page, indicators, opts, bool(overlay))
+    else:
+        raw = await tv_capture(symbol, tf, indicators, None, opts=opts.raw(overlay))
+    # タブ（ブラウザ）を返却してから注釈/エンコード（次の呼び出しがすぐタブを使える）
     return {
         "ok": True,
-        "file": os.path.abspath(path),
+        **await _emit_image(raw, outfile, output, opts, overlay=overlay),
         "meta": {"symbol": symbol, "tf": tf, "ts": datetime.utcnow().isoformat() + "Z"},
         "annotated": bool(annotate),
     }
@@ -46,44 +194,25 @@ async def handle_tv_action(args: dict):
         tf = args.get("tf", "1h")
         clear = bool(args.get("clear_existing", False))
         headless = bool(args.get("headless", True))
-        storage = os.getenv("TV_STORAGE", "automation/storage_state.json")
-
-        async with async_playwright() as p:
-            b = await p.chromium.launch(headless=headless)
-            ctx = await b.new_context(
-                storage_state=storage if os.path.exists(storage) else None,
-                viewport={"width": 1600, "height": 900},
-            )
-            # チャートを開いて時間足セット
-            from tv_controller import CHART_URL
-
-            page = await ctx.new_page()
-            await page.goto(CHART_URL)
-            # 簡易に時間足だけ設定（必要なら既存のset_timeframeをimport）
-            try:
-                from tv_controller import set_timeframe
+        output = _output_mode(args)
+        opts = ImageOptions.from_args(args)
 
-                await set_timeframe(page, tf)
-            except Exception:
-                pass
-            # シンボル切替（既存open_chartを使うなら置換可）
+        async with _browser(headless) as b:
+            ctx = await _new_context(b)
             try:
-                await page.keyboard.press("/")
-                from tv_controller import SEARCH_INPUT
-
-                await page.wait_for_selector(SEARCH_INPUT, timeout=3000)
-                await page.fill(SEARCH_INPUT, symbol)
-                await page.keyboard.press("Enter")
-                await page.wait_for_timeout(1200)
-            except Exception:
-                pass
-
-            res = await tv_apply_preset(page, name, clear_existing=clear)
-            # スクショも返すと便利
-            outfile = f"automation/screenshots/{symbol}_{tf}_{name}.png"
-            await page.screenshot(path=outfile)
-            await b.close()
-            res.update({"screenshot": os.path.abspath(outfile)})
+                # symbol / tf を載せた URL で直接開く（ヘッダのシンボルで確認）
+                page = await open_chart(ctx, symbol, tf)
+
+                res = await tv_apply_preset(page, name, clear_existing=clear)
+                # スクショも返すと便利
+                outfile = f"automation/screenshots/{symbol}_{tf}_{name}.png"
+                with span("page.screenshot"):
+                    png = await capture_bytes(page, opts)
+            finally:
+                await ctx.close()
+            res.update(
+                await _emit_image(png, outfile, output, opts, key="screenshot")
+            )
             return {"ok": True, **res}
 
     # 既存の他アクション
@@ -101,21 +230,12 @@ async def handle_draw_fibo(args: dict):
     tf = args.get("tf", "1h")
     headless = bool(args.get("headless", True))
     outfile = args.get("outfile", "automation/screenshots/fibo.png")
+    output = _output_mode(args)
+    opts = ImageOptions.from_args(args)
 
-    async with async_playwright() as p:
-        b = await p.chromium.launch(headless=headless)
-        ctx = await b.new_context(
-            storage_state=(
-                os.getenv("TV_STORAGE", "automation/storage_state.json")
-                if os.path.exists(
-                    os.getenv("TV_STORAGE", "automation/storage_state.json")
-                )
-                else None
-            ),
-            viewport={"width": 1600, "height": 900},
-        )
-        page = await open_chart(ctx, symbol)
-        await set_timeframe(page, tf)
+    async with _chart_page(symbol, tf, headless) as lease:
+        page = lease.page
+        lease.dirty = True  # フィボを描くので返却時に掃除する
 
         if mode == "prices":
             high = float(args["high"])
@@ -133,40 +253,67 @@ async def handle_draw_fibo(args: dict):
                 page, direction=args.get("direction", "high_to_low")
             )
 
-        await page.screenshot(path=outfile)
-        await b.close()
-        res.update(
-            {
-                "screenshot": os.path.abspath(outfile),
-                "symbol": symbol,
-                "tf": tf,
-                "mode": mode,
-            }
-        )
-        return {"ok": True, **res}
+        with span("page.screenshot"):
+            png = await capture_bytes(page, opts)
+    res.update(
+        {
+            **await _emit_image(png, outfile, output, opts, key="screenshot"),
+            "symbol": symbol,
+            "tf": tf,
+            "mode": mode,
+        }
+    )
+    return {"ok": True, **res}
+
+
+async def handle_draw_levels(args: dict):
+    """複数描画（fib/hline/rect）を1回でまとめて描くハンドラ"""
+    symbol = args.get("symbol", "USDJPY")
+    tf = args.get("tf", "1h")
+    headless = bool(args.get("headless", True))
+    outfile = args.get("outfile", "automation/screenshots/levels.png")
+    output = _output_mode(args)
+    opts = ImageOptions.from_args(args)
+    drawings = args.get("drawings") or []
+    if not isinstance(drawings, list) or not drawings:
+        raise ValueError("drawings must be a non-empty list")
+
+    async with _chart_page(symbol, tf, headless) as lease:
+        page = lease.page
+        lease.dirty = True  # 描画を残すので返却時に掃除する
+        res = await draw_levels(page, drawings)
+        with span("page.screenshot"):
+            png = await capture_bytes(page, opts)
+    res.update(await _emit_image(png, outfile, output, opts, key="screenshot"))
+    res.update({"symbol": symbol, "tf": tf})
+    return {"ok": True, **res}
 
 
 async def handle_tune_indicator(args: dict):
     name = args["name"]
     params = args["params"]
     headless = bool(args.get("headless", True))
-    storage = os.getenv("TV_STORAGE", "automation/storage_state.json")
+    output = _output_mode(args)
+    opts = ImageOptions.from_args(args)
 
-    async with async_playwright() as p:
-        b = await p.chromium.launch(headless=headless)
-        ctx = await b.new_context(
-            storage_state=storage if os.path.exists(storage) else None,
-            viewport={"width": 1600, "height": 900},
-        )
-        page = await ctx.new_page()
-        from tv_controller import CHART_URL
+    async with _browser(headless) as b:
+        ctx = await _new_context(b)
+        try:
+            page = await ctx.new_page()
+            from tv_controller import CHART_URL
 
-        await page.goto(CHART_URL)
-        res = await tv_tune(page, name, params)
-        shot = "automation/screenshots/tune_indicator.png"
-        await page.screenshot(path=shot)
-        await b.close()
-        return {"ok": True, "result": res, "screenshot": os.path.abspath(shot)}
+            await page.goto(CHART_URL)
+            res = await tv_tune(page, name, params)
+            shot = "automation/screenshots/tune_indicator.png"
+            with span("page.screenshot"):
+                png = await capture_bytes(page, opts)
+        finally:
+            await ctx.close()
+        return {
+            "ok": True,
+            "result": res,
+            **await _emit_image(png, shot, output, opts, key="screenshot"),
+        }
 
 
 async def handle_macro_quiettrap_report(args: dict):
@@ -182,6 +329,8 @@ async def handle_macro_quiettrap_report(args: dict):
     outfile = args.get("outfile", f"automation/screenshots/{symbol}_{tf}_macro_qt.png")
     headless = bool(args.get("headless", True))
     clean = bool(args.get("clean", True))
+    output = _output_mode(args)
+    opts = ImageOptions.from_args(args)
 
     preset_name = args.get("preset_name", "senior_ma_cloud")
     clear_existing = bool(args.get("clear_existing", True))
@@ -198,22 +347,20 @@ async def handle_macro_quiettrap_report(args: dict):
     quiettrap = args.get("quiettrap") or {"side": "sell", "score": 0.8, "notes": []}
 
     # 実行
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=headless)
-        ctx = await browser.new_context(
-            storage_state=os.getenv("TV_STORAGE", "automation/storage_state.json"),
-            viewport={"width": 1600, "height": 900},
-        )
-
-        # 既存の安定した実装を使用（部分最適化のみ）
-        page = await open_chart(ctx, symbol)
-        await set_timeframe(page, tf)
+    # 既存の安定した実装を使用（部分最適化のみ）。常駐モードでは温まったタブを再利用
+    # プリセットで載せるインジ構成（同じ構成のタブなら再適用は差分なしで終わる）
+    layout = f"preset:{preset_name}:{int(clear_existing)}:{int(skip_params)}"
+    async with _chart_page(symbol, tf, headless, layout) as lease:
+        page = lease.page
 
         # 1) プリセット適用（高速化オプション対応）
         if skip_params:
             print("🚀 高速モード: インジケーターパラメータ調整をスキップします...")
         preset_res = await tv_apply_preset(
-            page, preset_name, clear_existing=clear_existing, skip_params=skip_params
+            page,
+            preset_name,
+            clear_existing=clear_existing,
+            skip_params=skip_params,
         )
 
         # 2) ポップアップ完全消去 & チャート安定化（フィボ描画前に実行）
@@ -226,16 +373,16 @@ async def handle_macro_quiettrap_report(args: dict):
 
             # チャート完全安定化
             print("⏳ チャート完全安定化を待機...")
-            await page.wait_for_timeout(1500)  # 少し長めに戻す
+            await wait_canvas_settled(page, fallback_ms=1500)
 
             # キャンバスにフォーカスを確実に当てる
             print("🎯 チャートキャンバスにフォーカス...")
             await page.click("canvas", force=True)
-            await page.wait_for_timeout(500)
 
         # 3) フィボ描画（チャート安定化後に実行）
         fibo_res = None
         if draw_fibo_flag:
+            lease.dirty = True  # 返却時に描画を掃除してから再利用
             print("📈 フィボナッチ描画開始（チャート安定化済み）...")
             if fibo_mode == "prices" and high is not None and low is not None:
                 fibo_res = await draw_fibo_by_prices(
@@ -251,7 +398,7 @@ async def handle_macro_quiettrap_report(args: dict):
 
             # フィボ描画後の追加安定化
             print("⏳ フィボ描画後の最終安定化...")
-            await page.wait_for_timeout(1000)
+            await wait_canvas_settled(page, fallback_ms=1000)
 
             # 4) フィボ保持スクショ撮影 & QuietTrap注釈
         print("📸 フィボナッチ保持状態でスクリーンショット撮影...")
@@ -260,43 +407,31 @@ async def handle_macro_quiettrap_report(args: dict):
         print("⚠️ フィボナッチ保持のため最終ポップアップチェックはスキップ...")
 
         # 短い安定化待機のみ
-        await page.wait_for_timeout(500)
+        await wait_canvas_settled(page, timeout_ms=1000, fallback_ms=500)
 
-        os.makedirs(os.path.dirname(outfile), exist_ok=True)
-        await page.screenshot(path=outfile)
+        # ファイルは介さず bytes で受け取り、注釈後に1回だけ書く
+        with span("page.screenshot"):
+            png = await capture_bytes(page, opts, annotated=True)
 
         # スクリーンショット撮影後にツール選択解除（フィボは既に画像に保存済み）
         print("🔄 スクリーンショット撮影後にツール選択解除...")
         try:
             await page.keyboard.press("Escape")
-            await page.wait_for_timeout(300)
         except Exception:
             pass
-        # 画像後処理で注釈を焼き込む（既存の annotate.py を利用）
-        try:
-            from annotate import annotate_quiet_trap
-        except Exception:
-            # 明示import（PYTHONPATH差分対策）
-            import importlib.util
-
-            ap = Path(__file__).resolve().parent.parent / "automation" / "annotate.py"
-            spec = importlib.util.spec_from_file_location("annotate", ap)
-            mod = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(mod)
-            annotate_quiet_trap = getattr(mod, "annotate_quiet_trap")
-        annotate_quiet_trap(
-            outfile,
-            side=quiettrap.get("side", "sell"),
-            score=float(quiettrap.get("score", 0.8)),
-            notes=quiettrap.get("notes", []),
-            footer=quiettrap.get("footer"),
-        )
 
-        await browser.close()
+    # 画像後処理で注釈を焼き込む（既存の annotate.py を利用）。タブは返却済みなので、
+    # バッチでは PNG のデコード/エンコードが次のチャートのナビゲーションと並行する
+    overlay = quiet_trap_overlay(
+        side=quiettrap.get("side", "sell"),
+        score=float(quiettrap.get("score", 0.8)),
+        notes=quiettrap.get("notes", []),
+        footer=quiettrap.get("footer"),
+    )
 
     return {
         "ok": True,
-        "file": os.path.abspath(outfile),
+        **await _emit_image(png, outfile, output, opts, overlay=overlay),
         "meta": {
             "symbol": symbol,
             "tf": tf,
@@ -307,18 +442,164 @@ async def handle_macro_quiettrap_report(args: dict):
     }
 
 
-async def main():
-    # stdinから全体を読み込んでJSONとして解析
-    input_data = sys.stdin.read().strip()
-    if not input_data:
-        print(json.dumps({"error": "No input data"}))
-        return
+@contextlib.asynccontextmanager
+async def _runtime_scope(pool_size: int, headless: bool = True):
+    """バッチ実行中だけ共有ランタイムを用意する（常駐モードなら既存を流用）。"""
+    global _RUNTIME
+    owned = _RUNTIME is None
+    if owned:
+        _RUNTIME = await BrowserRuntime().start()
+    try:
+        # 常駐プールの上限はバッチの間だけ広げる（終わったら戻して余ったタブを閉じる）
+        async with _RUNTIME.pool(headless).widen(pool_size):
+            yield _RUNTIME
+    finally:
+        if owned:
+            await _RUNTIME.close()
+            _RUNTIME = None
+
+
+async def handle_batch_macro_quiettrap_report(args: dict):
+    """
+    複数ペアの macro_quiettrap_report を1つのブラウザで並列実行する。
+      items: 各ペアの引数（macro_quiettrap_report と同じ形）
+      defaults: 全 items に共通の引数（items 側が優先）
+      concurrency: 同時に使う context（タブ）数
+    1件の失敗でバッチ全体は止めず、各 item の結果/所要時間/エラーを返す。
+    """
+    items = args.get("items") or []
+    defaults = args.get("defaults") or {}
+    concurrency = max(
+        1, int(args.get("concurrency", os.getenv("UCAR_BATCH_CONCURRENCY", "4")))
+    )
+    headless = bool(args.get("headless", True))
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run_one(i: int, item):
+        # gather が item ごとにタスクを作るので、この set は当該 item の中だけで効く
+        _PAGE_GATE.set(sem)
+        t0 = time.perf_counter()
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("item must be a JSON object")
+            item_args = {**defaults, **item, "headless": headless}
+            with span("item", index=i, symbol=item_args.get("symbol")):
+                res = await handle_macro_quiettrap_report(item_args)
+            out = {"index": i, "ok": True, "result": res}
+        except IntervalMismatch as e:
+            out = {"index": i, "ok": False, **e.to_dict()}
+        except Exception as e:
+            out = {"index": i, "ok": False, "error": f"{type(e).__name__}: {e}"}
+        out["elapsed_ms"] = int((time.perf_counter() - t0) * 1000)
+        if isinstance(item, dict):
+            out["symbol"] = item.get("symbol", defaults.get("symbol"))
+            out["tf"] = item.get("tf", defaults.get("tf"))
+        return out
+
+    t0 = time.perf_counter()
+    async with _runtime_scope(min(concurrency, max(1, len(items))), headless):
+        results = await asyncio.gather(
+            *(run_one(i, it) for i, it in enumerate(items))
+        )
+    failed = sum(1 for r in results if not r["ok"])
+    return {
+        "ok": failed == 0,
+        "count": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "concurrency": concurrency,
+        "elapsed_ms": int((time.perf_counter() - t0) * 1000),
+        "items": results,
+    }
+
+
+# ---- 同一リクエストの相乗り（single-flight）----
+# 正規化した引数が同じ描画系ツールの呼び出しが実行中なら、新たに実行せずその結果を共有する
+_INFLIGHT: dict[str, tuple[asyncio.Task, dict]] = {}  # key -> (実行タスク, その引数)
+
+HANDLERS = {
+    "capture_chart": handle_capture_chart,
+    "tv_action": handle_tv_action,
+    "tune_indicator": handle_tune_indicator,
+    "draw_fibo": handle_draw_fibo,
+    "draw_levels": handle_draw_levels,
+    "macro_quiettrap_report": handle_macro_quiettrap_report,
+    "batch_macro_quiettrap_report": handle_batch_macro_quiettrap_report,
+}
+
+
+def flight_key(name: str, args: dict) -> str:
+    """outfile/headless など結果に影響しないキーを除いた引数のハッシュ。"""
+    norm = _canonical_json(_remove_ignored(_round_numbers(args)))
+    return f"{name}:{hashlib.sha1(norm.encode('utf-8')).hexdigest()}"
+
+
+async def _call_tool(name: str, args: dict):
+    with trace(name or "unknown") as root:
+        handler = HANDLERS.get(name)
+        if handler is None:
+            res = {"error": f"unknown tool: {name}"}
+        else:
+            try:
+                res = await handler(args)
+            except IntervalMismatch as e:
+                # 違う時間足のスクショは返さず、呼び出し側が判別できる形で失敗させる
+                res = {"ok": False, **e.to_dict()}
+    if isinstance(res, dict):
+        res["timings"] = root.to_dict()
+    return res
+
+
+async def _single_flight(name: str, args: dict):
+    """同じキーの実行中タスクがあれば相乗りし、無ければ起動する。
+    実行はタスクとして切り離すので、待っている側が切断/キャンセルされても他は影響を受けない。"""
+    key = flight_key(name, args)
+    if key not in _INFLIGHT:
+        task = asyncio.ensure_future(_call_tool(name, args))
+        _INFLIGHT[key] = (task, args)
+        task.add_done_callback(lambda t: _INFLIGHT.pop(key, None))
+        return await asyncio.shield(task)
+    task, leader_args = _INFLIGHT[key]
+    res = await asyncio.shield(task)
+    if not isinstance(res, dict):
+        return res
+    return await _share_result(res, leader_args, args)
+
+
+async def _share_result(res: dict, leader_args: dict, args: dict) -> dict:
+    """相乗りした呼び出しへの結果。outfile が違えば出力ファイルをコピーする。"""
+    res = dict(res, coalesced=True)
+    outfile = args.get("outfile")
+    main_key = next((k for k in ("file", "screenshot") if k in res), None)
+    if not outfile or outfile == leader_args.get("outfile") or main_key is None:
+        return res
+    src = res[main_key]
+    dest = os.path.splitext(outfile)[0] + os.path.splitext(src)[1]
+    copies = {main_key: (src, dest)}
+    if "thumbnail" in res:
+        copies["thumbnail"] = (res["thumbnail"], thumbnail_path(dest))
+
+    def copy_all():
+        for k, (a, b) in copies.items():
+            os.makedirs(os.path.dirname(os.path.abspath(b)), exist_ok=True)
+            shutil.copyfile(a, b)
+            res[k] = os.path.abspath(b)
 
     try:
-        req = json.loads(input_data)
+        await asyncio.to_thread(copy_all)
+    except OSError as e:
+        res["error"] = f"coalesced result copy failed: {e}"
+    return res
+
+
+async def dispatch(req: dict) -> dict:
+    """JSON-RPCリクエスト1件を処理してレスポンス(dict)を返す。
+    パイプラインでは応答が順不同なので、失敗時も必ず id を付けて返す。"""
+    req_id = req.get("id") if isinstance(req, dict) else None
+    try:
         method = req.get("method")
         params = req.get("params", {})
-        req_id = req.get("id")
 
         if method == "tools/list":
             # Return the list of available tools from manifest
@@ -329,26 +610,243 @@ async def main():
             name = params.get("name")
             args = params.get("arguments", {}) or {}
 
-            if name == "capture_chart":
-                res = await handle_capture_chart(args)
-            elif name == "tv_action":
-                res = await handle_tv_action(args)
-            elif name == "tune_indicator":
-                res = await handle_tune_indicator(args)
-            elif name == "draw_fibo":
-                res = await handle_draw_fibo(args)
-            elif name == "macro_quiettrap_report":
-                res = await handle_macro_quiettrap_report(args)
+            if name in CACHEABLE_TOOLS:
+                res = await _single_flight(name, args)
             else:
-                res = {"error": f"unknown tool: {name}"}
+                res = await _call_tool(name, args)
         else:
             res = {"error": f"unknown method: {method}"}
 
-        print(json.dumps({"id": req_id, "result": res}), flush=True)
+        return {"id": req_id, "result": res}
 
+    except Exception as e:
+        return {"id": req_id, "error": f"{type(e).__name__}: {e}"}
+
+
+def _rpc_error(code: int, message: str) -> dict:
+    """どの要求か特定できない行への JSON-RPC 形式のエラー（id は null）。"""
+    return {"id": None, "error": {"code": code, "message": message}}
+
+
+# ---- 行区切り JSON-RPC のトランスポート ----
+# 同時に実行する tools/call の上限（tools/list などはこの枠を使わない）
+MAX_INFLIGHT = int(os.getenv("UCAR_MAX_INFLIGHT", "4"))
+
+
+async def _pipeline(reader: asyncio.StreamReader, send, gate: asyncio.Semaphore):
+    """行を読むたびに dispatch をタスクとして起動し、終わった順に send(resp) する。
+    レスポンスは id で対応づける前提なので順不同。EOF 後は実行中のものを待って返る。"""
+    tasks: set[asyncio.Task] = set()
+
+    async def handle(req: dict):
+        if req.get("method") == "tools/call":
+            async with gate:
+                resp = await dispatch(req)
+        else:
+            resp = await dispatch(req)
+        await send(resp)
+
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError:  # STREAM_LIMIT 超え（その行は読み捨てられる）
+            await send(_rpc_error(-32600, "request too large"))
+            continue
+        except ConnectionError:
+            break
+        if not line:
+            break  # EOF
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+        except Exception as e:
+            await send(_rpc_error(-32700, f"invalid json: {e}"))
+            continue
+        if not isinstance(req, dict):
+            await send(_rpc_error(-32600, "request must be a JSON object"))
+            continue
+        t = asyncio.create_task(handle(req))
+        tasks.add(t)
+        t.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _line_sender(write, lock: asyncio.Lock | None = None):
+    """resp(dict) を1行にして write(bytes) する send()。書き込みは lock で1行ずつ。"""
+    lock = lock or asyncio.Lock()
+
+    async def send(resp: dict):
+        data = (json.dumps(resp) + "\n").encode("utf-8")
+        async with lock:
+            await write(data)
+
+    return send
+
+
+async def _stdin_reader() -> asyncio.StreamReader:
+    """stdin を StreamReader として開く。パイプなら connect_read_pipe、
+    Windows や通常ファイルのリダイレクトなど使えない場合はスレッドで読んで流し込む。"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=STREAM_LIMIT)
+    if os.name != "nt":
+        try:
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+            )
+            return reader
+        except (ValueError, OSError, NotImplementedError):
+            pass
+
+    def pump():
+        try:
+            for chunk in iter(sys.stdin.buffer.readline, b""):
+                loop.call_soon_threadsafe(reader.feed_data, chunk)
+            loop.call_soon_threadsafe(reader.feed_eof)
+        except RuntimeError:
+            pass  # ループが先に閉じた
+
+    threading.Thread(target=pump, name="stdin", daemon=True).start()
+    return reader
+
+
+@contextlib.asynccontextmanager
+async def _resident():
+    """常駐ランタイムを起動し、終了時に閉じる。"""
+    global _RUNTIME
+    _RUNTIME = await BrowserRuntime().start()
+    try:
+        # ハンドラ内の print() がレスポンス行に混ざらないよう stderr へ逃がす
+        with contextlib.redirect_stdout(sys.stderr):
+            yield _RUNTIME
+    finally:
+        await _RUNTIME.close()
+        _RUNTIME = None
+
+
+async def serve():
+    """常駐モード：改行区切りのJSON-RPCを読み続け、ブラウザを使い回す。
+    複数の要求を同時に受け付け（tools/call は UCAR_MAX_INFLIGHT 件まで並行）、
+    終わった順に1行ずつ返す。"""
+    out = sys.stdout.buffer
+
+    def write_blocking(data: bytes):
+        out.write(data)
+        out.flush()
+
+    async def write(data: bytes):
+        # stdout は stderr と同じパイプのこともあるので非ブロッキングにはせずスレッドで書く
+        await asyncio.to_thread(write_blocking, data)
+
+    async with _resident():
+        reader = await _stdin_reader()
+        await _pipeline(reader, _line_sender(write), asyncio.Semaphore(MAX_INFLIGHT))
+
+
+# ---- デーモンモード（--listen）----
+# 待ち受け先の既定値と parse_address は invoke_ucar.py と共有（automation/rpc_transport.py）
+
+
+def _connection_handler(gate: asyncio.Semaphore):
+    """1接続ぶん：stdin と同じく要求を並行に処理し、同じ接続へ1行ずつ返す。
+    同時実行数の枠（gate）は全接続で共有する。"""
+
+    async def handle(reader, writer):
+        async def write(data: bytes):
+            writer.write(data)
+            await writer.drain()
+
+        try:
+            await _pipeline(reader, _line_sender(write), gate)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    return handle
+
+
+def _claim_socket_path(path: str):
+    """古いソケットファイルは消す。別のデーモンが応答するならエラー。"""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except OSError:
+        os.unlink(path)  # 前回の残骸
+    else:
+        raise SystemExit(f"another server is already listening on {path}")
+    finally:
+        s.close()
+
+
+async def listen(addr: str):
+    """デーモンモード：ソケットで接続を待ち、各接続の要求を常駐ランタイムで処理する。
+    invoke_ucar.py はここに繋がればサーバを起動せずに済む。"""
+    kind, *where = parse_address(addr)
+    async with _resident():
+        handler = _connection_handler(asyncio.Semaphore(MAX_INFLIGHT))
+        if kind == "unix":
+            _claim_socket_path(where[0])
+            server = await asyncio.start_unix_server(
+                handler, where[0], limit=STREAM_LIMIT
+            )
+        else:
+            server = await asyncio.start_server(
+                handler, where[0], where[1], limit=STREAM_LIMIT
+            )
+        print(f"[serve] listening on {addr}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if kind == "unix":
+                with contextlib.suppress(OSError):
+                    os.unlink(where[0])
+
+
+def _listen_address() -> str | None:
+    argv = sys.argv[1:]
+    if "--listen" in argv:
+        i = argv.index("--listen")
+        if i + 1 < len(argv) and not argv[i + 1].startswith("--"):
+            return argv[i + 1]
+        return os.getenv("UCAR_SOCKET") or DEFAULT_ADDRESS
+    return None
+
+
+async def main():
+    addr = _listen_address()
+    if addr:
+        await listen(addr)
+        return
+    if "--serve" in sys.argv[1:] or os.getenv("UCAR_SERVE") == "1":
+        await serve()
+        return
+
+    # stdinから全体を読み込んでJSONとして解析（整形済みの複数行JSONも可）
+    reader = await _stdin_reader()
+    input_data = (await reader.read()).decode("utf-8", errors="replace").strip()
+    if not input_data:
+        print(json.dumps({"error": "No input data"}))
+        return
+
+    try:
+        req = json.loads(input_data)
     except Exception as e:
         print(json.dumps({"error": str(e)}), flush=True)
+        return
+    print(json.dumps(await dispatch(req)), flush=True)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass